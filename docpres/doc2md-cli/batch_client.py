@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+智谱AI批处理（Batch API）客户端
+上传JSONL请求文件、创建批任务、轮询状态、下载结果文件；每一步都是短请求，
+成千上万页的请求只占用磁盘文件，不占用长连接
+"""
+
+import os
+import time
+from typing import Dict, Optional
+
+import requests
+
+DEFAULT_BATCH_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+# 批任务文件中每行请求的目标接口
+BATCH_ENDPOINT = "/v4/chat/completions"
+DEFAULT_POLL_INTERVAL = 30.0
+# 单个批任务文件的请求数上限，超出时拆成多个批任务
+DEFAULT_MAX_REQUESTS = 50000
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchError(RuntimeError):
+    """批任务未能完成（失败、过期或被取消）"""
+
+
+class BatchClient:
+    """批处理接口客户端：submit上传并创建批任务，wait轮询到结束，download_output下载结果"""
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BATCH_BASE_URL,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, max_requests: int = DEFAULT_MAX_REQUESTS,
+                 timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def upload(self, path: str) -> str:
+        """上传JSONL请求文件，返回文件ID"""
+        with open(path, "rb") as f:
+            response = self._request("POST", "/files", data={"purpose": "batch"},
+                                     files={"file": (os.path.basename(path), f, "application/jsonl")})
+        return response.json()["id"]
+
+    def submit(self, input_path: str) -> str:
+        """上传请求文件并创建批任务，返回批任务ID"""
+        file_id = self.upload(input_path)
+        response = self._request("POST", "/batches", json={
+            "input_file_id": file_id,
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": "24h",
+        })
+        return response.json()["id"]
+
+    def retrieve(self, batch_id: str) -> Dict:
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def wait(self, batch_id: str) -> Dict:
+        """轮询直到批任务结束，未成功完成时抛出BatchError"""
+        while True:
+            batch = self.retrieve(batch_id)
+            status = batch.get("status")
+            if status in TERMINAL_STATUSES:
+                break
+            counts = batch.get("request_counts") or {}
+            print(f"  批任务 {batch_id}: {status}（{counts.get('completed', 0)}/{counts.get('total', '?')}）")
+            time.sleep(self.poll_interval)
+        if status != "completed":
+            raise BatchError(f"批任务 {batch_id} 状态为 {status}")
+        return batch
+
+    def download(self, file_id: str, dest_path: str) -> None:
+        """流式下载文件到本地，不把整个结果读入内存"""
+        with self.session.get(f"{self.base_url}/files/{file_id}/content", timeout=self.timeout,
+                              stream=True) as response:
+            response.raise_for_status()
+            with open(dest_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+
+    def download_output(self, batch: Dict, dest_path: str) -> Optional[str]:
+        """下载已完成批任务的结果文件；有错误文件时一并下载到 dest_path + '.errors'"""
+        if batch.get("error_file_id"):
+            self.download(batch["error_file_id"], dest_path + ".errors")
+        if not batch.get("output_file_id"):
+            return None
+        self.download(batch["output_file_id"], dest_path)
+        return dest_path
+
+    def close(self) -> None:
+        self.session.close()
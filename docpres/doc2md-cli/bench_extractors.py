@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+标题提取器性能与准确率基准
+rules: 在合成的大文档上测量规则分类器的逐行吞吐量与大纲内存
+corpus: 在example语料（及其放大版本）上比较三个提取器的速度、内存、LLM开销，
+        并以*-top.md为标准大纲计算各级别的准确率与召回率
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import md2top
+from llm_client import estimate_tokens
+from outline import Outline
+from simple_extractor import SimpleMarkdownExtractor
+from universal_extractor import UniversalExtractor
+
+EXAMPLE_DIR = Path(__file__).parent / "example"
+
+CHINESE_NUMERALS = "一二三四五六七八九十"
+
+BODY_SENTENCES = [
+    "数字化转型的核心驱动力在于对新兴技术的前瞻性应用与深度融合，系统推进技术集成、融合和创新。",
+    "通过聚合内外部、多结构化的数据资源，构建统一、健壮的数据基础平台，打破信息孤岛。",
+    "在数字经济时代，建设新型能力是应对未来不确定性变化的关键举措和企业实现转型升级的核心驱动力。",
+    "坚持先打通再完善、先固化再优化，深化数字管理赋能，构建覆盖全面的数字化管控体系。",
+]
+
+HEADING_TEXTS = [
+    "数字化转型的定义与参考",
+    "集团管控数字化工作进展",
+    "规划先行，制定集团数字化转型规划和顶层设计",
+    "研发自主知识产权低代码开发平台",
+    "全流程工作质效管理平台",
+    "问题与建议",
+]
+
+
+def make_synthetic_document(n_lines: int, seed: int = 0) -> str:
+    """生成包含各类标题格式与正文的合成文档"""
+    rng = random.Random(seed)
+    lines: List[str] = []
+    while len(lines) < n_lines:
+        text = rng.choice(HEADING_TEXTS)
+        kind = rng.randrange(7)
+        if kind == 0:
+            lines.append(f"{'#' * rng.randint(1, 4)} {text}")
+        elif kind == 1:
+            lines.append(f"{rng.choice(CHINESE_NUMERALS)}、{text}")
+        elif kind == 2:
+            lines.append(f"（{rng.choice(CHINESE_NUMERALS)}）{text}")
+        elif kind == 3:
+            lines.append(f"{rng.randint(1, 9)}.{text}")
+        elif kind == 4:
+            lines.append(f"({rng.randint(1, 9)}) {text}")
+        elif kind == 5:
+            lines.append(text)
+        else:
+            lines.append("")
+        for _ in range(rng.randint(1, 3)):
+            lines.append(rng.choice(BODY_SENTENCES))
+    return "\n".join(lines[:n_lines])
+
+
+def _report(name: str, n_lines: int, elapsed: float) -> None:
+    print(f"{name:<40} {elapsed:8.3f}s  {n_lines / elapsed:>12,.0f} 行/秒")
+
+
+def benchmark_classifiers(n_lines: int, seed: int = 0) -> None:
+    """分别测量两个提取器的规则分类速度"""
+    content = make_synthetic_document(n_lines, seed)
+    lines = content.split('\n')
+    print(f"合成文档: {len(lines):,} 行, {len(content):,} 字符")
+
+    universal = UniversalExtractor()
+    start = time.perf_counter()
+    headings = universal.extract_with_rules(content)
+    _report("UniversalExtractor.extract_with_rules", len(lines), time.perf_counter() - start)
+    print(f"  去重后标题数: {len(headings)}")
+
+    simple = SimpleMarkdownExtractor()
+    start = time.perf_counter()
+    detected = sum(1 for line in lines if simple._detect_heading(line))
+    _report("SimpleMarkdownExtractor._detect_heading", len(lines), time.perf_counter() - start)
+    print(f"  命中标题行数: {detected:,}")
+
+
+def benchmark_outline_memory(n_headings: int, seed: int = 0) -> None:
+    """比较字典列表与Outline保存同一批标题的内存占用，标题字符串计入各自的总量
+
+    两种结构都在计量区间内逐个生成标题文本（带序号，模拟真实文档中互不相同的标题）。
+    """
+    rng = random.Random(seed)
+    choices = [rng.choice(HEADING_TEXTS) for _ in range(n_headings)]
+    levels = [rng.randint(1, 4) for _ in range(n_headings)]
+
+    tracemalloc.start()
+    headings = [{'text': f"{text} {i}", 'level': level, 'offset': i}
+                for i, (text, level) in enumerate(zip(choices, levels))]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del headings
+
+    tracemalloc.start()
+    outline = Outline((f"{text} {i}", level, i) for i, (text, level) in enumerate(zip(choices, levels)))
+    outline_bytes, outline_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{n_headings:,} 个标题（含标题文本）: 字典列表 {dict_bytes / 2**20:.1f} MiB, "
+          f"Outline {outline_bytes / 2**20:.1f} MiB ({dict_bytes / outline_bytes:.1f}x)，"
+          f"构建时峰值 {outline_peak / 2**20:.1f} MiB")
+    del outline
+
+
+class LLMMeter:
+    """统计一次运行中的模型调用次数和估算token数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+
+    def record(self, prompt: str, response) -> None:
+        self.calls += 1
+        self.tokens += estimate_tokens(prompt) + estimate_tokens(json.dumps(response, ensure_ascii=False))
+
+
+class RecordedResponses:
+    """离线模式下的录制响应：<stem>-structured.json即md2top对该文档的langextract输出"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._cache: Dict[str, Optional[Dict]] = {}
+
+    def structured(self, stem: str) -> Optional[Dict]:
+        if stem not in self._cache:
+            path = self.directory / f"{stem}-structured.json"
+            self._cache[stem] = json.loads(path.read_text(encoding='utf-8')) if path.exists() else None
+        return self._cache[stem]
+
+    def headings_in(self, stem: str, text: str) -> List[Dict]:
+        """回放UniversalExtractor的langextract调用：返回录制标题中出现在text里的部分"""
+        data = self.structured(stem) or {}
+        return [
+            {'text': h['text'], 'level': int(h.get('attributes', {}).get('level', '1'))}
+            for h in data.get('headings', [])
+            if h['text'] in text
+        ]
+
+
+def run_simple(path: Path, stem: str, meter: LLMMeter, recordings: Optional[RecordedResponses]) -> List[Dict]:
+    content = path.read_text(encoding='utf-8')
+    return SimpleMarkdownExtractor().extract_headings(content)
+
+
+def run_universal_rules(path: Path, stem: str, meter: LLMMeter,
+                        recordings: Optional[RecordedResponses]) -> List[Dict]:
+    content = path.read_text(encoding='utf-8')
+    return UniversalExtractor(llm_budget=0).extract_with_rules(content)
+
+
+def run_universal(path: Path, stem: str, meter: LLMMeter, recordings: Optional[RecordedResponses]) -> List[Dict]:
+    extractor = UniversalExtractor(llm_budget=None)
+    call_model = extractor.extract_with_langextract
+
+    def metered(text: str) -> List[Dict]:
+        result = recordings.headings_in(stem, text) if recordings else call_model(text)
+        meter.record(text, result)
+        return result
+
+    extractor.extract_with_langextract = metered
+    return extractor.extract_headings(str(path))
+
+
+def run_md2top(path: Path, stem: str, meter: LLMMeter,
+               recordings: Optional[RecordedResponses]) -> Optional[List[Dict]]:
+    if recordings is None and not md2top.LANGEXTRACT_AVAILABLE:
+        return None
+    if recordings is not None and recordings.structured(stem) is None:
+        return None
+
+    extractor = md2top.MarkdownExtractor(api_key=None if recordings is None else 'offline')
+    call_model = extractor.extract_structure
+
+    def metered(text: str) -> Dict:
+        result = recordings.structured(stem) if recordings else call_model(text)
+        meter.record(text, result)
+        return result
+
+    extractor.extract_structure = metered
+    structured = extractor.extract_from_file(str(path))
+    # 与-top.md的写出方式一致：最多到三级
+    return [
+        {'text': h['text'], 'level': min(int(h['attributes'].get('level', '1')), 3)}
+        for h in structured['headings']
+    ]
+
+
+EXTRACTORS: Dict[str, Callable] = {
+    'simple': run_simple,
+    'universal_rules': run_universal_rules,
+    'universal': run_universal,
+    'md2top': run_md2top,
+}
+
+
+def load_corpus(example_dir: Path, scales: List[int], work_dir: Path) -> List[Tuple[str, Path, int, int]]:
+    """返回(原文档stem, 文件路径, 行数, 放大倍数)；放大版本写入work_dir"""
+    documents = []
+    for path in sorted(example_dir.glob('*.md')):
+        if path.stem.endswith('-top'):
+            continue
+        content = path.read_text(encoding='utf-8')
+        for scale in scales:
+            if scale == 1:
+                target = path
+            else:
+                target = work_dir / f"{path.stem}-x{scale}.md"
+                target.write_text('\n'.join([content] * scale), encoding='utf-8')
+            documents.append((path.stem, target, (content.count('\n') + 1) * scale, scale))
+    return documents
+
+
+def load_golden(example_dir: Path, stem: str) -> Optional[List[Dict]]:
+    path = example_dir / f"{stem}-top.md"
+    if not path.exists():
+        return None
+    return Outline.from_markdown(path.read_text(encoding='utf-8')).to_headings()
+
+
+def score_by_level(predicted: List[Dict], golden: List[Dict]) -> Dict[str, List[int]]:
+    """按级别统计[命中数, 预测数, 标准数]；'all'为忽略级别只比较文本"""
+    counts: Dict[str, List[int]] = {}
+    groups = {'all': (Counter(h['text'] for h in predicted), Counter(h['text'] for h in golden))}
+    for level in sorted({h['level'] for h in predicted} | {h['level'] for h in golden}):
+        groups[str(level)] = (
+            Counter(h['text'] for h in predicted if h['level'] == level),
+            Counter(h['text'] for h in golden if h['level'] == level),
+        )
+    for key, (pred, gold) in groups.items():
+        hits = sum(min(count, gold[text]) for text, count in pred.items())
+        counts[key] = [hits, sum(pred.values()), sum(gold.values())]
+    return counts
+
+
+def _quiet(fn: Callable, *args):
+    """提取器会打印进度信息，基准运行时丢弃"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+def benchmark_corpus(example_dir: Path, scales: List[int], offline: bool) -> Dict[str, Dict]:
+    """在语料上运行所有提取器，返回每个提取器的汇总指标"""
+    recordings = RecordedResponses(example_dir) if offline else None
+    report: Dict[str, Dict] = {}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        documents = load_corpus(example_dir, scales, Path(work_dir))
+        for name, runner in EXTRACTORS.items():
+            summary = {'documents': 0, 'lines': 0, 'seconds': 0.0, 'peak_bytes': 0,
+                       'llm_calls': 0, 'llm_tokens': 0, 'scores': {}}
+            for stem, path, n_lines, scale in documents:
+                meter = LLMMeter()
+                start = time.perf_counter()
+                headings = _quiet(runner, path, stem, meter, recordings)
+                elapsed = time.perf_counter() - start
+                if headings is None:
+                    continue
+
+                # 单独一轮测峰值内存，避免tracemalloc拖慢计时
+                tracemalloc.start()
+                _quiet(runner, path, stem, LLMMeter(), recordings)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                summary['documents'] += 1
+                summary['lines'] += n_lines
+                summary['seconds'] += elapsed
+                summary['peak_bytes'] = max(summary['peak_bytes'], peak)
+                summary['llm_calls'] += meter.calls
+                summary['llm_tokens'] += meter.tokens
+
+                golden = load_golden(example_dir, stem) if scale == 1 else None
+                if golden is not None:
+                    for level, counts in score_by_level(headings, golden).items():
+                        totals = summary['scores'].setdefault(level, [0, 0, 0])
+                        for i, value in enumerate(counts):
+                            totals[i] += value
+            report[name] = summary
+    return report
+
+
+def print_corpus_report(report: Dict[str, Dict]) -> None:
+    print(f"{'提取器':<16}{'文档':>6}{'行数':>10}{'行/秒':>14}{'峰值MiB':>10}{'LLM调用':>9}{'估算tokens':>12}")
+    for name, s in report.items():
+        rate = s['lines'] / s['seconds'] if s['seconds'] else 0.0
+        print(f"{name:<16}{s['documents']:>6}{s['lines']:>10,}{rate:>14,.0f}"
+              f"{s['peak_bytes'] / 2**20:>10.2f}{s['llm_calls']:>9}{s['llm_tokens']:>12,}")
+
+    print("\n准确率/召回率（对照*-top.md，'all'为忽略级别）")
+    for name, s in report.items():
+        cells = []
+        for level in sorted(s['scores'], key=lambda k: (k != 'all', k)):
+            hits, n_pred, n_gold = s['scores'][level]
+            precision = hits / n_pred if n_pred else 0.0
+            recall = hits / n_gold if n_gold else 0.0
+            cells.append(f"L{level} P={precision:.2f} R={recall:.2f}" if level != 'all'
+                         else f"all P={precision:.2f} R={recall:.2f}")
+        print(f"  {name:<16}" + ("  ".join(cells) if cells else "(无标准大纲)"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='标题提取器性能与准确率基准')
+    subparsers = parser.add_subparsers(dest='command')
+
+    rules_parser = subparsers.add_parser('rules', help='合成大文档上的规则分类器吞吐量与大纲内存')
+    rules_parser.add_argument('--lines', type=int, default=1_000_000, help='合成文档行数（默认1,000,000）')
+    rules_parser.add_argument('--outline-headings', type=int, default=1_000_000,
+                              help='大纲内存对比使用的标题数（默认1,000,000）')
+    rules_parser.add_argument('--seed', type=int, default=0, help='随机种子')
+
+    corpus_parser = subparsers.add_parser('corpus', help='example语料上的速度、内存、LLM开销与准确率')
+    corpus_parser.add_argument('--example-dir', default=str(EXAMPLE_DIR), help='语料目录（默认example/）')
+    corpus_parser.add_argument('--scales', default='1,10,100', help='放大倍数，逗号分隔（默认1,10,100）')
+    corpus_parser.add_argument('--online', action='store_true',
+                               help='真实调用langextract；默认离线回放*-structured.json中的录制响应')
+    corpus_parser.add_argument('--json', help='将汇总结果另存为JSON文件')
+
+    args = parser.parse_args()
+    if args.command == 'corpus':
+        scales = [int(s) for s in args.scales.split(',') if s]
+        report = benchmark_corpus(Path(args.example_dir), scales, offline=not args.online)
+        print_corpus_report(report)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存到: {args.json}")
+    else:
+        benchmark_classifiers(getattr(args, 'lines', 1_000_000), getattr(args, 'seed', 0))
+        benchmark_outline_memory(getattr(args, 'outline_headings', 1_000_000), getattr(args, 'seed', 0))
+
+
+if __name__ == '__main__':
+    main()
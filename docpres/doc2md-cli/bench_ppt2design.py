@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ppt2design性能基准
+针对本地模拟的智谱接口运行PPTDesignFramework，不消耗API额度
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from layout_classifier import LayoutClassifier
+from mock_zhipu_server import LATENCY_DISTRIBUTIONS, MockZhipuServer
+from ppt2design import DEFAULT_API_URL, PPTDesignFramework, parse_text_file
+
+LAYOUT_INPUTS = ['example_input.json', 'example/ppt2design_test1.txt', 'example/ppt2design_test2.txt']
+LAYOUT_THRESHOLDS = [0.0, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9]
+SUITE_SIZES = [10, 100, 1000]
+SUITE_STAGES = ["stage1", "stage2", "stage3", "stage4", "repair"]
+
+# 合成演示文稿的素材：主题与几类句式（并列、数据、流程、对比），按页随机组合
+_TOPICS = ["数字化转型", "供应链协同", "客户运营", "数据治理", "组织变革", "产品创新", "渠道拓展", "成本管控"]
+_SENTENCES = [
+    "{topic}涉及战略、流程、技术与人才四个方面，各方面相互支撑、缺一不可。",
+    "2023年{topic}相关投入同比增长{n}%，占总预算的{m}%，预计三年内回收成本。",
+    "推进{topic}首先需要明确目标，然后梳理现有流程，接着分阶段试点，最后全面推广。",
+    "相比传统做法，{topic}的优势在于响应更快、成本更低，劣势是前期投入较大。",
+    "在{topic}中，管理层关注投入产出比，一线员工更关注工具是否易用。",
+]
+
+
+def load_pages(input_file: str, n_pages: int) -> List[Dict]:
+    """读取示例输入并循环复制到n_pages页"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        pages = json.load(f)["pages"]
+    return [dict(pages[i % len(pages)]) for i in range(n_pages)]
+
+
+def run_deck(api_url: str, pages: List[Dict], concurrency: int) -> Tuple[float, Dict]:
+    """处理一份演示文稿，返回墙钟耗时与连接统计"""
+    framework = PPTDesignFramework("mock.key", api_url=api_url, concurrency=concurrency)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = framework.process_presentation(pages)
+    elapsed = time.perf_counter() - start
+    framework.close()
+    assert len(result["pages"]) == len(pages), "模拟接口下不应丢页"
+    return elapsed, framework.client.stats.snapshot()
+
+
+def benchmark_concurrency(input_file: str, n_pages: int, latency: float, levels: List[int]) -> None:
+    pages = load_pages(input_file, n_pages)
+    with MockZhipuServer(latency=latency) as server:
+        print(f"{n_pages} 页，模拟延迟 {latency:.2f}s/请求")
+        baseline = None
+        for concurrency in levels:
+            elapsed, stats = run_deck(server.api_url, pages, concurrency)
+            baseline = baseline or elapsed
+            print(f"  并发 {concurrency:>3}: {elapsed:7.2f}s  "
+                  f"{n_pages / elapsed * 60:8.1f} 页/分钟  加速 {baseline / elapsed:5.1f}x  "
+                  f"请求 {stats['requests']} / 新建连接 {stats['connections']}"
+                  f"（建连 {stats['connect_seconds']:.3f}s）")
+
+
+def _agreement(staged: Dict, fused: Dict) -> Dict[str, float]:
+    """逐页比较两种模式的关键决策是否一致"""
+    fields = {
+        "layout_choice": lambda page: page["stage1"]["step1_output"].get("layout_choice"),
+        "template_type": lambda page: page["stage2"]["step2_output"].get("template_type"),
+        "content_type": lambda page: page["stage3"]["step3_output"].get("layout_constraints", {}).get("content_type"),
+    }
+    pairs = list(zip(staged["pages"], fused["pages"]))
+    return {
+        name: sum(get(a) == get(b) for a, b in pairs) / len(pairs) if pairs else 0.0
+        for name, get in fields.items()
+    }
+
+
+def benchmark_fused(input_file: str, api_key: str, api_url: str, concurrency: int) -> None:
+    """在示例输入上比较分阶段与融合模式的耗时、token用量与输出一致性"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        pages = json.load(f)["pages"]
+
+    results = {}
+    for fused in (False, True):
+        framework = PPTDesignFramework(api_key, api_url=api_url, concurrency=concurrency, fused=fused)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = framework.process_presentation(pages)
+        elapsed = time.perf_counter() - start
+        framework.close()
+        results[fused] = result
+
+        page_usage = {stage: u for stage, u in framework.usage.items() if stage != "stage4"}
+        calls = sum(u["calls"] for u in page_usage.values())
+        prompt_tokens = sum(u["prompt_tokens"] for u in page_usage.values())
+        completion_tokens = sum(u["completion_tokens"] for u in page_usage.values())
+        name = "融合" if fused else "分阶段"
+        print(f"{name:<6} {elapsed:7.2f}s  阶段1-3请求 {calls:>3}  "
+              f"输入tokens {prompt_tokens:>7,}  输出tokens {completion_tokens:>6,}  "
+              f"成功页 {len(result['pages'])}/{len(pages)}"
+              + (f"  退回分阶段 {framework.fused_fallbacks}" if fused else ""))
+
+    agreement = _agreement(results[False], results[True])
+    print("输出一致率: " + "  ".join(f"{k} {v:.0%}" for k, v in agreement.items()))
+
+
+def benchmark_stream(input_file: str, n_pages: int, latency: float, chunk_latency: float,
+                     concurrency: int) -> None:
+    """比较非流式与流式（提前解析layout_choice）下每页到阶段2开始的耗时与总耗时"""
+    pages = load_pages(input_file, n_pages)
+    with MockZhipuServer(latency=latency, chunk_latency=chunk_latency) as server:
+        print(f"{n_pages} 页，并发 {concurrency}，首token延迟 {latency:.2f}s，每块 {chunk_latency:.3f}s")
+        for stream in (False, True):
+            framework = PPTDesignFramework("mock.key", api_url=server.api_url,
+                                           concurrency=concurrency, stream=stream)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                framework.process_presentation(pages)
+            elapsed = time.perf_counter() - start
+            framework.close()
+            name = "流式" if stream else "非流式"
+            print(f"  {name:<4} 总耗时 {elapsed:6.2f}s  {framework.timing_report()}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法百分位数，values为空时返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def synthetic_pages(n_pages: int, seed: int = 0) -> List[Dict]:
+    """生成n_pages页合成输入，内容长度与句式各页不同，同一seed结果不变"""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n_pages):
+        topic = rng.choice(_TOPICS)
+        sentences = [rng.choice(_SENTENCES).format(topic=topic, n=rng.randint(5, 60), m=rng.randint(3, 30))
+                     for _ in range(rng.randint(1, 6))]
+        pages.append({"title": f"{topic}（{i + 1}）", "content": "".join(sentences)})
+    return pages
+
+
+def run_suite_deck(api_url: str, name: str, pages: List[Dict], concurrency: int, server: MockZhipuServer) -> None:
+    """处理一份演示文稿并打印吞吐、各阶段延迟分位数、错误率与连接/解析开销"""
+    requests_before, errors_before = server.request_count, server.error_count
+    framework = PPTDesignFramework("mock.key", api_url=api_url, concurrency=concurrency)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = framework.process_presentation(pages)
+    elapsed = time.perf_counter() - start
+    framework.close()
+
+    requests = server.request_count - requests_before
+    errors = server.error_count - errors_before
+    done = len(result["pages"])
+    print(f"{name}: {len(pages)} 页，成功 {done}，耗时 {elapsed:.2f}s，{done / elapsed * 60:.1f} 页/分钟，"
+          f"请求 {requests} 次，服务端错误 {errors}（{errors / requests if requests else 0:.1%}）")
+    print("  阶段     请求    p50(s)   p95(s)   p99(s)")
+    for stage in SUITE_STAGES:
+        # 耗时只保留最近的样本，请求数取用量统计
+        latencies = framework.call_latencies.get(stage, [])
+        if latencies:
+            print(f"  {stage:<8} {framework.usage[stage]['calls']:>5}  {percentile(latencies, 50):7.3f}  "
+                  f"{percentile(latencies, 95):7.3f}  {percentile(latencies, 99):7.3f}")
+    stats = framework.client.stats.snapshot()
+    request_seconds = stats["connect_seconds"] + stats["model_seconds"]
+    connect_share = stats["connect_seconds"] / request_seconds if request_seconds else 0.0
+    print(f"  连接开销: 新建 {stats['connections']} 个，建连 {stats['connect_seconds']:.3f}s"
+          f"（占请求耗时 {connect_share:.2%}）；解析开销: {framework.parse_seconds * 1000:.1f}ms"
+          f"（每页 {framework.parse_seconds * 1000 / max(done, 1):.2f}ms），修复请求 {framework.parse_repairs} 次")
+
+
+def benchmark_suite(input_file: str, sizes: List[int], latency: float, distribution: str, error_rate: float,
+                    malformed_every: int, concurrency: int, canned: Optional[Dict], seed: int) -> None:
+    """端到端基准：示例输入与10/100/1000页合成演示文稿依次跑过同一个模拟接口"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        example = json.load(f)["pages"]
+    decks = [(input_file, example)] + [(f"合成{n}页", synthetic_pages(n, seed)) for n in sizes]
+    with MockZhipuServer(latency=latency, latency_distribution=distribution, error_rate=error_rate,
+                         malformed_every=malformed_every, canned=canned, seed=seed) as server:
+        print(f"模拟延迟 {distribution} 均值 {latency:.2f}s，错误率 {error_rate:.1%}，并发 {concurrency}")
+        for name, pages in decks:
+            run_suite_deck(server.api_url, name, pages, concurrency, server)
+
+
+def benchmark_hedge(input_file: str, n_pages: int, latency: float, distribution: str, concurrency: int,
+                    budget: float, stream: bool, seed: int) -> None:
+    """比较不对冲与对冲（预算budget）下单页耗时的尾部与额外请求开销，两次运行的延迟序列相同"""
+    pages = load_pages(input_file, n_pages)
+    print(f"{n_pages} 页，并发 {concurrency}，模拟延迟 {distribution} 均值 {latency:.2f}s"
+          + ("，流式" if stream else ""))
+    print("  模式          总耗时    单页p50   单页p95   单页p99   请求数  对冲请求  对冲先返回")
+    for hedge_budget in (0.0, budget):
+        with MockZhipuServer(latency=latency, latency_distribution=distribution, seed=seed) as server:
+            framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=concurrency,
+                                           stream=stream, hedge_budget=hedge_budget)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                framework.process_presentation(pages)
+            elapsed = time.perf_counter() - start
+            framework.close()
+            requests = server.request_count
+        totals = [t["total_seconds"] for t in framework.page_timings]
+        name = f"对冲 {hedge_budget:.0%}" if hedge_budget else "不对冲"
+        print(f"  {name:<10} {elapsed:8.2f}s  {percentile(totals, 50):7.3f}s  {percentile(totals, 95):7.3f}s  "
+              f"{percentile(totals, 99):7.3f}s  {requests:>6}  {framework.hedges_sent:>6}"
+              f"（{framework.hedges_sent / max(requests - framework.hedges_sent, 1):.1%}）  {framework.hedge_wins:>6}")
+
+
+def load_layout_pages(paths: List[str]) -> List[Tuple[Dict, Optional[str]]]:
+    """读取输入页面，并从同名的 *_result.json 中取出已记录的阶段1布局（页数一致时才逐页对应）"""
+    pages = []
+    for path in paths:
+        if path.endswith('.txt'):
+            deck = parse_text_file(path)["pages"]
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                deck = json.load(f)["pages"]
+        recorded = [None] * len(deck)
+        result_path = f"{os.path.splitext(path)[0]}_result.json"
+        if os.path.exists(result_path):
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result_pages = json.load(f).get("pages", [])
+            if len(result_pages) == len(deck):
+                recorded = [page["stage1"]["step1_output"].get("layout_choice") for page in result_pages]
+        pages.extend(zip(deck, recorded))
+    return pages
+
+
+def benchmark_layout(paths: List[str], api_key: Optional[str], api_url: str) -> None:
+    """比较本地布局分类器与LLM阶段1的一致率，以及各阈值下省掉的阶段1请求比例"""
+    classifier = LayoutClassifier()
+    pages = load_layout_pages(paths)
+    framework = PPTDesignFramework(api_key, api_url=api_url) if api_key else None
+    
+    rows = []
+    for page, recorded in pages:
+        local = classifier.classify(page["title"], page["content"])
+        reference = recorded
+        if framework is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                answer = framework.stage1_strategy_layout(page["title"], page["content"])
+            reference = answer.get("step1_output", {}).get("layout_choice")
+        rows.append((local, reference))
+        print(f"  {page['title'][:20]:<20} 本地 {local['layout_choice']:<26} {local['local_score']:.2f}"
+              f"  LLM {reference or '-'}")
+    if framework is not None:
+        framework.close()
+    
+    labelled = [(local, ref) for local, ref in rows if ref]
+    source = "接口" if framework is not None else "已记录结果"
+    print(f"{len(rows)} 页，其中 {len(labelled)} 页有LLM参考布局（来源: {source}）")
+    print("阈值   省掉阶段1请求   采用页与LLM一致")
+    for threshold in LAYOUT_THRESHOLDS:
+        taken = [local for local, _ in rows if local["local_score"] >= threshold]
+        judged = [local["layout_choice"] == ref for local, ref in labelled
+                  if local["local_score"] >= threshold]
+        agreement = f"{sum(judged)}/{len(judged)}" if judged else "-"
+        print(f"{threshold:<5.2f}  {len(taken):>3}/{len(rows):<3} {len(taken) / len(rows):>5.0%}   {agreement:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ppt2design性能基准（本地模拟接口）')
+    parser.add_argument('--mode', choices=['concurrency', 'fused', 'layout', 'stream', 'suite', 'hedge'],
+                        default='concurrency',
+                        help='concurrency: 比较不同并发数；fused: 比较分阶段与融合模式；'
+                             'layout: 本地布局分类器与LLM阶段1的一致率；stream: 比较流式与非流式；'
+                             'suite: 示例输入与合成演示文稿的端到端吞吐、延迟分位数与开销；'
+                             'hedge: 比较对冲请求前后的尾延迟与额外请求开销')
+    parser.add_argument('--input', default='example_input.json', help='输入JSON（默认example_input.json）')
+    parser.add_argument('--pages', type=int, default=30, help='演示文稿页数（默认30，循环复制输入页）')
+    parser.add_argument('--latency', type=float, default=0.2, help='模拟接口每个请求的延迟秒数（默认0.2）')
+    parser.add_argument('--chunk-latency', type=float, default=0.02,
+                        help='stream模式下模拟接口每生成一个流式块的耗时秒数（默认0.02）')
+    parser.add_argument('--concurrency', default='1,4,16', help='要比较的并发数，逗号分隔（默认1,4,16）')
+
+    parser.add_argument('--sizes', default=','.join(map(str, SUITE_SIZES)),
+                        help='suite模式的合成演示文稿页数，逗号分隔（默认10,100,1000）')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal',
+                        help='suite/hedge模式下模拟延迟的分布，均值为--latency（默认lognormal）')
+    parser.add_argument('--hedge-budget', type=float, default=0.1,
+                        help='hedge模式下对冲请求预算，占请求数的比例（默认0.1）')
+    parser.add_argument('--stream', action='store_true', help='hedge模式下使用流式请求（落后的一方可中途断开）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='suite模式下模拟接口返回500的概率（默认0）')
+    parser.add_argument('--malformed-every', type=int, default=0,
+                        help='suite模式下每第N个阶段请求返回截断的JSON（默认0，不截断）')
+    parser.add_argument('--canned', help='suite模式下替换模拟接口固定输出的JSON文件（键为stepN_output）')
+    parser.add_argument('--seed', type=int, default=0, help='合成页面与模拟延迟的随机种子（默认0）')
+
+    parser.add_argument('--layout-inputs', nargs='+', default=LAYOUT_INPUTS,
+                        help='layout模式的输入文件（JSON或文本格式）')
+    
+    parser.add_argument('--api-key', help='fused/layout模式下提供时调用真实接口，否则使用模拟接口/已记录结果')
+    parser.add_argument('--api-url', default=DEFAULT_API_URL, help='真实接口地址')
+
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(',') if c]
+    if args.mode == 'suite':
+        canned = None
+        if args.canned:
+            with open(args.canned, 'r', encoding='utf-8') as f:
+                canned = json.load(f)
+        sizes = [int(n) for n in args.sizes.split(',') if n]
+        benchmark_suite(args.input, sizes, args.latency, args.latency_distribution, args.error_rate,
+                        args.malformed_every, max(levels), canned, args.seed)
+    elif args.mode == 'hedge':
+        benchmark_hedge(args.input, args.pages, args.latency, args.latency_distribution, max(levels),
+                        args.hedge_budget, args.stream, args.seed)
+    elif args.mode == 'stream':
+        benchmark_stream(args.input, args.pages, args.latency, args.chunk_latency, max(levels))
+    elif args.mode == 'layout':
+        benchmark_layout(args.layout_inputs, args.api_key, args.api_url)
+    elif args.mode == 'fused':
+        if args.api_key:
+            benchmark_fused(args.input, args.api_key, args.api_url, max(levels))
+        else:
+            with MockZhipuServer(latency=args.latency) as server:
+                benchmark_fused(args.input, "mock.key", server.api_url, max(levels))
+    else:
+        benchmark_concurrency(args.input, args.pages, args.latency, levels)
+
+
+if __name__ == '__main__':
+    main()
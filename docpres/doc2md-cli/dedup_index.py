@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+近似重复页面索引
+对reference_content按字符n-gram（适合中文）计算MinHash签名，用LSH分桶找候选，
+相似度达到阈值的已设计页面可以复用其阶段输出；索引以NDJSON持久化，跨运行、跨演示文稿共享
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from stage_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_DEDUP_INDEX = os.path.join(DEFAULT_CACHE_DIR, "dedup_index.ndjson")
+DEFAULT_DEDUP_THRESHOLD = 0.85
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+# LSH分桶：NUM_PERM = BANDS × 每段行数；相似度0.85的页面几乎必然落入同一桶
+BANDS = 16
+
+# 2^61-1为梅森素数，(a*x+b) mod p 作为一族近似独立的哈希排列
+_PRIME = (1 << 61) - 1
+# 去掉空白与标点后再切分，排版差异不影响相似度
+_NON_TEXT = re.compile(r'[\W_]+')
+
+
+def normalize(text: str) -> str:
+    return _NON_TEXT.sub("", text or "").lower()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """规范化文本的字符n-gram集合；短于n的文本整体作为一个片段"""
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """固定种子的MinHash，相同参数在不同进程中得到相同签名"""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text: str) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                  for s in shingles(text)]
+        if not hashes:
+            return [_PRIME] * self.num_perm
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._params]
+
+
+def estimate_similarity(a: List[int], b: List[int]) -> float:
+    """签名中相同位置取值相等的比例，即Jaccard相似度的估计"""
+    return sum(x == y for x, y in zip(a, b)) / len(a) if a else 0.0
+
+
+class DedupIndex:
+    """每行一条记录: {"content_sha", "signature", "page_title", "result"}，result为阶段1-3的输出"""
+
+    def __init__(self, path: str = DEFAULT_DEDUP_INDEX, threshold: float = DEFAULT_DEDUP_THRESHOLD,
+                 num_perm: int = NUM_PERM, bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm必须是bands的整数倍")
+        self.path = Path(path)
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._lock = threading.Lock()
+        self._records: List[Dict] = []
+        self._by_sha: Dict[str, int] = {}
+        self._buckets: Dict[tuple, List[int]] = {}
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self) -> None:
+        data = self.path.read_bytes()
+        # 与逐页日志相同：截掉崩溃时写了一半的最后一行
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            os.truncate(self.path, len(complete))
+        for line in complete.decode("utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            # 签名参数变化后旧记录无法比较
+            if len(record.get("signature", [])) == self.hasher.num_perm:
+                self._insert(record)
+
+    def _band_keys(self, signature: List[int]) -> List[tuple]:
+        return [(band, tuple(signature[band * self._rows:(band + 1) * self._rows])) for band in range(self.bands)]
+
+    def _insert(self, record: Dict) -> None:
+        index = len(self._records)
+        self._records.append(record)
+        self._by_sha[record["content_sha"]] = index
+        for key in self._band_keys(record["signature"]):
+            self._buckets.setdefault(key, []).append(index)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def lookup(self, reference_content: str) -> Optional[Dict]:
+        """返回最相似且达到阈值的已设计页面: {"similarity", "exact", "page_title", "result"}，没有时返回None
+
+        exact表示规范化后内容完全相同。
+        """
+        content_sha = hashlib.sha256(normalize(reference_content).encode("utf-8")).hexdigest()
+        signature = self.hasher.signature(reference_content)
+        with self._lock:
+            self.lookups += 1
+            if content_sha in self._by_sha:
+                self.exact_hits += 1
+                record = self._records[self._by_sha[content_sha]]
+                return {"similarity": 1.0, "exact": True, "page_title": record["page_title"],
+                        "result": record["result"]}
+            candidates = {i for key in self._band_keys(signature) for i in self._buckets.get(key, [])}
+            best, best_similarity = None, 0.0
+            for i in candidates:
+                similarity = estimate_similarity(signature, self._records[i]["signature"])
+                if similarity > best_similarity:
+                    best, best_similarity = i, similarity
+            if best is None or best_similarity < self.threshold:
+                return None
+            self.near_hits += 1
+            record = self._records[best]
+        return {"similarity": round(best_similarity, 3), "exact": False, "page_title": record["page_title"],
+                "result": record["result"]}
+
+    def add(self, page_title: str, reference_content: str, result: Dict) -> None:
+        """登记一个完成设计的页面；内容相同的页面只保留第一条"""
+        content_sha = hashlib.sha256(normalize(reference_content).encode("utf-8")).hexdigest()
+        record = {
+            "content_sha": content_sha,
+            "signature": self.hasher.signature(reference_content),
+            "page_title": page_title,
+            "result": {stage: result[stage] for stage in ("stage1", "stage2", "stage3")},
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if content_sha in self._by_sha:
+                return
+            self._insert(record)
+            self._file.write(line)
+            self._file.flush()
+
+    def report(self) -> str:
+        with self._lock:
+            return (f"近似重复索引: {len(self._records)} 页，查询 {self.lookups} 次，"
+                    f"完全相同 {self.exact_hits} 次，近似重复 {self.near_hits} 次（阈值 {self.threshold}）")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "DedupIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地布局分类器
+用关键词与数字特征为页面打分，输出与阶段一相同结构的step1_output；
+置信度足够高时可以省掉阶段一的LLM请求
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+# 本地得分不低于该值时采用本地结果；本地分类器默认不启用（--local-layout），
+# 与LLM阶段1的一致率尚未在足够多的页面上测量，阈值取得较保守
+DEFAULT_LAYOUT_THRESHOLD = 0.85
+# 本地结果的来源标记，与LLM返回的step1_output区分
+LOCAL_SOURCE = "local_classifier"
+
+# 每个模板的特征：(名称, 正则, 权重)；同一特征最多计 _MAX_HITS 次，避免长文本单项刷分
+_FEATURES: Dict[str, List[Tuple[str, str, float]]] = {
+    "TEMPLATE_DATA": [
+        ("数值单位", r'\d+(?:\.\d+)?\s*(?:%|％|‰|亿|万|千|倍|元|美元|个百分点)', 1.5),
+        ("统计用语", r'百分之|同比|环比|增长率|增速|占比|份额|均值|中位数|percent|growth rate', 1.0),
+        ("年份序列", r'(?:19|20)\d{2}\s*年', 0.5),
+    ],
+    "TEMPLATE_FLOW": [
+        # "之后""最终""阶段""流程""路径"在一般叙述中也很常见，不作为特征
+        ("顺序词", r'首先|其次|然后|随后|接着|最后|依次|\b(?:first|then|next|finally)\b', 1.0),
+        ("步骤", r'第[一二三四五六七八九十\d]+(?:步|阶段|环节)|步骤|\b(?:step|phase)\s*\d+', 1.0),
+        ("箭头", r'→|->|—>', 1.5),
+    ],
+    "TEMPLATE_COMPARE": [
+        ("比较词", r'相比|对比|比较|相较|不同于|差异|区别|\bvs\.?|versus|compared', 1.5),
+        ("优劣", r'优势|劣势|优点|缺点|利弊|\bpros\b|\bcons\b', 1.0),
+        ("前后", r'之前.{0,20}之后|问题.{0,20}解决|before.{0,20}after', 1.0),
+    ],
+    "TEMPLATE_CONCEPTUAL_MODEL": [
+        ("模型词", r'象限|矩阵|SWOT|金字塔|飞轮|模型|框架|维度', 1.5),
+    ],
+    "TEMPLATE_BLOCKS": [
+        ("并列项", r'包括|分别|以及|各自|\bincluding\b', 0.5),
+        ("顿号列表", r'[^、，。]{1,12}、[^、，。]{1,12}、', 0.5),
+        ("编号项", r'(?:^|\n)\s*(?:\d+[.、)]|[-*•])\s*\S', 0.5),
+    ],
+}
+_MAX_HITS = 4
+_TITLE_WEIGHT = 2.0
+# TEMPLATE_SUMMARY没有明显特征，给一个先验分数作为兜底
+_SUMMARY_PRIOR = 1.0
+# 置信度分母中的"未知"质量，没有任何特征命中时置信度只有0.5
+_UNKNOWN_MASS = 1.0
+
+
+class LayoutClassifier:
+    """基于特征打分的布局分类器，正则在初始化时编译一次"""
+
+    def __init__(self):
+        self._features = [
+            (template, name, re.compile(pattern, re.IGNORECASE), weight)
+            for template, features in _FEATURES.items()
+            for name, pattern, weight in features
+        ]
+
+    def score(self, page_title: str, reference_content: str) -> Tuple[Dict[str, float], Dict[str, List[str]]]:
+        """返回各模板的得分与命中的特征名；标题中的特征权重更高"""
+        scores = {template: 0.0 for template in _FEATURES}
+        scores["TEMPLATE_SUMMARY"] = _SUMMARY_PRIOR
+        hits: Dict[str, List[str]] = {}
+        for template, name, pattern, weight in self._features:
+            count = min(len(pattern.findall(reference_content)), _MAX_HITS)
+            title_count = min(len(pattern.findall(page_title)), _MAX_HITS)
+            if count or title_count:
+                scores[template] += weight * (count + _TITLE_WEIGHT * title_count)
+                hits.setdefault(template, []).append(name)
+        return scores, hits
+
+    def classify(self, page_title: str, reference_content: str) -> Dict:
+        """返回step1_output结构的结果，source标记为本地分类器
+
+        local_score为最高分占总分（含未知质量）的比例，与LLM的confidence_score不是同一标度，
+        因此confidence_score留空。
+        """
+        scores, hits = self.score(page_title, reference_content)
+        layout_choice = max(scores, key=scores.get)
+        confidence = scores[layout_choice] / (sum(scores.values()) + _UNKNOWN_MASS)
+        features = "、".join(hits.get(layout_choice, [])) or "无明显特征"
+        return {
+            "layout_choice": layout_choice,
+            "confidence_score": None,
+            "reasoning": f"本地分类器: {features}",
+            "source": LOCAL_SOURCE,
+            "local_score": round(confidence, 3)
+        }
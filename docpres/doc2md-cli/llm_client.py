@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+智谱AI接口的连接池客户端
+基于requests.Session复用keep-alive连接，把建连（TCP+TLS）耗时与模型耗时分开统计
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 300.0
+
+_CJK_CHAR = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+
+_FENCE = re.compile(r'```(?:json)?\s*(.*?)\s*```', re.S | re.I)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_SMART_QUOTES = str.maketrans({'\u201c': '"', '\u201d': '"'})
+
+
+class RateLimitedError(requests.HTTPError):
+    """接口返回429；retry_after为Retry-After头给出的秒数（没有或无法解析时为None）"""
+
+    def __init__(self, retry_after: Optional[float] = None, response: Optional[requests.Response] = None):
+        super().__init__(f"429 Too Many Requests (Retry-After: {retry_after})", response=response)
+        self.retry_after = retry_after
+
+
+def _raise_for_status(response: requests.Response) -> None:
+    """429转换为RateLimitedError，其余错误状态照常抛出HTTPError"""
+    if response.status_code == 429:
+        try:
+            retry_after = float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            retry_after = None
+        raise RateLimitedError(retry_after, response=response)
+    response.raise_for_status()
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文字符按1个计，其余字符按4个1个计"""
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def extract_json_str(text: str) -> str:
+    """剥离代码围栏与前面的说明文字，返回从第一个{开始的文本"""
+    text = (text or "").strip()
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1)
+    start = text.find('{')
+    return text[start:] if start >= 0 else text
+
+
+def try_parse_json(text: str) -> Optional[Dict]:
+    """容错解析LLM回答中的JSON对象，失败返回None
+    
+    依次尝试：原样解析、去掉尾随逗号、再把中文弯引号换成直引号；
+    用raw_decode解析，对象后面多出的说明文字会被忽略。
+    """
+    candidate = extract_json_str(text)
+    without_commas = _TRAILING_COMMA.sub(r'\1', candidate)
+    decoder = json.JSONDecoder()
+    for attempt in (candidate, without_commas, without_commas.translate(_SMART_QUOTES)):
+        try:
+            value, _ = decoder.raw_decode(attempt)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+class StreamingFieldParser:
+    """增量解析流式回答中的短字符串字段（如layout_choice）：值一完整出现就返回，不必等整个JSON结束"""
+
+    def __init__(self, fields: List[str]):
+        self._patterns = {
+            name: re.compile(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)"' % re.escape(name)) for name in fields
+        }
+        self._text = ""
+        self._scan_from = 0
+
+    def feed(self, delta: str) -> Dict[str, str]:
+        """追加一段回答文本，返回本次新解析出的字段"""
+        self._text += delta
+        found = {}
+        for name, pattern in list(self._patterns.items()):
+            match = pattern.search(self._text, self._scan_from)
+            if match:
+                found[name] = json.loads(f'"{match.group(1)}"')
+                del self._patterns[name]
+        # 键名与值可能跨越多段到达，只回退一小段窗口重新扫描
+        if self._patterns:
+            self._scan_from = max(0, len(self._text) - 256)
+        return found
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+
+class ClientStats:
+    """线程安全的请求统计：新建连接数、建连耗时、请求总耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.connect_seconds = 0.0
+        self.request_seconds = 0.0
+
+    def record_connect(self, seconds: float) -> None:
+        with self._lock:
+            self.connections += 1
+            self.connect_seconds += seconds
+
+    def record_request(self, seconds: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.request_seconds += seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "connect_seconds": round(self.connect_seconds, 4),
+                # 请求耗时中扣除建连部分，剩下的是发送、模型推理与接收
+                "model_seconds": round(self.request_seconds - self.connect_seconds, 4),
+            }
+
+    def report(self) -> str:
+        s = self.snapshot()
+        return (f"请求 {s['requests']} 次，新建连接 {s['connections']} 个，"
+                f"建连耗时 {s['connect_seconds']:.2f}s，模型耗时 {s['model_seconds']:.2f}s")
+
+
+def _timed_pool_classes(stats: ClientStats) -> Dict:
+    """返回按scheme区分的连接池类，其连接在connect()时记录建连耗时"""
+
+    def timed(connection_cls):
+        class TimedConnection(connection_cls):
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                stats.record_connect(time.perf_counter() - start)
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+        ConnectionCls = timed(urllib3.connection.HTTPConnection)
+
+    class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+        ConnectionCls = timed(urllib3.connection.HTTPSConnection)
+
+    return {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def __init__(self, stats: ClientStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _timed_pool_classes(self._stats)
+
+
+class ZhipuClient:
+    """同步客户端：一个框架实例共享一个Session和连接池"""
+
+    def __init__(self, api_key: str, api_url: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.stats = ClientStats()
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+        adapter = _TimedHTTPAdapter(self.stats, pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post_json(self, payload: Dict) -> Dict:
+        """POST一个请求体并返回解析后的JSON响应"""
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            _raise_for_status(response)
+            return response.json()
+        finally:
+            self.stats.record_request(time.perf_counter() - start)
+
+    def stream_events(self, payload: Dict) -> Iterator[Dict]:
+        """以SSE流式请求（payload需带stream: true），逐个产出data事件解析后的JSON"""
+        start = time.perf_counter()
+        try:
+            with self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=True) as response:
+                _raise_for_status(response)
+                # chunk_size=None：数据到达即处理，不等凑满缓冲区
+                for line in response.iter_lines(chunk_size=None):
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    # [DONE]之后不提前退出，读完整个响应，连接才能放回连接池复用
+                    if data != b"[DONE]":
+                        yield json.loads(data)
+        finally:
+            self.stats.record_request(time.perf_counter() - start)
+
+    def close(self) -> None:
+        self.session.close()
+
@@ -15,11 +15,12 @@ from dotenv import load_dotenv
 try:
     from langextract import extract
     from langextract.core.data import ExampleData, Extraction, FormatType
+    LANGEXTRACT_AVAILABLE = True
+    LANGEXTRACT_IMPORT_ERROR = None
 except ImportError as e:
-    print(f"错误: 无法导入 langextract - {e}")
-    print("请检查安装: pip install langextract")
-    print("Python路径:", sys.path)
-    sys.exit(1)
+    # 允许在未安装langextract时导入本模块（如离线基准回放），运行CLI时再报错退出
+    LANGEXTRACT_AVAILABLE = False
+    LANGEXTRACT_IMPORT_ERROR = e
 
 class MarkdownExtractor:
     """Markdown文档结构化信息提取器"""
@@ -40,8 +41,11 @@ class MarkdownExtractor:
         # 定义提取示例
         self.examples = self._create_examples()
     
-    def _create_examples(self) -> List[ExampleData]:
+    def _create_examples(self) -> List["ExampleData"]:
         """创建提取示例"""
+        if not LANGEXTRACT_AVAILABLE:
+            return []
+        
         examples = []
         
         # 示例1: 标准Markdown标题
@@ -422,6 +426,12 @@ def main():
     
     args = parser.parse_args()
     
+    if not LANGEXTRACT_AVAILABLE:
+        print(f"错误: 无法导入 langextract - {LANGEXTRACT_IMPORT_ERROR}")
+        print("请检查安装: pip install langextract")
+        print("Python路径:", sys.path)
+        sys.exit(1)
+    
     # 处理输入路径
     input_path = Path(args.input_file)
     
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟的智谱AI chat/completions接口
+按提示词中出现的stepN_output识别阶段，返回固定的阶段输出，用于不消耗API额度的测试与基准；
+同时模拟服务端前缀缓存：见过的system消息在usage中计为cached_tokens；
+可按固定间隔返回被截断的JSON，用于测试容错解析与修复请求；
+请求带stream: true时以SSE分块返回，可模拟逐块生成的耗时；
+另提供files/batches接口，模拟批处理任务的上传、执行、轮询与结果下载；
+延迟可按分布随机抽样，可按比例返回500错误，各阶段的固定输出可以替换
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from llm_client import estimate_tokens
+
+API_ROOT = "/api/paas/v4"
+COMPLETIONS_PATH = API_ROOT + "/chat/completions"
+FILES_PATH = API_ROOT + "/files"
+BATCHES_PATH = API_ROOT + "/batches"
+_BATCH_PATH = re.compile(re.escape(BATCHES_PATH) + r'/([\w-]+)')
+_FILE_CONTENT_PATH = re.compile(re.escape(FILES_PATH) + r'/([\w-]+)/content')
+
+_PAGE_TITLE = re.compile(r'page_title: (.+)')
+_JSON_PAGE_TITLE = re.compile(r'"page_title": "([^"]+)"')
+_REPAIR_MARKER = "You repair malformed JSON"
+# 多页合并请求：user消息为"- pages: [...]"，回答为{"results": [...]}
+_PACKED_PAGES = re.compile(r'- pages: (\[.*\])', re.S)
+# 流式返回时每个SSE块包含的字符数
+STREAM_CHUNK_CHARS = 8
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal", "stall")
+# 对数正态分布的形状参数，约0.5时p99大致是中位数的3倍
+_LOGNORMAL_SIGMA = 0.5
+# stall分布：对数正态之外，少数请求卡顿为均值的若干倍（模拟偶发的排队或慢节点）
+_STALL_PROBABILITY = 0.03
+_STALL_FACTOR = 10.0
+
+
+def _multipart_file(content_type: str, body: bytes) -> bytes:
+    """取出multipart/form-data请求中file字段的内容"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True)
+    return b""
+
+
+def detect_stage(prompt_text: str) -> str:
+    """根据提示词识别阶段：后面阶段的提示词会引用前面阶段的输出，因此倒序判断"""
+    if all(f"step{i}_output" in prompt_text for i in (1, 2, 3)):
+        return "fused"
+    for stage in ("step4_output", "step3_output", "step2_output", "step1_output"):
+        if stage in prompt_text:
+            return stage
+    return "unknown"
+
+
+def sample_latency(rng: random.Random, distribution: str, mean: float) -> float:
+    """按分布抽取一次延迟，各分布的均值都是mean"""
+    if mean <= 0 or distribution == "fixed":
+        return max(0.0, mean)
+    if distribution == "uniform":
+        return rng.uniform(0, 2 * mean)
+    if distribution == "exponential":
+        return rng.expovariate(1 / mean)
+    if distribution == "lognormal":
+        return rng.lognormvariate(math.log(mean) - _LOGNORMAL_SIGMA ** 2 / 2, _LOGNORMAL_SIGMA)
+    if distribution == "stall":
+        # 保持总均值为mean：常规部分的均值相应缩小
+        base = mean / (1 + _STALL_PROBABILITY * (_STALL_FACTOR - 1))
+        stalled = rng.random() < _STALL_PROBABILITY
+        return sample_latency(rng, "lognormal", base) * (_STALL_FACTOR if stalled else 1.0)
+    raise ValueError(f"未知的延迟分布: {distribution}")
+
+
+def canned_output(stage: str, prompt_text: str, overrides: Optional[Dict[str, Dict]] = None) -> Dict:
+    """返回该阶段的固定输出；overrides中有该阶段时（键为stepN_output）用它代替内置输出"""
+    if overrides and stage in overrides:
+        return {stage: overrides[stage]}
+    if stage == "step1_output":
+        return {"step1_output": {
+            "layout_choice": "TEMPLATE_BLOCKS",
+            "confidence_score": 0.9,
+            "reasoning": "mock: 内容描述了多个并列的项目，适合用区块模板分别呈现，每个区块对应一个要点。"
+        }}
+    if stage == "step2_output":
+        # 回显输入的页面标题，便于核对输出顺序（修复请求中标题以JSON形式出现）
+        match = _PAGE_TITLE.search(prompt_text) or _JSON_PAGE_TITLE.search(prompt_text)
+        return {"step2_output": {
+            "page_title": match.group(1).strip() if match else "模拟标题",
+            "template_type": "TEMPLATE_BLOCKS",
+            "content": {"content_blocks": [
+                {"sub_heading": "区块一", "content": "内容一"},
+                {"sub_heading": "区块二", "content": "内容二"},
+                {"sub_heading": "区块三", "content": "内容三"}
+            ]}
+        }}
+    if stage == "step3_output":
+        return {"step3_output": {
+            "image_search_keywords": "digital, transformation",
+            "icon_suggestions": [{"item": "区块一", "icon_name": "strategy"}],
+            "layout_constraints": {"content_type": "grid_3x1"},
+            "color_palette_suggestion": "professional_blue_grey"
+        }}
+    if stage == "step4_output":
+        return {"step4_output": {"overall_consistency_score": 0.9, "consistency_issues": []}}
+    if stage == "fused":
+        fused = {}
+        for step in ("step1_output", "step2_output", "step3_output"):
+            fused.update(canned_output(step, prompt_text, overrides))
+        return fused
+    return {}
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """客户端主动断开连接属于正常情况，不打印异常堆栈"""
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockZhipuServer:
+    """在后台线程运行的模拟服务器"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 malformed_every: int = 0, chunk_latency: float = 0.0, batch_delay: float = 0.0,
+                 max_inflight: int = 0, retry_after: float = 1.0, latency_distribution: str = "fixed",
+                 error_rate: float = 0.0, canned: Optional[Dict[str, Dict]] = None, seed: Optional[int] = None,
+                 packed_drop: int = 0):
+        """latency为首个token前的延迟，chunk_latency为每生成一个块（STREAM_CHUNK_CHARS个字符）的耗时；
+        latency_distribution为fixed时每次延迟都是latency，否则按该分布抽样（均值为latency）；
+        error_rate为chat请求返回500的概率；canned为{stepN_output: 输出}，替换对应阶段的固定输出；
+        malformed_every为N时，每第N个阶段请求返回截断的JSON（修复请求总是返回合法JSON）；
+        packed_drop为N时，多页合并请求的回答省略最后N页的结果；
+        batch_delay为批任务从创建到完成的耗时；
+        max_inflight大于0时，同时处理的请求达到该数后新请求返回429，并带Retry-After: retry_after"""
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.malformed_every = malformed_every
+        self.request_count = 0
+        self.stage_request_count = 0
+        self.batch_delay = batch_delay
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.throttled_count = 0
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"未知的延迟分布: {latency_distribution}")
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.error_count = 0
+        self.canned = canned or {}
+        self.packed_drop = packed_drop
+        self.packed_request_count = 0
+        self._rng = random.Random(seed)
+        self._in_flight = 0
+        self.batch_line_count = 0
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Dict] = {}
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+        self._server = _QuietHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self) -> str:
+        return self.base_url + COMPLETIONS_PATH
+
+    @property
+    def batch_base_url(self) -> str:
+        """批处理接口根地址（files、batches所在的路径）"""
+        return self.base_url + API_ROOT
+
+    def complete(self, body: Dict) -> Tuple[str, Dict]:
+        """按请求体生成回答文本与usage，chat/completions与批任务共用"""
+        system_text = "".join(m.get("content", "") for m in body.get("messages", [])
+                              if m.get("role") == "system")
+        prompt_text = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        repair = _REPAIR_MARKER in system_text
+        with self._lock:
+            cached_tokens = estimate_tokens(system_text) if system_text in self._seen_prefixes else 0
+            self._seen_prefixes.add(system_text)
+            malformed = False
+            if not repair:
+                self.stage_request_count += 1
+                malformed = bool(self.malformed_every) and \
+                    self.stage_request_count % self.malformed_every == 0
+
+        if repair:
+            # 修复请求的user消息就是损坏的回答，按其中的stepN_output给出完整输出
+            prompt_text = prompt_text[len(system_text):]
+        stage = detect_stage(prompt_text)
+
+        packed = _PACKED_PAGES.search(prompt_text) if not repair else None
+        if packed:
+            # 按page_index给每页一个该阶段的输出
+            pages = json.loads(packed.group(1))
+            with self._lock:
+                self.packed_request_count += 1
+            results = [{"page_index": page["page_index"],
+                        **canned_output(stage, json.dumps(page, ensure_ascii=False), self.canned)}
+                       for page in pages[:max(0, len(pages) - self.packed_drop)]]
+            content = json.dumps({"results": results}, ensure_ascii=False)
+        else:
+            content = json.dumps(canned_output(stage, prompt_text, self.canned), ensure_ascii=False)
+        if malformed:
+            content = content[:-2]
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt_text),
+            "completion_tokens": estimate_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        return content, usage
+
+    def _store_file(self, data: bytes, purpose: str = "batch") -> Dict:
+        with self._lock:
+            file_id = f"file-{len(self._files) + 1}"
+            self._files[file_id] = data
+        return {"id": file_id, "object": "file", "bytes": len(data), "purpose": purpose}
+
+    def _create_batch(self, request: Dict) -> Dict:
+        with self._lock:
+            batch_id = f"batch-{len(self._batches) + 1}"
+            batch = {"id": batch_id, "object": "batch", "status": "in_progress",
+                     "input_file_id": request["input_file_id"], "endpoint": request.get("endpoint")}
+            self._batches[batch_id] = batch
+            snapshot = dict(batch)
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        return snapshot
+
+    def _run_batch(self, batch_id: str) -> None:
+        """在后台逐行执行批任务，batch_delay秒后才标记为完成"""
+        with self._lock:
+            batch = self._batches[batch_id]
+            lines = self._files[batch["input_file_id"]].decode("utf-8").splitlines()
+        outputs = []
+        for line in lines:
+            request = json.loads(line)
+            content, usage = self.complete(request["body"])
+            outputs.append(json.dumps({"custom_id": request["custom_id"], "response": {
+                "status_code": 200,
+                "body": {"model": request["body"].get("model"), "usage": usage, "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}}
+                ]}
+            }}, ensure_ascii=False))
+        with self._lock:
+            self.batch_line_count += len(lines)
+        if self.batch_delay:
+            time.sleep(self.batch_delay)
+        output_file = self._store_file(("\n".join(outputs) + "\n").encode("utf-8"), purpose="batch_output")
+        with self._lock:
+            batch.update(status="completed", output_file_id=output_file["id"],
+                         request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, value: Dict, status: int = 200) -> None:
+                payload = json.dumps(value, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                match = _BATCH_PATH.fullmatch(self.path) or _FILE_CONTENT_PATH.fullmatch(self.path)
+                if match is None:
+                    self.send_error(404)
+                    return
+                with server._lock:
+                    if self.path.startswith(BATCHES_PATH):
+                        value = server._batches.get(match.group(1))
+                        data = None if value is None else json.dumps(value).encode("utf-8")
+                    else:
+                        data = server._files.get(match.group(1))
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                if self.path == FILES_PATH:
+                    self._send_json(server._store_file(_multipart_file(self.headers["Content-Type"], raw)))
+                    return
+                if self.path == BATCHES_PATH:
+                    self._send_json(server._create_batch(json.loads(raw)))
+                    return
+                if self.path != COMPLETIONS_PATH:
+                    self.send_error(404)
+                    return
+                body = json.loads(raw or b"{}")
+                with server._lock:
+                    server.request_count += 1
+                    throttle = bool(server.max_inflight) and server._in_flight >= server.max_inflight
+                    fail = not throttle and server._rng.random() < server.error_rate
+                    latency = sample_latency(server._rng, server.latency_distribution, server.latency)
+                    if throttle:
+                        server.throttled_count += 1
+                    elif fail:
+                        server.error_count += 1
+                    else:
+                        server._in_flight += 1
+                if fail:
+                    self._send_json({"error": {"code": "500", "message": "mock: 模拟的服务端错误"}}, status=500)
+                    return
+                if throttle:
+                    self.send_response(429)
+                    self.send_header("Retry-After", f"{server.retry_after:g}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                try:
+                    self._complete(body, latency)
+                finally:
+                    with server._lock:
+                        server._in_flight -= 1
+
+            def _complete(self, body: Dict, latency: float) -> None:
+                if latency:
+                    time.sleep(latency)
+                content, usage = server.complete(body)
+                chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+                if body.get("stream"):
+                    self._stream(body.get("model"), chunks, usage)
+                    return
+                if server.chunk_latency:
+                    time.sleep(server.chunk_latency * len(chunks))
+                self._send_json({
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                    "usage": usage,
+                })
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, model: Optional[str], chunks: List[str], usage: Dict) -> None:
+                """以分块传输编码发送SSE事件，最后一个事件带usage"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, chunk in enumerate(chunks):
+                        if server.chunk_latency:
+                            time.sleep(server.chunk_latency)
+                        event = {"model": model, "choices": [{"index": 0, "delta": {"content": chunk}}]}
+                        if i == len(chunks) - 1:
+                            event["usage"] = usage
+                        self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端中途断开（如对冲请求中落后的一方被取消）
+                    self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "MockZhipuServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockZhipuServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的智谱AI接口')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口（默认8765）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求首个token前的延迟秒数')
+    parser.add_argument('--max-inflight', type=int, default=0, help='同时处理的请求上限，超出返回429（默认不限）')
+    parser.add_argument('--chunk-latency', type=float, default=0.0, help='每生成一个流式块的耗时秒数')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='fixed',
+                        help='延迟分布（默认fixed，其余分布的均值为--latency）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='chat请求返回500的概率（默认0）')
+    parser.add_argument('--canned', help='替换固定输出的JSON文件：{"step1_output": {...}, ...}，键为阶段，值为该阶段的输出')
+
+    args = parser.parse_args()
+    canned = None
+    if args.canned:
+        with open(args.canned, 'r', encoding='utf-8') as f:
+            canned = json.load(f)
+    server = MockZhipuServer(args.host, args.port, args.latency, chunk_latency=args.chunk_latency,
+                             max_inflight=args.max_inflight, latency_distribution=args.latency_distribution,
+                             error_rate=args.error_rate, canned=canned)
+    print(f"模拟服务器已启动: {server.api_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按阶段的模型与max_tokens路由
+阶段1、3这类只返回很小JSON的分类型阶段走快模型并收紧max_tokens，阶段2走更强的模型；
+配置了多个接口地址时，按各地址在该阶段最近的延迟选择最快的一个
+"""
+
+import random
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+DEFAULT_MODEL = "glm-4.5-flash"
+STRONG_MODEL = "glm-4.5-air"
+DEFAULT_MAX_TOKENS = 2000
+
+# 路由策略：阶段 -> {"model", "max_tokens"}，未列出的阶段使用默认模型与默认上限
+ROUTING_POLICIES: Dict[str, Dict[str, Dict]] = {
+    # 所有阶段使用同一模型与上限
+    "uniform": {},
+    # 分类型阶段走快模型并收紧上限（留出思考过程的余量），内容结构化与融合请求走强模型
+    "tiered": {
+        "stage1": {"model": DEFAULT_MODEL, "max_tokens": 600},
+        "stage2": {"model": STRONG_MODEL, "max_tokens": 2000},
+        "stage3": {"model": DEFAULT_MODEL, "max_tokens": 1000},
+        "stage4": {"model": DEFAULT_MODEL, "max_tokens": 1500},
+        "fused": {"model": STRONG_MODEL, "max_tokens": 3000},
+    },
+}
+DEFAULT_POLICY = "uniform"
+# 多页合并请求的阶段名后缀（如stage1_packed），未单独配置时沿用原阶段的模型与上限
+PACKED_SUFFIX = "_packed"
+
+# 选择接口地址时以该概率随机试探，使一度变慢的地址有机会恢复
+_EXPLORE_RATE = 0.05
+_EWMA_ALPHA = 0.3
+# 请求失败（含429）时按该倍数抬高该地址的延迟估计
+_FAILURE_PENALTY = 2.0
+
+
+def parse_stage_settings(values: Optional[List[str]], cast=str) -> Dict:
+    """解析命令行的 STAGE=VALUE 列表，如 ["stage2=glm-4.5", "stage1=400"]"""
+    settings = {}
+    for item in values or []:
+        stage, sep, value = item.partition("=")
+        if not sep or not stage.strip() or not value.strip():
+            raise ValueError(f"格式应为 STAGE=VALUE: {item}")
+        settings[stage.strip()] = cast(value.strip())
+    return settings
+
+
+class ModelRouter:
+    """按阶段给出模型与max_tokens，并记录各接口地址按阶段的延迟滑动平均"""
+
+    def __init__(self, policy: str = DEFAULT_POLICY, models: Optional[Dict[str, str]] = None,
+                 max_tokens: Optional[Dict[str, int]] = None, default_model: str = DEFAULT_MODEL,
+                 default_max_tokens: int = DEFAULT_MAX_TOKENS):
+        """models/max_tokens为按阶段的覆盖设置，优先于策略"""
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}")
+        self.policy = policy
+        self.default_model = default_model
+        self.default_max_tokens = default_max_tokens
+        self._routes: Dict[str, Dict] = {stage: dict(route) for stage, route in ROUTING_POLICIES[policy].items()}
+        for stage, model in (models or {}).items():
+            self._routes.setdefault(stage, {})["model"] = model
+        for stage, limit in (max_tokens or {}).items():
+            self._routes.setdefault(stage, {})["max_tokens"] = limit
+
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, str], float] = {}
+        self._probing: Set[Tuple[str, str]] = set()
+        self._calls: Dict[str, int] = {}
+        self._failures: Dict[str, int] = {}
+
+    def route(self, stage: str) -> Dict:
+        """返回该阶段的 {"model", "max_tokens"}"""
+        route = self._routes.get(stage)
+        if route is None and stage.endswith(PACKED_SUFFIX):
+            route = self._routes.get(stage[:-len(PACKED_SUFFIX)])
+        route = route or {}
+        return {
+            "model": route.get("model", self.default_model),
+            "max_tokens": route.get("max_tokens", self.default_max_tokens),
+        }
+
+    def choose_endpoint(self, stage: str, endpoints: List[str]) -> str:
+        """选该阶段最近延迟最低的地址；还没有样本的地址优先试用，每个地址同时只试探一次"""
+        if len(endpoints) == 1:
+            return endpoints[0]
+        with self._lock:
+            untried = [url for url in endpoints
+                       if (url, stage) not in self._latency and (url, stage) not in self._probing]
+            if untried:
+                self._probing.add((untried[0], stage))
+                return untried[0]
+            known = [url for url in endpoints if (url, stage) in self._latency]
+            if not known or random.random() < _EXPLORE_RATE:
+                return random.choice(endpoints)
+            return min(known, key=lambda url: self._latency[(url, stage)])
+
+    def record(self, endpoint: str, stage: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            key = (endpoint, stage)
+            self._probing.discard(key)
+            previous = self._latency.get(key)
+            if not ok:
+                self._failures[endpoint] = self._failures.get(endpoint, 0) + 1
+                self._latency[key] = max(seconds, (previous or seconds) * _FAILURE_PENALTY)
+                return
+            self._calls[endpoint] = self._calls.get(endpoint, 0) + 1
+            self._latency[key] = seconds if previous is None else previous + _EWMA_ALPHA * (seconds - previous)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            endpoints = sorted({url for url, _ in self._latency} | set(self._calls))
+            return {
+                "policy": self.policy,
+                "routes": {stage: self.route(stage) for stage in ("stage1", "stage2", "stage3", "stage4", "fused")},
+                "endpoints": {
+                    url: {
+                        "calls": self._calls.get(url, 0),
+                        "failures": self._failures.get(url, 0),
+                        "latency": {stage: round(seconds, 3)
+                                    for (u, stage), seconds in sorted(self._latency.items()) if u == url},
+                    }
+                    for url in endpoints
+                },
+            }
+
+    def report(self) -> str:
+        s = self.snapshot()
+        routes = "，".join(f"{stage} {r['model']}/{r['max_tokens']}" for stage, r in s["routes"].items())
+        lines = [f"模型路由（{s['policy']}）: {routes}"]
+        if len(s["endpoints"]) > 1:
+            for url, e in s["endpoints"].items():
+                latency = " ".join(f"{stage} {seconds:.2f}s" for stage, seconds in e["latency"].items())
+                lines.append(f"  {url}: 请求 {e['calls']} 次，失败 {e['failures']} 次，最近延迟 {latency}")
+        return "\n".join(lines)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+紧凑的标题大纲结构
+用并行数组保存级别、父节点、子树结束位置和原文行号，子树范围O(1)可得；
+全部标题文本拼接在一个字符串里，按结束位置数组切出，不为每个标题单独保存字符串对象
+"""
+
+import io
+import json
+import re
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# extract_toc输出的目录行：按两个空格缩进一级，形如 "  - [标题](#锚点)"
+_TOC_LINE = re.compile(r'^( *)- \[(.+)\]\(#[^)]*\)\s*$')
+_MARKDOWN_HEADING = re.compile(r'^(#+)\s+(.+)$')
+
+
+class OutlineNode:
+    """大纲中某个标题的轻量视图，不复制任何数据"""
+
+    __slots__ = ('outline', 'index')
+
+    def __init__(self, outline: 'Outline', index: int):
+        self.outline = outline
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self.outline.text(self.index)
+
+    @property
+    def level(self) -> int:
+        return self.outline.levels[self.index]
+
+    @property
+    def offset(self) -> Optional[int]:
+        offset = self.outline.offsets[self.index]
+        return None if offset < 0 else offset
+
+    @property
+    def parent(self) -> Optional['OutlineNode']:
+        parent = self.outline.parents[self.index]
+        return None if parent < 0 else OutlineNode(self.outline, parent)
+
+    @property
+    def subtree(self) -> range:
+        """自身及所有后代的下标范围"""
+        return self.outline.subtree(self.index)
+
+    def children(self) -> Iterator['OutlineNode']:
+        return self.outline.children(self.index)
+
+    def __repr__(self) -> str:
+        return f"OutlineNode({self.index}, level={self.level}, text={self.text!r})"
+
+
+class Outline:
+    """按文档顺序存储的标题树
+
+    parents[i]为父节点下标（顶层为-1），ends[i]为子树结束的下一个下标，
+    因此节点i的整棵子树就是range(i, ends[i])。offsets[i]为原文行号，未知时为-1。
+    标题i的文本为_buffer[text_ends[i-1]:text_ends[i]]。
+    """
+
+    __slots__ = ('_buffer', 'text_ends', 'levels', 'parents', 'ends', 'offsets')
+
+    def __init__(self, entries: Iterable[Tuple[str, int, Optional[int]]] = ()):
+        buffer = io.StringIO()
+        self.text_ends = array('L')
+        self.levels = array('B')
+        self.parents = array('i')
+        self.ends = array('i')
+        self.offsets = array('i')
+
+        stack: List[int] = []
+        text_end = 0
+        for text, level, offset in entries:
+            index = len(self.levels)
+            # 弹出级别不低于当前标题的节点，它们的子树在此结束
+            while stack and self.levels[stack[-1]] >= level:
+                self.ends[stack.pop()] = index
+            buffer.write(text)
+            text_end += len(text)
+            self.text_ends.append(text_end)
+            self.levels.append(level)
+            self.parents.append(stack[-1] if stack else -1)
+            self.ends.append(index + 1)
+            self.offsets.append(-1 if offset is None else offset)
+            stack.append(index)
+        for index in stack:
+            self.ends[index] = len(self.levels)
+        self._buffer = buffer.getvalue()
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def text(self, index: int) -> str:
+        start = self.text_ends[index - 1] if index > 0 else 0
+        return self._buffer[start:self.text_ends[index]]
+
+    def iter_texts(self) -> Iterator[str]:
+        start = 0
+        for end in self.text_ends:
+            yield self._buffer[start:end]
+            start = end
+
+    @property
+    def texts(self) -> List[str]:
+        """全部标题文本（每次调用新建列表）"""
+        return list(self.iter_texts())
+
+    def __getitem__(self, index: int) -> OutlineNode:
+        if not -len(self) <= index < len(self):
+            raise IndexError("大纲下标越界")
+        return OutlineNode(self, index % len(self))
+
+    def __iter__(self) -> Iterator[OutlineNode]:
+        for index in range(len(self)):
+            yield OutlineNode(self, index)
+
+    def subtree(self, index: int) -> range:
+        """节点index自身及所有后代的下标范围"""
+        return range(index, self.ends[index])
+
+    def children(self, index: int) -> Iterator[OutlineNode]:
+        """直接子节点：从index+1开始按子树结束位置跳跃"""
+        child = index + 1
+        end = self.ends[index]
+        while child < end:
+            yield OutlineNode(self, child)
+            child = self.ends[child]
+
+    def roots(self) -> Iterator[OutlineNode]:
+        child = 0
+        while child < len(self):
+            yield OutlineNode(self, child)
+            child = self.ends[child]
+
+    def to_headings(self) -> List[Dict]:
+        """还原为提取器使用的[{'text', 'level'}]列表"""
+        return [{'text': text, 'level': level} for text, level in zip(self.iter_texts(), self.levels)]
+
+    def to_markdown(self) -> str:
+        return "\n".join(f"{'#' * level} {text}" for text, level in zip(self.iter_texts(), self.levels))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """按列序列化，父节点和子树范围可由级别重建，因此不写出"""
+        return {
+            'text': self.texts,
+            'level': self.levels.tolist(),
+            'offset': self.offsets.tolist(),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Outline':
+        offsets = data.get('offset') or [-1] * len(data['text'])
+        return cls(
+            (text, level, None if offset < 0 else offset)
+            for text, level, offset in zip(data['text'], data['level'], offsets)
+        )
+
+    @classmethod
+    def from_json(cls, payload: str) -> 'Outline':
+        return cls.from_dict(json.loads(payload))
+
+    @classmethod
+    def from_headings(cls, headings: Iterable[Dict],
+                      offsets: Optional[Iterable[Optional[int]]] = None) -> 'Outline':
+        """从UniversalExtractor / SimpleMarkdownExtractor的标题列表构建"""
+        headings = list(headings)
+        offsets = list(offsets) if offsets is not None else [None] * len(headings)
+        return cls(
+            (h['text'], int(h['level']), offset)
+            for h, offset in zip(headings, offsets)
+        )
+
+    @classmethod
+    def from_md2top(cls, structured_data: Dict[str, Any]) -> 'Outline':
+        """从md2top的结构化JSON（headings中level为字符串）构建"""
+        return cls(
+            (h['text'], int(h.get('attributes', {}).get('level', '1')), None)
+            for h in structured_data.get('headings', [])
+        )
+
+    @classmethod
+    def from_markdown(cls, markdown: str) -> 'Outline':
+        """从"# 标题"形式的大纲（如md2top的-top.md输出）构建，偏移为行号"""
+        entries = []
+        for line_no, line in enumerate(markdown.split('\n')):
+            match = _MARKDOWN_HEADING.match(line.strip())
+            if match:
+                entries.append((match.group(2).strip(), len(match.group(1)), line_no))
+        return cls(entries)
+
+    @classmethod
+    def from_toc(cls, toc: str) -> 'Outline':
+        """从doc2md的extract_toc输出构建"""
+        entries = []
+        for line in toc.split('\n'):
+            match = _TOC_LINE.match(line)
+            if match:
+                entries.append((match.group(2), len(match.group(1)) // 2 + 1, None))
+        return cls(entries)
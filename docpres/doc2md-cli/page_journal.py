@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ppt2design逐页结果日志（NDJSON）
+每完成一页立即追加一行并fsync，进程中途崩溃后可用--resume跳过已完成的页面
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+def page_key(page: Dict) -> str:
+    """页面输入的指纹：续跑时输入被修改过的页面会重新处理"""
+    text = json.dumps([page.get("title"), page.get("content")], ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageJournal:
+    """每行一条记录: {"page_index", "page_key", "result"}，只记录阶段1-3成功的页面
+
+    内存中只保留续跑时读到的各页指纹与该行在文件中的位置，结果在需要时再从文件读出；
+    本次运行新写入的结果不在内存中保留，上万页的演示文稿内存占用也保持平稳。
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # 页码 -> (page_key, 该行的字节偏移)
+        self._offsets: Dict[int, Tuple[str, int]] = {}
+        if resume and self.path.exists():
+            self._load()
+        else:
+            self.path.write_bytes(b"")
+        self._reader = open(self.path, "rb") if self._offsets else None
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self) -> None:
+        data = self.path.read_bytes()
+        # 崩溃时最后一行可能只写了一半，截掉它，避免后续追加的记录与之粘连
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            os.truncate(self.path, len(complete))
+        offset = 0
+        for line in complete.splitlines(keepends=True):
+            try:
+                record = json.loads(line)
+                self._offsets[record["page_index"]] = (record["page_key"], offset)
+            except (ValueError, KeyError, TypeError):
+                pass
+            offset += len(line)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def completed(self, index: int, page: Dict) -> Optional[Dict]:
+        """返回该页在续跑前已记录的结果；未记录或输入已变化时返回None"""
+        entry = self._offsets.get(index)
+        if entry is None or entry[0] != page_key(page):
+            return None
+        with self._lock:
+            self._reader.seek(entry[1])
+            line = self._reader.readline()
+        return json.loads(line)["result"]
+
+    def append(self, index: int, page: Dict, result: Dict) -> None:
+        record = {"page_index": index, "page_key": page_key(page), "result": result}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        self._file.close()
+
+    def __enter__(self) -> "PageJournal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
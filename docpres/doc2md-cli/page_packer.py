@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+短页面微批处理
+各页面线程提交同一阶段的请求元素，凑满max_items个或等待max_wait秒后由第一个提交的线程
+把整组合成一次请求发出，再把各元素的结果分发回各自的线程；
+调用方登记在途页面数时，所有正在运行的页面都已在组内等待（不会再有元素到达）就立即发送，不等满max_wait
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_PACK_SIZE = 4
+# 第一个元素到达后最多等待的秒数；并发页面的同一阶段通常在这段时间内先后到达
+DEFAULT_PACK_WAIT = 0.2
+
+
+class _PackGroup:
+    def __init__(self):
+        self.items: List[Any] = []
+        self.results: List[Optional[Dict]] = []
+        self.closed = False
+        self.done = threading.Event()
+
+
+class PagePacker:
+    """send(stage, items)返回与items等长的结果列表，无法得到合法结果的元素为None"""
+
+    def __init__(self, send: Callable[[str, List[Any]], List[Optional[Dict]]],
+                 max_items: int = DEFAULT_PACK_SIZE, max_wait: float = DEFAULT_PACK_WAIT,
+                 workers: int = 1):
+        """workers为同时运行的页面数上限（页面线程池大小）"""
+        if max_items < 2:
+            raise ValueError("max_items至少为2")
+        self._send = send
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        self.early_flushes = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._open: Dict[str, _PackGroup] = {}
+        # 已提交且未结束的页面数（含排队中的页面），以及仍在未关闭的组内等待的元素数
+        self._pages = 0
+        self._waiting = 0
+
+    def add_pages(self, count: int = 1) -> None:
+        """登记新提交到页面线程池的页面"""
+        with self._lock:
+            self._pages += count
+
+    def page_done(self) -> None:
+        """页面结束（含失败与取消），可能使正在等待的组不再有新元素可等"""
+        with self._lock:
+            self._pages = max(0, self._pages - 1)
+            self._changed.notify_all()
+
+    def _stalled(self) -> bool:
+        # 正在运行的页面全部在组内等待时，不会再有元素到达任何一组；未登记页面时只按超时发送
+        return self._pages > 0 and self._waiting >= min(self.workers, self._pages)
+
+    def _close(self, stage: str, group: _PackGroup) -> None:
+        if self._open.get(stage) is group:
+            del self._open[stage]
+        if not group.closed:
+            group.closed = True
+            self._waiting -= len(group.items)
+
+    def submit(self, stage: str, item: Any) -> Optional[Dict]:
+        """阻塞到该元素所在的组发送完成，返回该元素的结果（None表示需要单独重试）"""
+        with self._lock:
+            group = self._open.get(stage)
+            leader = group is None
+            if leader:
+                group = self._open[stage] = _PackGroup()
+            slot = len(group.items)
+            group.items.append(item)
+            self._waiting += 1
+            if len(group.items) >= self.max_items:
+                self._close(stage, group)
+            self._changed.notify_all()
+
+        if not leader:
+            group.done.wait()
+            return group.results[slot]
+
+        with self._lock:
+            self._changed.wait_for(lambda: group.closed or self._stalled(), self.max_wait)
+            if not group.closed and self._stalled():
+                self.early_flushes += 1
+            # 未凑满时关闭该组，之后到达的元素进入新的一组
+            self._close(stage, group)
+        try:
+            group.results = self._send(stage, group.items)
+        except Exception as e:
+            print(f"{stage}合并请求失败: {e}")
+            group.results = [None] * len(group.items)
+        finally:
+            group.done.set()
+        return group.results[slot]
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ppt2design输入的流式读取
+JSON（{"pages": [...]}或顶层数组）逐个元素增量解码，NDJSON逐行读取，文本格式支持多条
+document_title/page_data记录；都以迭代器逐页产出，上万页的输入内存占用也保持平稳
+"""
+
+import json
+from typing import Dict, Iterator, TextIO
+
+CHUNK_SIZE = 1 << 16
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+_WHITESPACE = " \t\r\n"
+
+
+class _JsonStream:
+    """在按块读入的缓冲区上逐个解码JSON值，已消费的部分随时丢弃"""
+
+    def __init__(self, f: TextIO):
+        self._file = f
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符（不消费）；文件结束时返回空串"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"JSON格式错误: 期望 {chars!r}，实际为 {char!r}")
+        self._pos += 1
+        return char
+
+    def value(self):
+        """解码下一个完整的JSON值；值恰好在缓冲区末尾结束时再读一块确认（数字可能还没读完）"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def array(self) -> Iterator:
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json_pages(f: TextIO) -> Iterator[Dict]:
+    """{"pages": [...]}或顶层数组；pages之外的键整体解码后丢弃"""
+    stream = _JsonStream(f)
+    if stream.peek() == "[":
+        yield from stream.array()
+        return
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "pages":
+            yield from stream.array()
+        else:
+            stream.value()
+        if stream.expect(",}") == "}":
+            return
+
+
+def iter_ndjson_pages(f: TextIO) -> Iterator[Dict]:
+    """每行一个页面对象，空行跳过"""
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"第{line_number}行不是合法JSON: {e}")
+
+
+def iter_text_pages(f: TextIO) -> Iterator[Dict]:
+    """文本格式：每条记录以document_title:开始，page_data:之后直到下一条记录的各行都是页面内容"""
+    title = None
+    data = None
+
+    def record():
+        content = "\n".join(data).strip() if data is not None else ""
+        if title and content:
+            return {"title": title, "content": content}
+        print(f"跳过不完整的记录: {title or '(无标题)'}")
+        return None
+
+    for line in f:
+        line = line.rstrip("\r\n")
+        if line.startswith("document_title:"):
+            if title is not None or data is not None:
+                page = record()
+                if page is not None:
+                    yield page
+            title = line[len("document_title:"):].strip()
+            data = None
+        elif line.startswith("page_data:"):
+            data = [line[len("page_data:"):].strip()]
+        elif data is not None:
+            data.append(line)
+    if title is not None or data is not None:
+        page = record()
+        if page is not None:
+            yield page
+
+
+def iter_pages(path: str) -> Iterator[Dict]:
+    """按扩展名选择读取方式：.txt为文本格式，.ndjson/.jsonl为NDJSON，其余按JSON处理"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".txt"):
+            yield from iter_text_pages(f)
+        elif path.endswith(NDJSON_SUFFIXES):
+            yield from iter_ndjson_pages(f)
+        else:
+            yield from iter_json_pages(f)
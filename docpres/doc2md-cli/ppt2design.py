@@ -6,27 +6,215 @@
 基于JSON数据合同的四阶段PPT设计流程
 """
 
+import copy
 import json
 import argparse
 import sys
+import itertools
 import os
-import requests
-from typing import Dict, List, Any, Optional
+import textwrap
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Any, Optional, TextIO, Tuple, TypeVar
+
+from llm_client import (ZhipuClient, DEFAULT_CONNECT_TIMEOUT,
+                        DEFAULT_READ_TIMEOUT, StreamingFieldParser, estimate_tokens, try_parse_json)
+from dedup_index import DedupIndex, DEFAULT_DEDUP_INDEX, DEFAULT_DEDUP_THRESHOLD
+from batch_client import (BatchClient, BATCH_ENDPOINT, DEFAULT_BATCH_BASE_URL,
+                          DEFAULT_POLL_INTERVAL)
+from layout_classifier import LayoutClassifier, DEFAULT_LAYOUT_THRESHOLD
+from model_router import ModelRouter, ROUTING_POLICIES, DEFAULT_POLICY, PACKED_SUFFIX, parse_stage_settings
+from page_journal import PageJournal
+from page_packer import PagePacker, DEFAULT_PACK_SIZE, DEFAULT_PACK_WAIT
+from page_reader import iter_pages, iter_text_pages
+from qc_engine import consistency_score, flow_concerns, flow_review_pages, local_quality_issues
+from rate_limiter import RateLimiter, DEFAULT_MAX_RETRIES
+from stage_cache import StageCache, make_cache_key, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+
+DEFAULT_API_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+
+T = TypeVar("T")
+
+# 对冲请求：某阶段最近的请求耗时样本达到该数后才启用，超过其p90仍未返回时再发一个相同请求
+HEDGE_PERCENTILE = 0.9
+_HEDGE_MIN_SAMPLES = 20
+_HEDGE_WINDOW = 200
+# 内存中保留的单页耗时记录数，常驻服务处理多个任务时不随页数增长
+_TIMING_WINDOW = 1000
+
+
+class HedgeCancelled(Exception):
+    """对冲请求中落后的一方被取消"""
+
+
+# 同时处理的页面数
+DEFAULT_CONCURRENCY = 4
+
+# 合并请求：user消息不超过该字符数的阶段1/阶段3请求才与其他页面合并
+DEFAULT_PACK_MAX_CHARS = 800
+
+# 各阶段提示词模板的版本号，修改提示词时递增，使旧的缓存结果失效
+PROMPT_VERSIONS = {
+    "stage1": 2,
+    "stage2": 2,
+    "stage3": 2,
+    "stage4": 3,
+    "fused": 2,
+}
+
+# 修复请求的system消息：只把无法解析的回答原样发回，要求模型给出合法JSON
+REPAIR_SYSTEM_MESSAGE = """You repair malformed JSON. The user message is a JSON object that failed to parse (it may be truncated, contain comments, unescaped quotes or surrounding text). Respond with only the corrected, valid JSON object, keeping all keys and values that are present."""
+
+# 阶段一/三提示词中的模板目录与版式ID清单，融合模式复用同一份文本
+TEMPLATE_CATALOG = """- TEMPLATE_SUMMARY: Use for content that can be distilled into a few key, distinct points or takeaways.
+- TEMPLATE_BLOCKS: Use for content that describes several parallel items, such as different products, features, or categories.
+- TEMPLATE_FLOW: Use for content that describes a sequence, process, timeline, or series of steps.
+- TEMPLATE_COMPARE: Use for content that explicitly or implicitly compares two or more items (e.g., pros/cons, before/after, problem/solution).
+- TEMPLATE_DATA: Use for content that is heavily focused on numbers, percentages, trends, or requires a chart/graph for effective communication.
+- TEMPLATE_CONCEPTUAL_MODEL: Use for abstract, strategic content that fits a known consulting model (e.g., 4-quadrant matrix, SWOT, pyramid, cycle)."""
+
+LAYOUT_CATALOG = """- For lists: `vertical_list`, `horizontal_list`
+- For blocks: `grid_2x2`, `grid_3x1`, `cards_freeform`
+- For comparisons: `table_compare`, `side_by_side_panels`
+- For flows: `horizontal_timeline`, `vertical_steps`, `circular_flow`
+- For models: `quadrant_diagram_with_arrows`, `pyramid_diagram`, `swot_matrix`"""
+
+STEP1_SCHEMA = """"step1_output": {
+    "layout_choice": "string",
+    "confidence_score": "float (0.0 to 1.0)",
+    "reasoning": "string"
+  }"""
+
+STEP3_SCHEMA = """"step3_output": {
+    "image_search_keywords": "string (comma-separated)",
+    "icon_suggestions": [
+      {
+        "item": "string (matches a sub_heading or key point)",
+        "icon_name": "string (comma-separated, e.g., 'strategy, brain, lightbulb')"
+      }
+    ],
+    "layout_constraints": {
+      "content_type": "string (one of the specified layout IDs)",
+      "axis_labels": { 
+        "x_axis": "string (optional)",
+        "y_axis": "string (optional)"
+      },
+      "path_flow": "string (optional, e.g., '1 -> 2, 1 -> 3, 2&3 -> 4')"
+    },
+    "color_palette_suggestion": "string (e.g., 'professional_blue_grey', 'vibrant_tech_green')"
+  }"""
+
+def count_items(step2_output: Dict) -> int:
+    """阶段2内容中条目列表（content_blocks或key_points等）的长度"""
+    content = step2_output.get("content", {})
+    lists = [value for value in content.values() if isinstance(value, list)] if isinstance(content, dict) else []
+    return len(lists[0]) if lists else 0
+
 
 class PPTDesignFramework:
     """四阶段AI演示文稿设计框架主类"""
     
-    def __init__(self, api_key: str):
-        """初始化框架"""
+    def __init__(self, api_key: str, api_url: Optional[str] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, pool_size: Optional[int] = None,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 fused: bool = False, cache: Optional[StageCache] = None,
+                 layout_threshold: Optional[float] = None, stream: bool = False,
+                 rate_limiter: Optional[RateLimiter] = None, router: Optional[ModelRouter] = None,
+                 endpoints: Optional[List[str]] = None, hedge_budget: float = 0.0,
+                 dedup_index: Optional[DedupIndex] = None, pack_size: int = 0,
+                 pack_max_chars: int = DEFAULT_PACK_MAX_CHARS, pack_wait: float = DEFAULT_PACK_WAIT):
+        """初始化框架；fused为True时每页先尝试一次请求完成阶段1-3，cache为None时不缓存
+        
+        layout_threshold不为None时先用本地分类器选布局，本地得分达到阈值的页面不再请求阶段1（结果带source标记）。
+        stream为True时以SSE流式接收回答，阶段1的layout_choice一解析出来就开始阶段2。
+        rate_limiter可在多个框架实例间共享；为None时创建一个不限RPM/TPM、只做429重试与AIMD并发调整的限流器。
+        router决定各阶段的模型与max_tokens，为None时所有阶段使用默认模型；
+        endpoints为api_url之外的备选接口地址，每次请求选该阶段最近延迟最低的地址。
+        hedge_budget大于0时启用对冲请求，额外请求数不超过请求数的该比例（如0.1即10%）。
+        dedup_index不为None时，内容与已设计页面近似重复的页面复用其阶段输出。
+        pack_size大于1时，短页面的阶段1/阶段3请求最多pack_size个合并为一次请求，无效的元素单独重试。
+        """
         self.api_key = api_key
-        self.model_name = "glm-4.5-flash"
+        self.router = router or ModelRouter()
+        self.model_name = self.router.default_model
+        self.temperature = 0.3
+        self.max_tokens = self.router.default_max_tokens
+        self.cache = cache
         # 使用智谱AI API
-        self.api_url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+        self.api_url = api_url or DEFAULT_API_URL
+        self.concurrency = max(1, concurrency)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_key}"
         }
         
+        # 框架实例独占的keep-alive连接池，连接数默认与并发页数一致；
+        # 流式模式下每页可能同时占用两个连接（阶段1剩余部分与阶段2），对冲时每个请求可能有两份在途
+        self.stream = stream
+        self.pool_size = pool_size or self.concurrency * (2 if stream else 1) * (2 if hedge_budget > 0 else 1)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.endpoints = [self.api_url] + [url for url in endpoints or [] if url != self.api_url]
+        self.clients = {
+            url: ZhipuClient(api_key, url, pool_size=self.pool_size,
+                             connect_timeout=connect_timeout, read_timeout=read_timeout)
+            for url in self.endpoints
+        }
+        # 主接口地址的客户端，连接统计以它为准
+        self.client = self.clients[self.api_url]
+        # 所有阶段、所有并发页面的请求都经过同一个限流器
+        self.rate_limiter = rate_limiter or RateLimiter(max_concurrency=self.pool_size)
+        
+        self.fused = fused
+        # 按阶段累计的调用次数与token用量（来自接口返回的usage）
+        self._usage_lock = threading.Lock()
+        self.usage: Dict[str, Dict[str, int]] = {}
+        # 按阶段记录最近_HEDGE_WINDOW次请求的耗时（含限流排队与429重试），以及解析回答JSON的累计耗时
+        self.call_latencies: Dict[str, Deque[float]] = {}
+        self.parse_seconds = 0.0
+        # 融合模式下校验失败、退回分阶段处理的页数
+        self.fused_fallbacks = 0
+        
+        self.layout_threshold = layout_threshold
+        self.layout_classifier = LayoutClassifier() if layout_threshold is not None else None
+        # 由本地分类器决定布局、省掉阶段1请求的页数
+        self.local_layouts = 0
+        
+        # JSON修复请求成功/失败次数，以及因回答无法解析而丢失的页数
+        self.parse_repairs = 0
+        self.parse_failures = 0
+        self.pages_lost_to_parse = 0
+        self._page_state = threading.local()
+        
+        # 最近_TIMING_WINDOW页从开始到阶段2请求发出的耗时与阶段1-3总耗时
+        self.page_timings: Deque[Dict] = deque(maxlen=_TIMING_WINDOW)
+        # 流式模式下在后台继续接收阶段1剩余回答的线程池
+        self._stream_pool = ThreadPoolExecutor(max_workers=self.concurrency) if stream else None
+        
+        # 近似重复页面：完全复用阶段1-3的页数，以及复用部分阶段的页数
+        self.dedup_index = dedup_index
+        self.dedup_reused = 0
+        self.dedup_partial = 0
+        
+        # 对冲请求：每个请求最多同时有两份在途
+        self.hedge_budget = hedge_budget
+        self._hedge_pool = ThreadPoolExecutor(max_workers=self.pool_size * 2) if hedge_budget > 0 else None
+        self.hedge_eligible = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        
+        # 合并请求：发出的合并请求数、由合并请求得到合法结果的页数、合并结果无效而单独重试的页数
+        self.pack_size = pack_size
+        self.pack_max_chars = pack_max_chars
+        self.packer = PagePacker(self._send_packed, pack_size, pack_wait,
+                                 workers=self.concurrency) if pack_size > 1 else None
+        self.packed_requests = 0
+        self.packed_pages = 0
+        self.pack_retries = 0
+        
         # 检查API密钥格式
         if not api_key or '.' not in api_key:
             print("警告: 智谱AI API密钥格式可能不正确，应该包含点号分隔符")
@@ -41,90 +229,8 @@ class PPTDesignFramework:
             "TEMPLATE_CONCEPTUAL_MODEL": "概念模型模板 - 用于抽象的战略内容"
         }
         
-        # 布局类型定义
-        self.layout_types = {
-            "vertical_list": "垂直列表",
-            "horizontal_list": "水平列表",
-            "grid_2x2": "2x2网格",
-            "grid_3x1": "3x1网格", 
-            "cards_freeform": "自由卡片布局",
-            "table_compare": "表格比较",
-            "side_by_side_panels": "并排面板",
-            "horizontal_timeline": "水平时间线",
-            "vertical_steps": "垂直步骤",
-            "circular_flow": "循环流程",
-            "quadrant_diagram_with_arrows": "带箭头的四象限图",
-            "pyramid_diagram": "金字塔图",
-            "swot_matrix": "SWOT矩阵"
-        }
-    
-    def call_llm(self, prompt: str, system_message: str) -> Dict:
-        """调用智谱AI API"""
-        try:
-            data = {
-                "model": self.model_name,
-                "messages": [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.3,
-                "max_tokens": 2000
-            }
-            
-            response = requests.post(self.api_url, headers=self.headers, json=data, timeout=300)
-            response.raise_for_status()
-            
-            result = response.json()
-            content = result['choices'][0]['message']['content'].strip()
-            
-            # 提取JSON内容
-            if content.startswith('```json'):
-                content = content[7:-3].strip()
-            elif content.startswith('```'):
-                content = content[3:-3].strip()
-                
-            return json.loads(content)
-            
-        except Exception as e:
-            print(f"智谱AI API调用错误: {e}")
-            return {}
-    
-    def stage1_strategy_layout(self, page_title: str, reference_content: str) -> Dict:
-        """阶段一：策略与布局选择"""
-        system_message = """You are a Senior Presentation Strategist. Your expertise lies in analyzing raw text to determine the most effective visual and structural way to present it on a slide."""
-        
-        prompt = f"""
-Analyze the provided `page_title` and `reference_content`. Based on your analysis, you must select the single most suitable layout template from the list below. You must also provide a confidence score for your choice and a brief reasoning.
-
-AVAILABLE TEMPLATES:
-- TEMPLATE_SUMMARY: Use for content that can be distilled into a few key, distinct points or takeaways.
-- TEMPLATE_BLOCKS: Use for content that describes several parallel items, such as different products, features, or categories.
-- TEMPLATE_FLOW: Use for content that describes a sequence, process, timeline, or series of steps.
-- TEMPLATE_COMPARE: Use for content that explicitly or implicitly compares two or more items (e.g., pros/cons, before/after, problem/solution).
-- TEMPLATE_DATA: Use for content that is heavily focused on numbers, percentages, trends, or requires a chart/graph for effective communication.
-- TEMPLATE_CONCEPTUAL_MODEL: Use for abstract, strategic content that fits a known consulting model (e.g., 4-quadrant matrix, SWOT, pyramid, cycle).
-
-INPUT DATA:
-- page_title: {page_title}
-- reference_content: {reference_content}
-
-You MUST respond with a single, valid JSON object. Do not add any text before or after the JSON object. The JSON object must strictly adhere to the following structure:
-{{
-  "step1_output": {{
-    "layout_choice": "string",
-    "confidence_score": "float (0.0 to 1.0)",
-    "reasoning": "string"
-  }}
-}}
-"""
-        return self.call_llm(prompt, system_message)
-    
-    def stage2_content_structured(self, layout_choice: str, page_title: str, reference_content: str) -> Dict:
-        """阶段二：内容结构化与精炼"""
-        system_message = """You are an Expert Content Creator and Information Architect. Your task is to transform raw text into concise, structured content perfectly suited for a presentation slide, based on a predefined template."""
-        
-        # 为不同模板类型提供具体的格式要求
-        template_formats = {
+        # 阶段二中不同模板类型的具体格式要求
+        self.template_formats = {
             "TEMPLATE_SUMMARY": """{
   "step2_output": {
     "page_title": "优化后的页面标题",
@@ -168,7 +274,348 @@ You MUST respond with a single, valid JSON object. Do not add any text before or
 }"""
         }
         
-        format_guide = template_formats.get(layout_choice, """{
+        # 布局类型定义
+        self.layout_types = {
+            "vertical_list": "垂直列表",
+            "horizontal_list": "水平列表",
+            "grid_2x2": "2x2网格",
+            "grid_3x1": "3x1网格", 
+            "cards_freeform": "自由卡片布局",
+            "table_compare": "表格比较",
+            "side_by_side_panels": "并排面板",
+            "horizontal_timeline": "水平时间线",
+            "vertical_steps": "垂直步骤",
+            "circular_flow": "循环流程",
+            "quadrant_diagram_with_arrows": "带箭头的四象限图",
+            "pyramid_diagram": "金字塔图",
+            "swot_matrix": "SWOT矩阵"
+        }
+        
+        # 各阶段静态提示词前缀，整个实例生命周期内保持不变
+        self.prompt_prefixes = self._build_prompt_prefixes()
+        self.prefix_tokens = {stage: estimate_tokens(prefix) for stage, prefix in self.prompt_prefixes.items()}
+    
+    def close(self) -> None:
+        """关闭连接池与内部线程池"""
+        if self._stream_pool is not None:
+            self._stream_pool.shutdown()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown()
+        for client in self.clients.values():
+            client.close()
+    
+    def _record_usage(self, stage: str, usage: Optional[Dict]) -> None:
+        usage = usage or {}
+        # 服务端前缀缓存命中的输入token数（接口未返回时记为0）
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        with self._usage_lock:
+            totals = self.usage.setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                   "cached_tokens": 0})
+            totals["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens"):
+                totals[key] += usage.get(key, 0)
+            totals["cached_tokens"] += cached
+    
+    def token_report(self) -> str:
+        """按阶段汇总输入token：静态前缀占比与服务端缓存命中情况"""
+        lines = ["阶段     调用  平均输入tokens  静态前缀tokens  前缀占比  缓存命中tokens"]
+        with self._usage_lock:
+            for stage, totals in sorted(self.usage.items()):
+                calls = totals["calls"]
+                avg_prompt = totals["prompt_tokens"] / calls if calls else 0
+                prefix = self.prefix_tokens.get(stage, 0)
+                share = prefix / avg_prompt if avg_prompt else 0.0
+                lines.append(f"{stage:<8} {calls:>4}  {avg_prompt:>14.0f}  {prefix:>14}  {share:>8.0%}  "
+                             f"{totals['cached_tokens']:>14,}")
+        return "\n".join(lines)
+    
+    def _is_cacheable(self, stage: str, result: Dict) -> bool:
+        """只缓存结构完整的阶段输出，避免把一次失败的回答固化下来"""
+        if stage == "fused":
+            return all(self.validate_stage_output(step, result.get(step))
+                       for step in ("step1_output", "step2_output", "step3_output"))
+        if stage == "stage4":
+            return isinstance(result.get("step4_output"), dict)
+        step = f"step{stage[-1]}_output"
+        return self.validate_stage_output(step, result.get(step))
+    
+    def cache_key(self, stage: str, cache_inputs: Any) -> Optional[str]:
+        """未启用缓存或没有缓存输入时返回None"""
+        if self.cache is None or cache_inputs is None:
+            return None
+        return make_cache_key(stage, PROMPT_VERSIONS[stage], self.router.route(stage)["model"], self.temperature,
+                              cache_inputs)
+    
+    def store_cached(self, stage: str, cache_key: Optional[str], result: Dict) -> None:
+        if cache_key is not None and result and self._is_cacheable(stage, result):
+            self.cache.put(cache_key, result)
+    
+    def call_llm(self, prompt: str, system_message: str, stage: str = "other",
+                 cache_inputs: Any = None, on_field: Optional[Callable[[str, str], None]] = None,
+                 pack_item: Optional[Dict] = None) -> Dict:
+        """调用智谱AI API，stage用于按阶段统计token用量
+        
+        提供cache_inputs（该阶段的全部输入）且启用了缓存时，先查磁盘缓存。
+        流式模式下，回答中的layout_choice一解析出来就调用on_field(字段名, 值)。
+        提供pack_item时先与其他页面合并请求，合并结果中本页无效时再单独请求。
+        """
+        cache_key = self.cache_key(stage, cache_inputs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        result = self.packer.submit(stage, pack_item) if pack_item is not None else None
+        if not result:
+            result = self._request_llm(prompt, system_message, stage, on_field)
+        self.store_cached(stage, cache_key, result)
+        return result
+    
+    def _payload(self, prompt: str, system_message: str, stage: str) -> Dict:
+        """chat/completions请求体，模型与max_tokens按阶段路由；批处理模式也用它写入批任务文件的每一行"""
+        route = self.router.route(stage)
+        max_tokens = route["max_tokens"]
+        if stage.endswith(PACKED_SUFFIX):
+            max_tokens *= self.pack_size
+        return {
+            "model": route["model"],
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": max_tokens
+        }
+    
+    def _settle_usage(self, stage: str, estimated_tokens: int, usage: Optional[Dict],
+                      seconds: Optional[float]) -> None:
+        """记录用量与请求耗时（seconds为None时不记耗时），并按实际token数校正限流器的TPM令牌桶"""
+        self._record_usage(stage, usage)
+        if seconds is not None:
+            self._record_latency(stage, seconds)
+        usage = usage or {}
+        self.rate_limiter.settle(estimated_tokens, usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+    
+    def _record_latency(self, stage: str, seconds: float) -> None:
+        with self._usage_lock:
+            latencies = self.call_latencies.get(stage)
+            if latencies is None:
+                latencies = self.call_latencies[stage] = deque(maxlen=_HEDGE_WINDOW)
+            latencies.append(seconds)
+    
+    def _timed_send(self, stage: str, send: Callable[[ZhipuClient], T]) -> Callable[[], Tuple[T, str]]:
+        """包装一次发送：选定接口地址，并把本次耗时（不含限流排队）记入路由器"""
+        def call() -> Tuple[T, str]:
+            endpoint = self.router.choose_endpoint(stage, self.endpoints)
+            start = time.perf_counter()
+            try:
+                result = send(self.clients[endpoint])
+            except HedgeCancelled:
+                raise
+            except Exception:
+                self.router.record(endpoint, stage, time.perf_counter() - start, ok=False)
+                raise
+            self.router.record(endpoint, stage, time.perf_counter() - start)
+            return result, endpoint
+        return call
+    
+    def _chat(self, prompt: str, system_message: str, stage: str,
+              record_latency: bool = True) -> Tuple[str, Dict]:
+        """经限流器发送一次chat/completions请求（429时退避重试），返回回答文本与实际服务的模型/地址"""
+        data = self._payload(prompt, system_message, stage)
+        estimated = estimate_tokens(system_message) + estimate_tokens(prompt)
+        start = time.perf_counter()
+        result, endpoint = self.rate_limiter.call(self._timed_send(stage, lambda client: client.post_json(data)),
+                                                  tokens=estimated, key=stage)
+        self._settle_usage(stage, estimated, result.get("usage"),
+                           time.perf_counter() - start if record_latency else None)
+        served_by = {"model": result.get("model") or data["model"], "endpoint": endpoint}
+        return result['choices'][0]['message']['content'].strip(), served_by
+    
+    def _chat_stream(self, prompt: str, system_message: str, stage: str,
+                     on_field: Optional[Callable[[str, str], None]] = None,
+                     cancel: Optional[threading.Event] = None,
+                     record_latency: bool = True) -> Tuple[str, Dict]:
+        """以SSE流式请求，边接收边增量解析layout_choice，返回完整回答文本与实际服务的模型/地址
+        
+        cancel被设置时中途断开连接并抛出HedgeCancelled。
+        """
+        data = self._payload(prompt, system_message, stage)
+        data["stream"] = True
+        estimated = estimate_tokens(system_message) + estimate_tokens(prompt)
+        
+        def consume(client: ZhipuClient) -> Tuple[str, Optional[Dict], Optional[str]]:
+            # 429在收到任何数据之前返回，重试时整个流从头开始
+            parser = StreamingFieldParser(["layout_choice"])
+            usage = model = None
+            for event in client.stream_events(data):
+                if cancel is not None and cancel.is_set():
+                    raise HedgeCancelled()
+                usage = event.get("usage") or usage
+                model = event.get("model") or model
+                choices = event.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if not delta:
+                    continue
+                for name, value in parser.feed(delta).items():
+                    if on_field is not None:
+                        on_field(name, value)
+            return parser.text.strip(), usage, model
+        
+        start = time.perf_counter()
+        (text, usage, model), endpoint = self.rate_limiter.call(self._timed_send(stage, consume),
+                                                                tokens=estimated, key=stage)
+        self._settle_usage(stage, estimated, usage, time.perf_counter() - start if record_latency else None)
+        return text, {"model": model or data["model"], "endpoint": endpoint}
+    
+    def _request_llm(self, prompt: str, system_message: str, stage: str,
+                     on_field: Optional[Callable[[str, str], None]] = None) -> Dict:
+        """发送一次chat/completions请求并容错解析JSON回答，解析失败时再发一次修复请求
+        
+        结果中的served_by记录实际服务该请求的模型与接口地址。
+        """
+        try:
+            if self._hedge_pool is not None:
+                content, served_by = self._hedged_send(prompt, system_message, stage, on_field)
+            else:
+                content, served_by = self._send(prompt, system_message, stage, on_field)
+            parsed = self.parse_reply(content, stage)
+            if parsed:
+                parsed["served_by"] = served_by
+            return parsed
+            
+        except Exception as e:
+            print(f"智谱AI API调用错误: {e}")
+            return {}
+    
+    def _send(self, prompt: str, system_message: str, stage: str,
+              on_field: Optional[Callable[[str, str], None]] = None,
+              cancel: Optional[threading.Event] = None, record_latency: bool = True) -> Tuple[str, Dict]:
+        if self.stream:
+            return self._chat_stream(prompt, system_message, stage, on_field, cancel, record_latency)
+        return self._chat(prompt, system_message, stage, record_latency)
+    
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        """该阶段最近请求耗时的p90；样本不足时返回None，不发对冲请求"""
+        with self._usage_lock:
+            samples = sorted(self.call_latencies.get(stage, ()))
+        if len(samples) < _HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE))]
+    
+    def _reserve_hedge(self) -> bool:
+        """预算内时占用一个对冲名额"""
+        with self._usage_lock:
+            if self.hedges_sent >= self.hedge_budget * self.hedge_eligible:
+                return False
+            self.hedges_sent += 1
+            return True
+    
+    def _hedged_send(self, prompt: str, system_message: str, stage: str,
+                     on_field: Optional[Callable[[str, str], None]] = None) -> Tuple[str, Dict]:
+        """请求超过该阶段p90仍未返回时，在预算内再发一个相同请求，取先到的合法JSON回答
+        
+        流式模式下落后的一方立即断开；非流式请求无法中途中断，落后的一方在后台结束后丢弃。
+        """
+        delay = self.hedge_delay(stage)
+        if delay is None:
+            return self._send(prompt, system_message, stage, on_field)
+        
+        cancel = threading.Event()
+        emitted = set()
+        emit_lock = threading.Lock()
+        
+        def relay(name: str, value: str) -> None:
+            # 两份请求都会解析出layout_choice，只转发先到的一次
+            with emit_lock:
+                if name in emitted:
+                    return
+                emitted.add(name)
+            on_field(name, value)
+        
+        def attempt() -> Tuple[Tuple[str, Dict], float]:
+            # 各份请求不自行记录耗时，只把胜出一方的耗时计入p90样本，落后一方的长尾不会抬高对冲阈值
+            start = time.perf_counter()
+            reply = self._send(prompt, system_message, stage, relay if on_field is not None else None, cancel,
+                               record_latency=False)
+            return reply, time.perf_counter() - start
+        
+        with self._usage_lock:
+            self.hedge_eligible += 1
+        futures = [self._hedge_pool.submit(attempt)]
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._reserve_hedge():
+            print(f"  {stage}超过p90（{delay:.2f}s）仍未返回，发送对冲请求")
+            futures.append(self._hedge_pool.submit(attempt))
+        
+        winner = fallback = error = None
+        for future in as_completed(futures):
+            try:
+                reply = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if try_parse_json(reply[0][0]) is not None:
+                winner = reply
+                if future is not futures[0]:
+                    with self._usage_lock:
+                        self.hedge_wins += 1
+                break
+            # 两份都不是合法JSON时，交给修复请求处理先到的那份
+            fallback = fallback or reply
+        cancel.set()
+        for future in futures:
+            future.cancel()
+        winner = winner or fallback
+        if winner is None:
+            raise error
+        reply, seconds = winner
+        self._record_latency(stage, seconds)
+        return reply
+    
+    def hedge_report(self) -> str:
+        with self._usage_lock:
+            eligible, sent, wins = self.hedge_eligible, self.hedges_sent, self.hedge_wins
+        share = sent / eligible if eligible else 0.0
+        return f"对冲请求: {sent} 次（占可对冲请求 {share:.1%}，预算 {self.hedge_budget:.0%}），其中先返回 {wins} 次"
+    
+    def parse_reply(self, content: str, stage: str) -> Dict:
+        """容错解析回答中的JSON，失败时发一次修复请求；仍失败返回空字典"""
+        start = time.perf_counter()
+        parsed = try_parse_json(content)
+        elapsed = time.perf_counter() - start
+        if parsed is None:
+            print(f"  {stage}回答不是合法JSON，发送修复请求...")
+            try:
+                repaired, _ = self._chat(content, REPAIR_SYSTEM_MESSAGE, "repair")
+            except Exception as e:
+                # 修复请求本身出错时同样按解析失败处理，页面计入pages_lost_to_parse
+                print(f"  {stage}修复请求失败: {e}")
+                repaired = None
+            start = time.perf_counter()
+            parsed = try_parse_json(repaired) if repaired else None
+            elapsed += time.perf_counter() - start
+            with self._usage_lock:
+                if parsed is None:
+                    self.parse_failures += 1
+                else:
+                    self.parse_repairs += 1
+        with self._usage_lock:
+            self.parse_seconds += elapsed
+        if parsed is None:
+            # 标记当前页面因解析失败而丢失（页面在单个线程内处理）
+            self._page_state.parse_failed = True
+            print(f"  {stage}回答修复后仍无法解析")
+            return {}
+        return parsed
+    
+    def _build_prompt_prefixes(self) -> Dict[str, str]:
+        """各阶段的静态前缀（system消息）：角色、说明、模板目录与输出结构
+        
+        前缀只在初始化时构建一次，逐字节不变，每页的数据全部放在user消息里，
+        使服务端的前缀缓存能够命中。
+        """
+        generic_format = """{
   "step2_output": {
     "page_title": "优化后的页面标题",
     "template_type": "布局模板名称",
@@ -176,92 +623,95 @@ You MUST respond with a single, valid JSON object. Do not add any text before or
       // 根据模板类型定义具体结构
     }
   }
-}""")
+}"""
+        json_only = ("You MUST respond with a single, valid JSON object. Do not add any text before or after "
+                     "the JSON object. The JSON object must strictly adhere to the following structure:")
         
-        prompt = f"""
+        return {
+            "stage1": f"""You are a Senior Presentation Strategist. Your expertise lies in analyzing raw text to determine the most effective visual and structural way to present it on a slide.
+
+Analyze the provided `page_title` and `reference_content`. Based on your analysis, you must select the single most suitable layout template from the list below. You must also provide a confidence score for your choice and a brief reasoning.
+
+AVAILABLE TEMPLATES:
+{TEMPLATE_CATALOG}
+
+{json_only}
+{{
+  {STEP1_SCHEMA}
+}}""",
+            "stage2": f"""You are an Expert Content Creator and Information Architect. Your task is to transform raw text into concise, structured content perfectly suited for a presentation slide, based on a predefined template.
+
 Based on the `layout_choice` provided, you will process the `reference_content`. You will refine the text, potentially optimize the `page_title`, and structure the output according to the specific JSON format for that template. Ensure all text is clear, concise, and professional.
 
 TEMPLATE REQUIREMENTS:
 - For TEMPLATE_SUMMARY: Extract 3-5 key points, each as a separate concise statement
 - For TEMPLATE_BLOCKS: Identify 2-4 parallel content blocks, each with a clear sub-heading and detailed content
 
-REQUIRED JSON FORMAT for {layout_choice}:
-{format_guide}
+REQUIRED JSON FORMAT for TEMPLATE_SUMMARY:
+{self.template_formats["TEMPLATE_SUMMARY"]}
 
-INPUT DATA:
-- layout_choice: {layout_choice}
-- page_title: {page_title}
-- reference_content: {reference_content}
+REQUIRED JSON FORMAT for TEMPLATE_BLOCKS:
+{self.template_formats["TEMPLATE_BLOCKS"]}
+
+REQUIRED JSON FORMAT for other templates:
+{generic_format}
+
+You MUST generate a single, valid JSON object strictly following the specified format for the chosen template. Include the template_type field in the output.""",
+            "stage3": f"""You are a Creative Director and Visual Designer. Your task is to take structured slide content and define a complete set of visual specifications for it.
 
-You MUST generate a single, valid JSON object strictly following the specified format for the chosen template. Include the template_type field in the output.
-"""
-        return self.call_llm(prompt, system_message)
-    
-    def stage3_visual_enhancement(self, step2_output: Dict) -> Dict:
-        """阶段三：视觉增强与版式规格定义"""
-        system_message = """You are a Creative Director and Visual Designer. Your task is to take structured slide content and define a complete set of visual specifications for it."""
-        
-        step2_json = json.dumps(step2_output, ensure_ascii=False)
-        
-        prompt = f"""
 Analyze the provided structured content from `step2_output`. Based on this content, you must generate a set of visual design specifications. This includes relevant search keywords, icon suggestions for key items, a specific layout instruction, and a color palette suggestion.
 
 LAYOUT SPECIFICATION (`content_type`):
 Choose a specific visual layout ID that best represents the content structure:
-- For lists: `vertical_list`, `horizontal_list`
-- For blocks: `grid_2x2`, `grid_3x1`, `cards_freeform`
-- For comparisons: `table_compare`, `side_by_side_panels`
-- For flows: `horizontal_timeline`, `vertical_steps`, `circular_flow`
-- For models: `quadrant_diagram_with_arrows`, `pyramid_diagram`, `swot_matrix`
+{LAYOUT_CATALOG}
 
-INPUT DATA:
-- step2_output: {step2_json}
+{json_only}
+{{
+  {STEP3_SCHEMA}
+}}""",
+            "stage1_packed": f"""You are a Senior Presentation Strategist. Your expertise lies in analyzing raw text to determine the most effective visual and structural way to present it on a slide.
 
-You MUST respond with a single, valid JSON object. Do not add any text before or after the JSON object. The JSON object must strictly adhere to the following structure:
+You are given `pages`, a list of slides, each with a `page_index`, a `page_title` and its `reference_content`. Analyze every slide on its own, as if it were the only one, and select the single most suitable layout template for it from the list below. For each slide you must also provide a confidence score for your choice and a brief reasoning.
+
+AVAILABLE TEMPLATES:
+{TEMPLATE_CATALOG}
+
+{json_only}
 {{
-  "step3_output": {{
-    "image_search_keywords": "string (comma-separated)",
-    "icon_suggestions": [
-      {{
-        "item": "string (matches a sub_heading or key point)",
-        "icon_name": "string (comma-separated, e.g., 'strategy, brain, lightbulb')"
-      }}
-    ],
-    "layout_constraints": {{
-      "content_type": "string (one of the specified layout IDs)",
-      "axis_labels": {{ 
-        "x_axis": "string (optional)",
-        "y_axis": "string (optional)"
-      }},
-      "path_flow": "string (optional, e.g., '1 -> 2, 1 -> 3, 2&3 -> 4')"
-    }},
-    "color_palette_suggestion": "string (e.g., 'professional_blue_grey', 'vibrant_tech_green')"
-  }}
+  "results": [
+    {{
+      "page_index": "integer (copied from the input)",
+      {STEP1_SCHEMA}
+    }}
+  ]
 }}
-"""
-        return self.call_llm(prompt, system_message)
-    
-    def stage4_quality_control(self, page_metadata_list: List[Dict]) -> Dict:
-        """阶段四：质量与一致性控制"""
-        system_message = """You are a Quality Assurance Director for presentations. Your job is to review the metadata of an entire presentation to ensure its overall quality, consistency, and professionalism."""
-        
-        metadata_json = json.dumps(page_metadata_list, ensure_ascii=False)
-        
-        prompt = f"""
-Analyze the provided `page_metadata_list`, which contains summary information for each slide. Identify any potential issues related to consistency and quality. If there are no issues, return an empty list.
+`results` must contain exactly one element for every input slide.""",
+            "stage3_packed": f"""You are a Creative Director and Visual Designer. Your task is to take structured slide content and define a complete set of visual specifications for it.
 
-REVIEW CHECKLIST:
-1. Content Granularity: Are the titles similar in length and style? Is there a slide with a significantly higher `item_count` than others?
-2. Titling Convention: Do any titles contain artifacts like document numbering (e.g., "1.", "4.2") that should be removed?
-3. Flow & Logic: Does the sequence of `layout_choice` make sense?
+You are given `pages`, a list of slides, each with a `page_index` and its structured content in `step2_output`. For every slide on its own, generate a set of visual design specifications. This includes relevant search keywords, icon suggestions for key items, a specific layout instruction, and a color palette suggestion.
 
-INPUT DATA:
-- page_metadata_list: {metadata_json}
+LAYOUT SPECIFICATION (`content_type`):
+Choose a specific visual layout ID that best represents the content structure:
+{LAYOUT_CATALOG}
 
-You MUST respond with a single, valid JSON object. Do not add any text before or after the JSON object. The JSON object must strictly adhere to the following structure:
+{json_only}
+{{
+  "results": [
+    {{
+      "page_index": "integer (copied from the input)",
+      {STEP3_SCHEMA}
+    }}
+  ]
+}}
+`results` must contain exactly one element for every input slide.""",
+            "stage4": f"""You are a Quality Assurance Director for presentations. Your job is to review the narrative flow of a presentation.
+
+Title numbering, title length and item counts have already been checked. You are given `flow_concerns`, a list of suspected flow problems found by automatic checks, and `page_sequence`, the affected slides with their neighbours (page_index, page_title, layout_choice). For each concern, decide whether the sequence of slides and layouts genuinely hurts the flow or logic of the presentation. Report only real problems; if there are none, return an empty list.
+
+{json_only}
 {{
   "step4_output": {{
-    "overall_consistency_score": "float (0.0 to 1.0)",
+    "overall_consistency_score": "float (0.0 to 1.0, flow quality of the reviewed slides)",
     "consistency_issues": [
       {{
         "page_index": "integer",
@@ -270,99 +720,609 @@ You MUST respond with a single, valid JSON object. Do not add any text before or
       }}
     ]
   }}
-}}
-"""
-        return self.call_llm(prompt, system_message)
+}}""",
+            "fused": f"""You are a Senior Presentation Strategist, Information Architect and Creative Director. In a single pass you choose the most effective layout for a slide, structure its content for that layout, and define its visual specifications.
+
+Complete the three design steps below for the provided `page_title` and `reference_content`, and return all three results together in one JSON object.
+
+STEP 1 - STRATEGY & LAYOUT: Select the single most suitable layout template from the list below. Provide a confidence score for your choice and a brief reasoning.
+AVAILABLE TEMPLATES:
+{TEMPLATE_CATALOG}
+
+STEP 2 - CONTENT STRUCTURING: Based on your `layout_choice`, refine the text, potentially optimize the `page_title`, and structure the content for that template. Ensure all text is clear, concise, and professional. Include the template_type field.
+- For TEMPLATE_SUMMARY: Extract 3-5 key points, each as a separate concise statement, in this format:
+{self.template_formats["TEMPLATE_SUMMARY"]}
+- For TEMPLATE_BLOCKS: Identify 2-4 parallel content blocks, each with a clear sub-heading and detailed content, in this format:
+{self.template_formats["TEMPLATE_BLOCKS"]}
+- For other templates: choose a content structure that suits the template.
+
+STEP 3 - VISUAL ENHANCEMENT: Based on your step 2 content, generate relevant search keywords, icon suggestions for key items, a specific layout instruction, and a color palette suggestion.
+LAYOUT SPECIFICATION (`content_type`):
+{LAYOUT_CATALOG}
+
+{json_only}
+{{
+  {STEP1_SCHEMA},
+  "step2_output": {{
+    "page_title": "string",
+    "template_type": "string (same as layout_choice)",
+    "content": {{ "...": "structure for the chosen template" }}
+  }},
+  {STEP3_SCHEMA}
+}}""",
+        }
+    
+    def stage_request(self, stage: str, *inputs: Any) -> Tuple[str, Any]:
+        """构建某阶段的user消息与缓存输入
+        
+        inputs依次为：stage1/fused (标题, 内容)；stage2 (布局, 标题, 内容)；
+        stage3 (step2_output,)；stage4 (flow_concerns, page_sequence)
+        """
+        if stage in ("stage1", "fused"):
+            page_title, reference_content = inputs
+            prompt = f"""INPUT DATA:
+- page_title: {page_title}
+- reference_content: {reference_content}"""
+            return prompt, [page_title, reference_content]
+        if stage == "stage2":
+            layout_choice, page_title, reference_content = inputs
+            prompt = f"""INPUT DATA:
+- layout_choice: {layout_choice}
+- page_title: {page_title}
+- reference_content: {reference_content}"""
+            return prompt, [layout_choice, page_title, reference_content]
+        if stage == "stage3":
+            step2_json = json.dumps(inputs[0], ensure_ascii=False)
+            return f"""INPUT DATA:
+- step2_output: {step2_json}""", step2_json
+        if stage == "stage4":
+            concerns_json = json.dumps(inputs[0], ensure_ascii=False)
+            sequence_json = json.dumps(inputs[1], ensure_ascii=False)
+            return f"""INPUT DATA:
+- flow_concerns: {concerns_json}
+- page_sequence: {sequence_json}""", [concerns_json, sequence_json]
+        raise ValueError(f"未知阶段: {stage}")
+    
+    def stage1_strategy_layout(self, page_title: str, reference_content: str,
+                               on_field: Optional[Callable[[str, str], None]] = None) -> Dict:
+        """阶段一：策略与布局选择"""
+        prompt, cache_inputs = self.stage_request("stage1", page_title, reference_content)
+        pack_item = None
+        if on_field is None and self._packable(prompt):
+            pack_item = {"page_title": page_title, "reference_content": reference_content}
+        return self.call_llm(prompt, self.prompt_prefixes["stage1"], stage="stage1",
+                             cache_inputs=cache_inputs, on_field=on_field, pack_item=pack_item)
+    
+    def stage2_content_structured(self, layout_choice: str, page_title: str, reference_content: str) -> Dict:
+        """阶段二：内容结构化与精炼"""
+        prompt, cache_inputs = self.stage_request("stage2", layout_choice, page_title, reference_content)
+        return self.call_llm(prompt, self.prompt_prefixes["stage2"], stage="stage2", cache_inputs=cache_inputs)
+    
+    def stage3_visual_enhancement(self, step2_output: Dict) -> Dict:
+        """阶段三：视觉增强与版式规格定义"""
+        prompt, cache_inputs = self.stage_request("stage3", step2_output)
+        pack_item = {"step2_output": step2_output} if self._packable(prompt) else None
+        return self.call_llm(prompt, self.prompt_prefixes["stage3"], stage="stage3", cache_inputs=cache_inputs,
+                             pack_item=pack_item)
+    
+    def _packable(self, prompt: str) -> bool:
+        return self.packer is not None and len(prompt) <= self.pack_max_chars
+    
+    def _send_packed(self, stage: str, items: List[Dict]) -> List[Optional[Dict]]:
+        """把一组页面的阶段1或阶段3请求合并为一次请求，按page_index拆回各页并逐个校验
+        
+        返回与items等长的列表，缺失或校验不通过的元素为None（由各页单独重试）；只有一个元素时直接返回None。
+        """
+        if len(items) == 1:
+            return [None]
+        packed_stage = stage + PACKED_SUFFIX
+        step = f"step{stage[-1]}_output"
+        pages = [{"page_index": i, **item} for i, item in enumerate(items)]
+        prompt = f"""INPUT DATA:
+- pages: {json.dumps(pages, ensure_ascii=False)}"""
+        # 合并请求在组内第一个页面的线程里发出，解析失败不应记在该页头上
+        parse_failed = getattr(self._page_state, "parse_failed", False)
+        reply = self._request_llm(prompt, self.prompt_prefixes[packed_stage], packed_stage)
+        self._page_state.parse_failed = parse_failed
+        
+        elements = {}
+        for element in reply.get("results") if isinstance(reply.get("results"), list) else []:
+            if isinstance(element, dict) and isinstance(element.get("page_index"), int):
+                elements.setdefault(element["page_index"], element)
+        results = []
+        for i in range(len(items)):
+            output = elements.get(i, {}).get(step)
+            if not self.validate_stage_output(step, output):
+                results.append(None)
+                continue
+            result = {step: output}
+            if "served_by" in reply:
+                result["served_by"] = dict(reply["served_by"], packed_pages=len(items))
+            results.append(result)
+        
+        failed = results.count(None)
+        with self._usage_lock:
+            self.packed_requests += 1
+            self.packed_pages += len(items) - failed
+            self.pack_retries += failed
+        if failed:
+            print(f"  {stage}合并请求中 {failed}/{len(items)} 页的结果无效，单独重试")
+        return results
+    
+    def pack_report(self) -> str:
+        with self._usage_lock:
+            requests, pages, retries = self.packed_requests, self.packed_pages, self.pack_retries
+        return (f"合并请求: {requests} 次（每次至多 {self.pack_size} 页），由合并请求完成 {pages} 页，"
+                f"单独重试 {retries} 页，在途页面均已到齐而提前发送 {self.packer.early_flushes} 组")
+    
+    def stage4_quality_control(self, page_metadata_list: List[Dict]) -> Dict:
+        """阶段四：质量与一致性控制
+        
+        编号残留、标题长度与条目数在本地检查；只有发现流程疑点时才把相关页面交给LLM复核，
+        没有疑点的演示文稿不发请求。返回与原先相同的step4_output结构。
+        """
+        issues = local_quality_issues(page_metadata_list)
+        score = consistency_score(len(page_metadata_list), issues)
+        concerns = flow_concerns(page_metadata_list)
+        print(f"阶段4: 本地检查发现 {len(issues)} 个问题，流程疑点 {len(concerns)} 处")
+        served_by = {}
+        if concerns:
+            reviewed = self.stage4_flow_review(concerns, flow_review_pages(page_metadata_list, concerns))
+            step4 = reviewed.get("step4_output") if isinstance(reviewed, dict) else None
+            if isinstance(step4, dict):
+                flow_issues = [issue for issue in step4.get("consistency_issues") or []
+                               if isinstance(issue, dict) and "page_index" in issue]
+                issues = sorted(issues + flow_issues, key=lambda issue: issue["page_index"])
+                flow_score = step4.get("overall_consistency_score")
+                if isinstance(flow_score, (int, float)):
+                    score = min(score, float(flow_score))
+                if "served_by" in reviewed:
+                    served_by["served_by"] = reviewed["served_by"]
+        return {"step4_output": {"overall_consistency_score": score, "consistency_issues": issues}, **served_by}
+    
+    def stage4_flow_review(self, concerns: List[Dict], page_sequence: List[Dict]) -> Dict:
+        """阶段四的LLM部分：只复核本地找出的流程疑点及其相邻页面"""
+        prompt, cache_inputs = self.stage_request("stage4", concerns, page_sequence)
+        return self.call_llm(prompt, self.prompt_prefixes["stage4"], stage="stage4", cache_inputs=cache_inputs)
+    
+    def stage123_fused(self, page_title: str, reference_content: str) -> Dict:
+        """融合模式：一次请求同时完成阶段1-3"""
+        prompt, cache_inputs = self.stage_request("fused", page_title, reference_content)
+        return self.call_llm(prompt, self.prompt_prefixes["fused"], stage="fused", cache_inputs=cache_inputs)
+    
+    def validate_stage_output(self, step: str, output: Any) -> bool:
+        """检查单个阶段的输出是否具备后续阶段所需的最小结构"""
+        if not isinstance(output, dict):
+            return False
+        if step == "step1_output":
+            return output.get("layout_choice") in self.templates
+        if step == "step2_output":
+            return isinstance(output.get("page_title"), str) and isinstance(output.get("content"), dict)
+        if step == "step3_output":
+            constraints = output.get("layout_constraints")
+            return isinstance(constraints, dict) and constraints.get("content_type") in self.layout_types
+        return False
+    
+    def _usable_output(self, step: str, stage_result: Optional[Dict]) -> bool:
+        """阶段结果可供后续阶段使用；回答是合法JSON但结构不对时按解析失败处理，页面计入pages_lost_to_parse"""
+        if not stage_result:
+            return False
+        if self.validate_stage_output(step, stage_result.get(step)):
+            return True
+        print(f"  {step}结构不完整，页面按解析失败处理")
+        self._page_state.parse_failed = True
+        return False
     
     def process_single_page(self, page_title: str, reference_content: str) -> Dict:
-        """处理单个页面（阶段1-3）"""
+        """处理单个页面（阶段1-3），因回答无法解析而失败的页面计入pages_lost_to_parse"""
         print(f"处理页面: {page_title}")
+        self._page_state.parse_failed = False
+        self._page_state.stage2_started = None
+        start = time.perf_counter()
+        match = self.dedup_index.lookup(reference_content) if self.dedup_index is not None else None
+        if match is not None and match["exact"]:
+            print(f"复用内容相同页面的设计结果: {match['page_title']}")
+            with self._usage_lock:
+                self.dedup_reused += 1
+            return self._reuse_result(match, page_title)
+        result = self._process_single_page(page_title, reference_content, match)
+        if not result and self._page_state.parse_failed:
+            with self._usage_lock:
+                self.pages_lost_to_parse += 1
+        if result and self.dedup_index is not None:
+            self.dedup_index.add(page_title, reference_content, result)
+        if result:
+            stage2_started = self._page_state.stage2_started
+            with self._usage_lock:
+                self.page_timings.append({
+                    "page_title": page_title,
+                    "first_stage2_seconds": None if stage2_started is None else stage2_started - start,
+                    "total_seconds": time.perf_counter() - start,
+                })
+        return result
+    
+    def _reuse_result(self, match: Dict, page_title: str) -> Dict:
+        """复制索引中页面的阶段1-3输出；标题不同时阶段2的标题换成本页标题"""
+        result = copy.deepcopy(match["result"])
+        if page_title != match["page_title"]:
+            result["stage2"]["step2_output"]["page_title"] = page_title
+        result["reused_from"] = {"page_title": match["page_title"], "similarity": match["similarity"]}
+        return result
+    
+    def _stream_stage1(self, page_title: str, reference_content: str) -> Tuple[Future, Optional[str]]:
+        """在后台流式请求阶段1，layout_choice一解析出来就返回
+        
+        返回(完整阶段1结果的Future, 提前解析到的布局)；回答结束仍未解析到合法布局时布局为None。
+        """
+        early = {}
+        ready = threading.Event()
+        
+        def on_field(name: str, value: str) -> None:
+            if name == "layout_choice" and value in self.templates:
+                early["layout_choice"] = value
+                ready.set()
+        
+        def run() -> Tuple[Dict, bool]:
+            # 解析失败标记在后台线程里设置，随结果带回页面线程
+            self._page_state.parse_failed = False
+            result = self.stage1_strategy_layout(page_title, reference_content, on_field)
+            return result, self._page_state.parse_failed
+        
+        future = self._stream_pool.submit(run)
+        future.add_done_callback(lambda _: ready.set())
+        ready.wait()
+        return future, early.get("layout_choice")
+    
+    def _finish_stream_stage1(self, future: Future, layout_choice: str) -> Dict:
+        """等待后台阶段1回答结束；完整输出不可用时保留已据以完成阶段2/3的布局"""
+        result, parse_failed = future.result()
+        if parse_failed:
+            self._page_state.parse_failed = True
+        if self.validate_stage_output("step1_output", result.get("step1_output")):
+            return result
+        return {"step1_output": {"layout_choice": layout_choice, "confidence_score": None,
+                                 "reasoning": ""}}
+    
+    def _process_single_page(self, page_title: str, reference_content: str, match: Optional[Dict] = None) -> Dict:
+        """match为索引中的近似重复页面：复用其布局；阶段2照常重做（内容里的事实可能已变），
+        条目数不变时再复用其视觉规格"""
+        stage1_result = stage2_result = stage3_result = None
+        stage1_future = None
+        
+        if match is not None:
+            print(f"近似重复页面: {match['page_title']}（相似度 {match['similarity']:.2f}），复用布局")
+            stage1_result = copy.deepcopy(match["result"]["stage1"])
+        
+        if self.fused and stage1_result is None:
+            print("阶段1-3: 融合请求...")
+            fused_result = self.stage123_fused(page_title, reference_content)
+            # 按阶段顺序保留校验通过的输出，第一个不通过的阶段起退回分阶段处理
+            served_by = {"served_by": fused_result["served_by"]} if "served_by" in fused_result else {}
+            if self.validate_stage_output("step1_output", fused_result.get("step1_output")):
+                stage1_result = {"step1_output": fused_result["step1_output"], **served_by}
+                if self.validate_stage_output("step2_output", fused_result.get("step2_output")):
+                    stage2_result = {"step2_output": fused_result["step2_output"], **served_by}
+                    if self.validate_stage_output("step3_output", fused_result.get("step3_output")):
+                        stage3_result = {"step3_output": fused_result["step3_output"], **served_by}
+            if stage3_result is None:
+                print("  融合输出校验未通过，退回分阶段处理")
+                with self._usage_lock:
+                    self.fused_fallbacks += 1
+        
+        # 本地分类器足够确定时直接采用其结果
+        if stage1_result is None and self.layout_classifier is not None:
+            local = self.layout_classifier.classify(page_title, reference_content)
+            if local["local_score"] >= self.layout_threshold:
+                print(f"阶段1: 本地分类器（本地得分 {local['local_score']:.2f}）")
+                stage1_result = {"step1_output": local}
+                with self._usage_lock:
+                    self.local_layouts += 1
         
         # 阶段1：策略与布局选择
-        print("阶段1: 策略与布局选择...")
-        stage1_result = self.stage1_strategy_layout(page_title, reference_content)
-        if not stage1_result:
-            return {}
+        if stage1_result is None:
+            print("阶段1: 策略与布局选择...")
+            if self.stream:
+                # 流式：拿到layout_choice即进入阶段2，阶段1的其余部分在后台继续接收
+                stage1_future, layout_choice = self._stream_stage1(page_title, reference_content)
+                if layout_choice is None:
+                    stage1_result, parse_failed = stage1_future.result()
+                    self._page_state.parse_failed = self._page_state.parse_failed or parse_failed
+                    stage1_future = None
+            else:
+                stage1_result = self.stage1_strategy_layout(page_title, reference_content)
+            if stage1_future is None and not self._usable_output("step1_output", stage1_result):
+                return {}
         
-        layout_choice = stage1_result["step1_output"]["layout_choice"]
+        if stage1_future is None:
+            layout_choice = stage1_result["step1_output"]["layout_choice"]
         print(f"  选择的布局: {layout_choice}")
         
         # 阶段2：内容结构化
-        print("阶段2: 内容结构化...")
-        stage2_result = self.stage2_content_structured(layout_choice, page_title, reference_content)
-        if not stage2_result:
-            return {}
+        if stage2_result is None:
+            print("阶段2: 内容结构化...")
+            self._page_state.stage2_started = time.perf_counter()
+            stage2_result = self.stage2_content_structured(layout_choice, page_title, reference_content)
+            if not self._usable_output("step2_output", stage2_result):
+                return {}
         
         # 阶段3：视觉增强
-        print("阶段3: 视觉增强...")
-        stage3_result = self.stage3_visual_enhancement(stage2_result["step2_output"])
-        if not stage3_result:
-            return {}
+        reused_stage2 = match["result"]["stage2"]["step2_output"] if match is not None else None
+        if stage3_result is None and reused_stage2 is not None and \
+                count_items(stage2_result["step2_output"]) == count_items(reused_stage2):
+            print("阶段3: 条目数与近似重复页面一致，复用视觉规格")
+            stage3_result = copy.deepcopy(match["result"]["stage3"])
+        if stage3_result is None:
+            print("阶段3: 视觉增强...")
+            stage3_result = self.stage3_visual_enhancement(stage2_result["step2_output"])
+            if not self._usable_output("step3_output", stage3_result):
+                return {}
         
-        return {
+        if stage1_future is not None:
+            stage1_result = self._finish_stream_stage1(stage1_future, layout_choice)
+        
+        result = {
             "stage1": stage1_result,
             "stage2": stage2_result,
             "stage3": stage3_result
         }
+        if match is not None:
+            result["reused_from"] = {"page_title": match["page_title"], "similarity": match["similarity"]}
+            with self._usage_lock:
+                self.dedup_partial += 1
+        return result
     
-    def process_presentation(self, pages: List[Dict]) -> Dict:
-        """处理整个演示文稿"""
-        results = []
+    def timing_report(self) -> str:
+        """最近完成页面的耗时汇总：开始到阶段2请求发出的耗时，以及阶段1-3总耗时"""
+        with self._usage_lock:
+            timings = list(self.page_timings)
+        first = sorted(t["first_stage2_seconds"] for t in timings if t["first_stage2_seconds"] is not None)
+        total = sorted(t["total_seconds"] for t in timings)
+        if not total:
+            return "没有完成的页面"
+        report = f"单页阶段1-3耗时: 平均 {sum(total) / len(total):.2f}s，中位数 {total[len(total) // 2]:.2f}s"
+        if first:
+            report += (f"；到阶段2开始: 平均 {sum(first) / len(first):.2f}s，"
+                       f"中位数 {first[len(first) // 2]:.2f}s")
+        return report
+    
+    def page_metadata(self, page_index: int, result: Dict) -> Dict:
+        """阶段4所需的单页摘要信息"""
+        item_count = count_items(result["stage2"]["step2_output"])
+        return {
+            "page_index": page_index,
+            "page_title": result["stage2"]["step2_output"].get("page_title", ""),
+            "layout_choice": result["stage1"]["step1_output"]["layout_choice"],
+            "item_count": item_count
+        }
+    
+    def process_presentation(self, pages: Iterable[Dict], journal: Optional[PageJournal] = None) -> Dict:
+        """处理整个演示文稿
+        
+        提供journal时，每页完成后立即写入日志，日志中已有的页面直接跳过。
+        """
+        return self._finish_presentation(self.iter_page_results(pages, journal))
+    
+    def write_presentation(self, pages: Iterable[Dict], f: TextIO, journal: Optional[PageJournal] = None) -> int:
+        """处理演示文稿并把结果逐页写入f，格式与process_presentation的返回值相同
+        
+        内存中只保留阶段4所需的每页元数据，适合上万页的流式输入；返回读入的页数。
+        """
+        f.write('{\n  "pages": [')
         page_metadata = []
+        count = 0
+        for i, result in self.iter_page_results(pages, journal):
+            count += 1
+            if not result:
+                continue
+            f.write(("," if page_metadata else "") + "\n"
+                    + textwrap.indent(json.dumps(result, ensure_ascii=False, indent=2), "    "))
+            page_metadata.append(self.page_metadata(i, result))
+        stage4_result = self.stage4_quality_control(page_metadata)
+        quality = textwrap.indent(json.dumps(stage4_result, ensure_ascii=False, indent=2), "  ").lstrip()
+        f.write(f'\n  ],\n  "quality_control": {quality}\n}}')
+        return count
+    
+    def iter_page_results(self, pages: Iterable[Dict], journal: Optional[PageJournal] = None,
+                          executor: Optional[ThreadPoolExecutor] = None,
+                          ordered: bool = True) -> Iterator[Tuple[int, Dict]]:
+        """并发处理各页面（阶段1-3），逐页产出(页码, 结果)，失败的页面结果为空字典
         
-        # 处理每个页面
-        for i, page in enumerate(pages):
+        ordered为True时按输入顺序产出，否则按完成顺序产出（慢页面不阻塞其后的页面）。
+        pages可以是惰性迭代器：同时在途的页面不超过并发数的两倍，输入边读边处理。
+        提供executor时页面在该线程池上运行（多个任务共享同一组工作线程），否则按并发数新建。
+        """
+        def run_page(index: int, page: Dict) -> Dict:
+            if journal is not None:
+                done = journal.completed(index, page)
+                if done is not None:
+                    print(f"跳过已完成页面: {page['title']}")
+                    return done
             result = self.process_single_page(page["title"], page["content"])
+            if journal is not None and result:
+                journal.append(index, page, result)
+            return result
+        
+        def submit(index: int, page: Dict) -> Future:
+            # 向合并器登记在途页面，所有在途页面都在等待合并时不必等满pack_wait
+            if self.packer is None:
+                return executor.submit(run_page, index, page)
+            self.packer.add_pages()
+            future = executor.submit(run_page, index, page)
+            future.add_done_callback(lambda _: self.packer.page_done())
+            return future
+        
+        def read_input() -> Iterator[Tuple[int, Dict]]:
+            # 输入读完之前还会有页面到来：读取期间多登记一页，首批页面不会刚提交就被当作已全部到齐
+            if self.packer is None:
+                yield from enumerate(pages)
+                return
+            self.packer.add_pages()
+            try:
+                yield from enumerate(pages)
+            finally:
+                self.packer.page_done()
+        
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                yield from self.iter_page_results(pages, journal, executor, ordered)
+            return
+        
+        window = self.concurrency * 2
+        if not ordered:
+            in_flight: Dict[Future, int] = {}
+            for i, page in read_input():
+                in_flight[submit(i, page)] = i
+                if len(in_flight) >= window:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield in_flight.pop(future), future.result()
+            for future in as_completed(list(in_flight)):
+                yield in_flight.pop(future), future.result()
+            return
+        
+        pending = deque()
+        for i, page in read_input():
+            pending.append((i, submit(i, page)))
+            if len(pending) >= window:
+                index, future = pending.popleft()
+                yield index, future.result()
+        while pending:
+            index, future = pending.popleft()
+            yield index, future.result()
+    
+    def _finish_presentation(self, page_results: Iterable[Tuple[int, Dict]]) -> Dict:
+        """按输入顺序收集成功的页面，并对其元数据运行阶段4"""
+        results = []
+        page_metadata = []
+        for i, result in page_results:
             if result:
                 results.append(result)
-                
                 # 收集元数据用于阶段4
-                item_count = len(result["stage2"]["step2_output"].get("content", {}).get("content_blocks", []))
-                page_metadata.append({
-                    "page_index": i,
-                    "page_title": result["stage2"]["step2_output"].get("page_title", ""),
-                    "layout_choice": result["stage1"]["step1_output"]["layout_choice"],
-                    "item_count": item_count
-                })
+                page_metadata.append(self.page_metadata(i, result))
         
         # 阶段4：质量控制
-        print("阶段4: 质量控制...")
         stage4_result = self.stage4_quality_control(page_metadata)
         
         return {
             "pages": results,
             "quality_control": stage4_result
         }
+    
+    def process_presentation_batch(self, pages: List[Dict], batch_client: BatchClient, work_dir: str,
+                                   journal: Optional[PageJournal] = None) -> Dict:
+        """批处理模式：阶段1、2、3依次把所有待处理页面的请求写成JSONL批任务，提交并等待完成
+        
+        适合不在意单次延迟的大型离线任务；缓存、本地布局分类器与逐页日志照常生效，阶段4仍同步执行（至多一次请求）。
+        """
+        os.makedirs(work_dir, exist_ok=True)
+        page_results: List[Dict] = [{} for _ in pages]
+        pending = []
+        for i, page in enumerate(pages):
+            done = journal.completed(i, page) if journal is not None else None
+            if done is not None:
+                page_results[i] = done
+            else:
+                pending.append(i)
+        print(f"批处理: {len(pending)} 页待处理，{len(pages) - len(pending)} 页已完成")
+        
+        stage1 = {}
+        for i in pending:
+            if self.layout_classifier is not None:
+                local = self.layout_classifier.classify(pages[i]["title"], pages[i]["content"])
+                if local["local_score"] >= self.layout_threshold:
+                    stage1[i] = {"step1_output": local}
+                    self.local_layouts += 1
+        stage1.update(self._run_batch_stage("stage1", {
+            i: (pages[i]["title"], pages[i]["content"]) for i in pending if i not in stage1
+        }, batch_client, work_dir))
+        
+        stage2 = self._run_batch_stage("stage2", {
+            i: (result["step1_output"]["layout_choice"], pages[i]["title"], pages[i]["content"])
+            for i, result in stage1.items()
+        }, batch_client, work_dir)
+        
+        stage3 = self._run_batch_stage("stage3", {
+            i: (result["step2_output"],) for i, result in stage2.items()
+        }, batch_client, work_dir)
+        
+        for i in sorted(stage3):
+            page_results[i] = {"stage1": stage1[i], "stage2": stage2[i], "stage3": stage3[i]}
+            if journal is not None:
+                journal.append(i, pages[i], page_results[i])
+        
+        return self._finish_presentation(enumerate(page_results))
+    
+    def _run_batch_stage(self, stage: str, inputs: Dict[int, Tuple], batch_client: BatchClient,
+                         work_dir: str) -> Dict[int, Dict]:
+        """把一个阶段的全部请求写成批任务文件（超出上限时拆成多个）并提交，返回校验通过的结果{页码: 阶段输出}"""
+        results: Dict[int, Dict] = {}
+        to_submit = []
+        for i, stage_inputs in inputs.items():
+            prompt, cache_inputs = self.stage_request(stage, *stage_inputs)
+            key = self.cache_key(stage, cache_inputs)
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                to_submit.append((i, prompt, key))
+        if not to_submit:
+            return results
+        
+        # 先提交所有批任务再统一等待，拆分后的各批任务在服务端可以并行执行
+        system_message = self.prompt_prefixes[stage]
+        submitted = []
+        for n in range(0, len(to_submit), batch_client.max_requests):
+            chunk = to_submit[n:n + batch_client.max_requests]
+            input_path = os.path.join(work_dir, f"{stage}-{n // batch_client.max_requests}.jsonl")
+            with open(input_path, 'w', encoding='utf-8') as f:
+                for i, prompt, _ in chunk:
+                    f.write(json.dumps({
+                        "custom_id": f"{stage}-{i}",
+                        "method": "POST",
+                        "url": BATCH_ENDPOINT,
+                        "body": self._payload(prompt, system_message, stage)
+                    }, ensure_ascii=False) + "\n")
+            print(f"阶段{stage[-1]}: 提交批任务 {input_path}（{len(chunk)} 个请求）")
+            submitted.append((batch_client.submit(input_path), input_path))
+        
+        cache_keys = {i: key for i, _, key in to_submit}
+        for batch_id, input_path in submitted:
+            batch = batch_client.wait(batch_id)
+            output_path = batch_client.download_output(batch, input_path.replace(".jsonl", "-output.jsonl"))
+            if output_path is None:
+                continue
+            with open(output_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    i = int(record["custom_id"].rsplit("-", 1)[1])
+                    response = record.get("response") or {}
+                    body = response.get("body") or {}
+                    if response.get("status_code") != 200 or not body.get("choices"):
+                        print(f"  {record['custom_id']} 请求失败: {response.get('status_code')}")
+                        continue
+                    self._record_usage(stage, body.get("usage"))
+                    self._page_state.parse_failed = False
+                    parsed = self.parse_reply(body["choices"][0]["message"]["content"], stage)
+                    if parsed:
+                        parsed["served_by"] = {"model": body.get("model"), "endpoint": batch_client.base_url}
+                    if self._is_cacheable(stage, parsed):
+                        self.store_cached(stage, cache_keys[i], parsed)
+                        results[i] = parsed
+                    elif self._page_state.parse_failed:
+                        self.pages_lost_to_parse += 1
+        return results
 
 
 def parse_text_file(file_path: str) -> Dict:
-    """解析文本格式的输入文件"""
+    """解析文本格式的输入文件，可包含多条document_title/page_data记录，page_data之后的各行都属于页面内容"""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 解析文本格式
-        document_title = None
-        page_data = None
+            pages = list(iter_text_pages(f))
         
-        lines = content.split('\n')
-        for line in lines:
-            if line.startswith('document_title:'):
-                document_title = line.replace('document_title:', '').strip()
-            elif line.startswith('page_data:'):
-                page_data = line.replace('page_data:', '').strip()
-        
-        if not document_title or not page_data:
+        if not pages:
             raise ValueError("文本文件格式不正确，必须包含document_title和page_data")
         
-        return {
-            "pages": [
-                {
-                    "title": document_title,
-                    "content": page_data
-                }
-            ]
-        }
+        return {"pages": pages}
         
     except Exception as e:
         print(f"解析文本文件错误: {e}")
@@ -372,9 +1332,66 @@ def parse_text_file(file_path: str) -> Dict:
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='通用型四阶段AI演示文稿智能设计框架')
-    parser.add_argument('input_file', help='输入文件路径（支持JSON或文本格式）')
+    parser.add_argument('input_file', help='输入文件路径（支持JSON、NDJSON(.ndjson/.jsonl)或文本格式，逐页流式读取）')
     parser.add_argument('--api-key', help='智谱AI API密钥（可选，优先使用环境变量）')
     parser.add_argument('--output', help='输出JSON文件路径（可选，默认自动生成）')
+    parser.add_argument('--api-url', help=f'chat/completions接口地址（默认{DEFAULT_API_URL}）')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'同时处理的页面数（默认{DEFAULT_CONCURRENCY}）')
+    parser.add_argument('--pool-size', type=int, help='keep-alive连接池大小（默认等于并发页数）')
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help=f'建连超时秒数（默认{DEFAULT_CONNECT_TIMEOUT:g}）')
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT,
+                        help=f'读取超时秒数（默认{DEFAULT_READ_TIMEOUT:g}）')
+    parser.add_argument('--rpm', type=float, help='每分钟请求数上限（默认不限）')
+    parser.add_argument('--tpm', type=float, help='每分钟token数上限（默认不限）')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f'遇到429时的最大重试次数（默认{DEFAULT_MAX_RETRIES}）')
+    parser.add_argument('--routing', choices=sorted(ROUTING_POLICIES), default=DEFAULT_POLICY,
+                        help='按阶段的模型路由策略：uniform所有阶段同一模型；'
+                             'tiered阶段1/3/4走快模型并收紧max_tokens，阶段2走强模型（默认uniform）')
+    parser.add_argument('--stage-model', action='append', metavar='STAGE=MODEL',
+                        help='覆盖某阶段的模型，如 stage2=glm-4.5（可重复）')
+    parser.add_argument('--stage-max-tokens', action='append', metavar='STAGE=N',
+                        help='覆盖某阶段的max_tokens，如 stage1=400（可重复）')
+    parser.add_argument('--endpoint', action='append', metavar='URL',
+                        help='备选chat/completions接口地址，每次请求选最近延迟最低的地址（可重复）')
+    parser.add_argument('--hedge-budget', type=float, default=0.0,
+                        help='对冲请求预算：请求超过该阶段p90仍未返回时再发一个相同请求，'
+                             '额外请求数不超过请求数的该比例（如0.1，默认0不对冲）')
+    parser.add_argument('--dedup', action='store_true',
+                        help='复用近似重复页面的设计结果（索引跨运行保存）')
+    parser.add_argument('--dedup-index', default=DEFAULT_DEDUP_INDEX,
+                        help=f'近似重复页面索引路径（默认{DEFAULT_DEDUP_INDEX}）')
+    parser.add_argument('--dedup-threshold', type=float, default=DEFAULT_DEDUP_THRESHOLD,
+                        help=f'近似重复的相似度阈值（字符3-gram的Jaccard估计，默认{DEFAULT_DEDUP_THRESHOLD}）')
+    parser.add_argument('--pack-size', type=int, default=0,
+                        help=f'短页面的阶段1/阶段3请求每N个合并为一次请求（如{DEFAULT_PACK_SIZE}，默认0不合并）')
+    parser.add_argument('--pack-max-chars', type=int, default=DEFAULT_PACK_MAX_CHARS,
+                        help=f'参与合并的请求user消息字符数上限（默认{DEFAULT_PACK_MAX_CHARS}）')
+    parser.add_argument('--pack-wait', type=float, default=DEFAULT_PACK_WAIT,
+                        help=f'合并时等待其他页面的最长秒数（默认{DEFAULT_PACK_WAIT:g}）')
+    parser.add_argument('--fused', action='store_true',
+                        help='每页先用一次请求完成阶段1-3，校验失败的页面再退回分阶段处理')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'阶段结果缓存目录（默认{DEFAULT_CACHE_DIR}）')
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help=f'缓存容量上限MB，超出后淘汰最久未用的条目（默认{DEFAULT_MAX_BYTES // 2**20}）')
+    parser.add_argument('--no-cache', action='store_true', help='不读写阶段结果缓存')
+    parser.add_argument('--local-layout', action='store_true',
+                        help='启用本地布局分类器：本地得分达到--layout-threshold的页面跳过阶段1请求（默认不启用）')
+    parser.add_argument('--layout-threshold', type=float, default=DEFAULT_LAYOUT_THRESHOLD,
+                        help=f'本地布局分类器的得分阈值（默认{DEFAULT_LAYOUT_THRESHOLD}）')
+    parser.add_argument('--stream', action='store_true',
+                        help='以SSE流式接收回答，阶段1的layout_choice一解析出来就开始阶段2')
+    parser.add_argument('--batch', action='store_true',
+                        help='批处理模式：各阶段的请求写成JSONL批任务提交并轮询，适合大型离线任务')
+    parser.add_argument('--batch-dir', help='批任务请求/结果文件目录（默认<输出文件名>_batch）')
+    parser.add_argument('--batch-url', help='批处理接口根地址（默认由--api-url推出，否则为智谱官方地址）')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f'批任务状态轮询间隔秒数（默认{DEFAULT_POLL_INTERVAL:g}）')
+    parser.add_argument('--journal', help='逐页结果日志NDJSON路径（默认<输出文件名>.journal.ndjson）')
+    parser.add_argument('--resume', action='store_true', help='从日志续跑，跳过已完成的页面')
     
     args = parser.parse_args()
     
@@ -392,27 +1409,75 @@ def main():
             # 从输入文件名生成结果文件名（如：input.txt → input_result.json）
             base_name = os.path.splitext(args.input_file)[0]
             output_file = f"{base_name}_result.json"
+        journal_file = args.journal or f"{os.path.splitext(output_file)[0]}.journal.ndjson"
         
-        # 读取输入文件
-        if args.input_file.endswith('.txt'):
-            input_data = parse_text_file(args.input_file)
-        else:
-            with open(args.input_file, 'r', encoding='utf-8') as f:
-                input_data = json.load(f)
-        
-        if not input_data.get("pages"):
+        # 读取输入文件：逐页惰性读取，非批处理模式下边读边处理
+        pages = iter_pages(args.input_file)
+        first_page = next(pages, None)
+        if first_page is None:
             print("错误: 输入文件不包含有效的页面数据")
             sys.exit(1)
+        pages = itertools.chain([first_page], pages)
         
         # 初始化框架
-        framework = PPTDesignFramework(api_key)
-        
-        # 处理演示文稿
-        result = framework.process_presentation(input_data["pages"])
+        cache = None if args.no_cache else StageCache(args.cache_dir, int(args.cache_max_mb * 2**20))
+        max_concurrency = args.pool_size or \
+            args.concurrency * (2 if args.stream else 1) * (2 if args.hedge_budget > 0 else 1)
+        rate_limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm, max_concurrency=max_concurrency,
+                                   max_retries=args.max_retries)
+        dedup_index = DedupIndex(args.dedup_index, args.dedup_threshold) if args.dedup else None
+        router = ModelRouter(args.routing, models=parse_stage_settings(args.stage_model),
+                             max_tokens=parse_stage_settings(args.stage_max_tokens, int))
+        framework = PPTDesignFramework(api_key, api_url=args.api_url, concurrency=args.concurrency,
+                                       pool_size=args.pool_size, connect_timeout=args.connect_timeout,
+                                       read_timeout=args.read_timeout, fused=args.fused, cache=cache,
+                                       layout_threshold=args.layout_threshold if args.local_layout else None,
+                                       stream=args.stream, rate_limiter=rate_limiter, router=router,
+                                       endpoints=args.endpoint, hedge_budget=args.hedge_budget,
+                                       dedup_index=dedup_index, pack_size=args.pack_size,
+                                       pack_max_chars=args.pack_max_chars, pack_wait=args.pack_wait)
         
-        # 保存结果
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        # 处理演示文稿，每页完成后写入日志；非批处理模式下结果逐页写入同目录的临时文件，
+        # 全部完成后再替换输出文件，中途崩溃不会留下残缺的JSON或破坏上一次的结果
+        tmp_output = f"{output_file}.tmp"
+        with PageJournal(journal_file, resume=args.resume) as journal, \
+                open(tmp_output, 'w', encoding='utf-8') as f:
+            if args.resume:
+                print(f"从日志续跑: {journal_file}（已有 {len(journal)} 页）")
+            if args.batch:
+                batch_url = args.batch_url or (args.api_url.rsplit("/chat/completions", 1)[0]
+                                               if args.api_url else DEFAULT_BATCH_BASE_URL)
+                batch_dir = args.batch_dir or f"{os.path.splitext(output_file)[0]}_batch"
+                batch_client = BatchClient(api_key, batch_url, poll_interval=args.poll_interval)
+                pages = list(pages)
+                result = framework.process_presentation_batch(pages, batch_client, batch_dir,
+                                                              journal=journal)
+                batch_client.close()
+                page_count = len(pages)
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            else:
+                page_count = framework.write_presentation(pages, f, journal=journal)
+        os.replace(tmp_output, output_file)
+        print(framework.client.stats.report())
+        print(rate_limiter.report())
+        print(router.report())
+        if args.hedge_budget > 0:
+            print(framework.hedge_report())
+        if framework.packer is not None:
+            print(framework.pack_report())
+        print(framework.token_report())
+        if not args.batch:
+            print(framework.timing_report())
+        print(f"JSON修复成功 {framework.parse_repairs} 次，失败 {framework.parse_failures} 次，"
+              f"因解析失败丢失 {framework.pages_lost_to_parse} 页")
+        if framework.layout_classifier is not None:
+            print(f"本地分类器决定布局 {framework.local_layouts}/{page_count} 页")
+        if cache is not None:
+            print(cache.report())
+        if dedup_index is not None:
+            print(dedup_index.report())
+            dedup_index.close()
+        framework.close()
         
         print(f"处理完成！结果已保存到: {output_file}")
         
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ppt2design异步任务服务（ASGI）
+进程内常驻一个PPTDesignFramework，连接池、阶段缓存与限流状态在各任务间保持；
+提交演示文稿得到任务ID，页面在有界的工作线程池上处理，可查询进度、逐页取结果或以NDJSON流式读取
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ppt2design import PPTDesignFramework
+from model_router import ModelRouter, ROUTING_POLICIES, DEFAULT_POLICY
+from rate_limiter import RateLimiter
+from stage_cache import StageCache, DEFAULT_CACHE_DIR
+
+try:
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import StreamingResponse
+    from pydantic import BaseModel, Field
+    FASTAPI_AVAILABLE = True
+except ImportError:
+    FASTAPI_AVAILABLE = False
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_JOBS = 4
+# 内存中保留的已结束任务数，超出时丢弃最早结束的任务
+DEFAULT_KEEP_FINISHED = 100
+# 流式结果接口等待新页面的轮询间隔秒数
+_STREAM_POLL = 1.0
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class DesignJob:
+    """一个演示文稿任务：页面结果按完成顺序追加，等待者通过条件变量得到通知"""
+
+    def __init__(self, pages: List[Dict]):
+        self.job_id = uuid.uuid4().hex
+        self.pages = pages
+        self.status = JOB_QUEUED
+        self.error: Optional[str] = None
+        self.quality_control: Optional[Dict] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # [{"page_index", "title", "result"}]，失败页面的result为None
+        self.completed: List[Dict] = []
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def _update(self, **fields) -> None:
+        with self._condition:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._condition.notify_all()
+
+    def add_page(self, page_index: int, result: Dict) -> None:
+        with self._condition:
+            self.completed.append({
+                "page_index": page_index,
+                "title": self.pages[page_index]["title"],
+                "result": result or None,
+            })
+            self._condition.notify_all()
+
+    def wait(self, offset: int, timeout: float) -> bool:
+        """等待到有第offset页之后的新结果或任务结束；返回是否有可读内容"""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.completed) > offset or self.finished, timeout)
+
+    def pages_since(self, offset: int = 0) -> List[Dict]:
+        with self._condition:
+            return self.completed[offset:]
+
+    def status_dict(self) -> Dict:
+        with self._condition:
+            failed = sum(1 for page in self.completed if page["result"] is None)
+            status = {
+                "job_id": self.job_id,
+                "status": self.status,
+                "pages_total": len(self.pages),
+                "pages_done": len(self.completed) - failed,
+                "pages_failed": failed,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.error is not None:
+                status["error"] = self.error
+            if self.quality_control is not None:
+                status["quality_control"] = self.quality_control
+            return status
+
+
+class JobManager:
+    """任务队列：最多max_jobs个任务同时运行，所有任务的页面共用一个按框架并发数设定的线程池"""
+
+    def __init__(self, framework: PPTDesignFramework, max_jobs: int = DEFAULT_MAX_JOBS,
+                 keep_finished: int = DEFAULT_KEEP_FINISHED):
+        self.framework = framework
+        self.keep_finished = keep_finished
+        self._jobs: "OrderedDict[str, DesignJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._job_pool = ThreadPoolExecutor(max_workers=max(1, max_jobs), thread_name_prefix="ppt2design-job")
+        self._page_pool = ThreadPoolExecutor(max_workers=framework.concurrency, thread_name_prefix="ppt2design-page")
+
+    def submit(self, pages: List[Dict]) -> DesignJob:
+        for i, page in enumerate(pages):
+            if not isinstance(page, dict) or not page.get("title") or not page.get("content"):
+                raise ValueError(f"第{i}页缺少title或content")
+        job = DesignJob(pages)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict()
+        self._job_pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[DesignJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.status_dict() for job in jobs]
+
+    def _evict(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.job_id]
+
+    def _run(self, job: DesignJob) -> None:
+        job._update(status=JOB_RUNNING, started_at=time.time())
+        try:
+            page_metadata = []
+            # 按完成顺序取结果，慢页面不阻塞其后已完成的页面；阶段4仍按页码顺序检查
+            for i, result in self.framework.iter_page_results(job.pages, executor=self._page_pool,
+                                                              ordered=False):
+                job.add_page(i, result)
+                if result:
+                    page_metadata.append(self.framework.page_metadata(i, result))
+            page_metadata.sort(key=lambda page: page["page_index"])
+            quality_control = self.framework.stage4_quality_control(page_metadata)
+            job._update(status=JOB_DONE, quality_control=quality_control, finished_at=time.time())
+        except Exception as e:
+            print(f"任务 {job.job_id} 失败: {e}")
+            job._update(status=JOB_FAILED, error=str(e), finished_at=time.time())
+
+    async def stream(self, job: DesignJob) -> AsyncIterator[str]:
+        """NDJSON：每完成一页输出一行{"page_index", "title", "result"}，最后一行为任务状态（含quality_control）"""
+        offset = 0
+        while True:
+            await asyncio.to_thread(job.wait, offset, _STREAM_POLL)
+            finished = job.finished
+            for page in job.pages_since(offset):
+                offset += 1
+                yield json.dumps(page, ensure_ascii=False) + "\n"
+            if finished and offset >= len(job.pages_since()):
+                yield json.dumps(job.status_dict(), ensure_ascii=False) + "\n"
+                return
+
+    def close(self) -> None:
+        self._job_pool.shutdown(wait=False, cancel_futures=True)
+        self._page_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_app(manager: JobManager) -> Any:
+    if not FASTAPI_AVAILABLE:
+        raise RuntimeError("任务服务需要fastapi: pip install fastapi uvicorn")
+
+    api = FastAPI(title="ppt2design Job Service")
+
+    class PageReq(BaseModel):
+        title: str = Field(..., description="页面标题")
+        content: str = Field(..., description="页面参考内容")
+
+    class DeckReq(BaseModel):
+        pages: List[PageReq] = Field(..., description="演示文稿的全部页面，与命令行JSON输入格式相同")
+
+    def find_job(job_id: str) -> DesignJob:
+        job = manager.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+        return job
+
+    @api.get("/health")
+    async def health():
+        return {"ok": True, "stats": manager.framework.client.stats.report()}
+
+    @api.post("/jobs", status_code=202)
+    async def submit(req: DeckReq):
+        if not req.pages:
+            raise HTTPException(status_code=422, detail="演示文稿不包含页面")
+        try:
+            job = manager.submit([{"title": page.title, "content": page.content} for page in req.pages])
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {"job_id": job.job_id, "status": job.status}
+
+    @api.get("/jobs")
+    async def list_jobs():
+        return {"jobs": manager.jobs()}
+
+    @api.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        return find_job(job_id).status_dict()
+
+    @api.get("/jobs/{job_id}/pages")
+    async def job_pages(job_id: str, offset: int = 0):
+        """已完成的页面（按完成顺序），offset为上次已取到的页数，便于轮询增量结果"""
+        job = find_job(job_id)
+        pages = job.pages_since(max(0, offset))
+        return {"status": job.status, "offset": max(0, offset) + len(pages), "pages": pages}
+
+    @api.get("/jobs/{job_id}/results")
+    async def job_results(job_id: str):
+        return StreamingResponse(manager.stream(find_job(job_id)), media_type="application/x-ndjson")
+
+    return api
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ppt2design异步任务服务')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'监听地址（默认{DEFAULT_HOST}）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口（默认{DEFAULT_PORT}）')
+    parser.add_argument('--api-key', help='智谱AI API密钥（也可通过环境变量ZHIPUAI_API_KEY设置）')
+    parser.add_argument('--api-url', help='聊天补全接口地址（默认为智谱官方地址）')
+    parser.add_argument('--concurrency', type=int, default=4, help='所有任务共享的页面并发数（默认4）')
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS,
+                        help=f'同时运行的任务数（默认{DEFAULT_MAX_JOBS}），其余任务排队')
+    parser.add_argument('--stream', action='store_true', help='流式模式：阶段1流式解析出布局后立即开始阶段2')
+    parser.add_argument('--fused', action='store_true', help='融合模式：每页一次请求完成阶段1-3')
+    parser.add_argument('--no-cache', action='store_true', help='禁用阶段缓存')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'阶段缓存目录（默认{DEFAULT_CACHE_DIR}）')
+    parser.add_argument('--routing', choices=sorted(ROUTING_POLICIES), default=DEFAULT_POLICY,
+                        help=f'按阶段的模型路由策略（默认{DEFAULT_POLICY}）')
+    parser.add_argument('--rpm', type=int, help='每分钟请求数上限')
+    parser.add_argument('--tpm', type=int, help='每分钟token数上限')
+    args = parser.parse_args()
+
+    api_key = args.api_key or os.environ.get('ZHIPUAI_API_KEY')
+    if not api_key:
+        print("错误: 请提供智谱AI API密钥（通过--api-key参数或ZHIPUAI_API_KEY环境变量）")
+        sys.exit(1)
+    try:
+        import uvicorn
+    except ImportError:
+        print("错误: 任务服务需要uvicorn: pip install fastapi uvicorn")
+        sys.exit(1)
+
+    cache = None if args.no_cache else StageCache(args.cache_dir)
+    rate_limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm,
+                               max_concurrency=args.concurrency * (2 if args.stream else 1))
+    framework = PPTDesignFramework(api_key, api_url=args.api_url, concurrency=args.concurrency,
+                                   fused=args.fused, cache=cache, stream=args.stream,
+                                   rate_limiter=rate_limiter, router=ModelRouter(args.routing))
+    manager = JobManager(framework, max_jobs=args.max_jobs)
+    try:
+        uvicorn.run(create_app(manager), host=args.host, port=args.port)
+    finally:
+        manager.close()
+        framework.close()
+        print(framework.client.stats.report())
+
+
+if __name__ == "__main__":
+    main()
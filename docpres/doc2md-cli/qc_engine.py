@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+阶段4的本地确定性质量检查
+标题编号残留、标题长度差异、item_count离群值都是算术或正则问题，在本地按列一次算完，
+输出与step4_output相同结构的问题列表；只有叙事流程方面的疑点才需要交给LLM判断
+"""
+
+import re
+import statistics
+from typing import Dict, List
+
+# 标题开头的文档编号：1. / 4.2 / 4.2.1、/ 一、/ （一）/ 第一章；
+# 编号的第一段最多3位，"2023年" "2023 年" "2023.10"这类年份与日期不算
+_NUMBERING = re.compile(
+    r'^\s*(?:\d{1,3}(?:\.\d+)+[.、)）]?\s*|\d{1,3}(?:[.、)）]\s*|\s+)|[（(][一二三四五六七八九十\d]+[)）]\s*'
+    r'|[一二三四五六七八九十]+[、.]\s*|第[一二三四五六七八九十\d]+[章节部分篇]\s*)'
+)
+# 用中位数绝对偏差（MAD）估计离散度，1.4826使其与正态分布的标准差可比
+_MAD_SCALE = 1.4826
+_OUTLIER_Z = 3.0
+# 同一布局连续出现达到该页数时视为流程疑点；常见演示文稿里三四页同一布局很普遍，不值得一次LLM复核
+_MONOTONY_RUN = 5
+# 每个问题从满分中扣除的分数
+_ISSUE_PENALTY = 0.05
+
+
+def strip_numbering(title: str) -> str:
+    return _NUMBERING.sub("", title, count=1)
+
+
+def _outliers(values: List[float], min_spread: float) -> List[bool]:
+    """稳健离群判定：偏离中位数超过 _OUTLIER_Z 个MAD标准差（且至少min_spread）"""
+    if len(values) < 3:
+        return [False] * len(values)
+    median = statistics.median(values)
+    spread = _MAD_SCALE * statistics.median(abs(v - median) for v in values)
+    threshold = max(_OUTLIER_Z * spread, min_spread)
+    return [abs(v - median) > threshold for v in values]
+
+
+def local_quality_issues(page_metadata: List[Dict]) -> List[Dict]:
+    """编号残留、标题长度离群、item_count离群三项检查，返回consistency_issues格式的问题列表"""
+    issues = []
+    titles = [page.get("page_title", "") for page in page_metadata]
+
+    for page, title in zip(page_metadata, titles):
+        stripped = strip_numbering(title)
+        if stripped != title:
+            issues.append({
+                "page_index": page["page_index"],
+                "issue": f"标题包含文档编号残留: \"{title[:len(title) - len(stripped)].strip()}\"",
+                "suggestion": f"去掉编号，改为\"{stripped}\""
+            })
+
+    lengths = [len(strip_numbering(title)) for title in titles]
+    median_length = statistics.median(lengths) if lengths else 0
+    for page, length, outlier in zip(page_metadata, lengths, _outliers(lengths, max(4.0, median_length * 0.5))):
+        if outlier:
+            direction = "过长" if length > median_length else "过短"
+            issues.append({
+                "page_index": page["page_index"],
+                "issue": f"标题{direction}（{length}字，全篇中位数{median_length:g}字），与其他页面风格不一致",
+                "suggestion": "调整标题长度，使其与其他页面的标题相近"
+            })
+
+    # 没有列表内容的页面（item_count为0）不参与比较
+    counted = [page for page in page_metadata if page.get("item_count", 0) > 0]
+    counts = [page["item_count"] for page in counted]
+    median_count = statistics.median(counts) if counts else 0
+    for page, outlier in zip(counted, _outliers(counts, 2.0)):
+        if outlier and page["item_count"] > median_count:
+            issues.append({
+                "page_index": page["page_index"],
+                "issue": f"内容条目明显多于其他页面（{page['item_count']}条，全篇中位数{median_count:g}条）",
+                "suggestion": "拆分为多页或合并相近的条目"
+            })
+        elif outlier:
+            issues.append({
+                "page_index": page["page_index"],
+                "issue": f"内容条目明显少于其他页面（{page['item_count']}条，全篇中位数{median_count:g}条）",
+                "suggestion": "补充内容或与相邻页面合并"
+            })
+
+    return sorted(issues, key=lambda issue: issue["page_index"])
+
+
+def flow_concerns(page_metadata: List[Dict]) -> List[Dict]:
+    """找出需要LLM判断叙事流程的疑点：同一布局连续出现、相邻页面标题重复
+
+    返回[{"page_indices": [...], "concern": str}]；为空时整份演示文稿无需调用LLM。
+    """
+    concerns = []
+    run_start = 0
+    for i in range(1, len(page_metadata) + 1):
+        if i < len(page_metadata) and \
+                page_metadata[i]["layout_choice"] == page_metadata[run_start]["layout_choice"]:
+            continue
+        if i - run_start >= _MONOTONY_RUN:
+            concerns.append({
+                "page_indices": [page["page_index"] for page in page_metadata[run_start:i]],
+                "concern": f"连续{i - run_start}页使用同一布局 {page_metadata[run_start]['layout_choice']}"
+            })
+        run_start = i
+
+    for previous, page in zip(page_metadata, page_metadata[1:]):
+        a = strip_numbering(previous.get("page_title", "")).strip()
+        b = strip_numbering(page.get("page_title", "")).strip()
+        if a and b and (a in b or b in a):
+            concerns.append({
+                "page_indices": [previous["page_index"], page["page_index"]],
+                "concern": "相邻页面标题重复或互相包含，内容可能重复"
+            })
+    return concerns
+
+
+def flow_review_pages(page_metadata: List[Dict], concerns: List[Dict]) -> List[Dict]:
+    """只保留疑点涉及的页面及其前后各一页，字段精简为页码、标题与布局"""
+    positions = {page["page_index"]: pos for pos, page in enumerate(page_metadata)}
+    keep = set()
+    for concern in concerns:
+        for index in concern["page_indices"]:
+            pos = positions[index]
+            keep.update(range(max(0, pos - 1), min(len(page_metadata), pos + 2)))
+    return [
+        {key: page_metadata[pos][key] for key in ("page_index", "page_title", "layout_choice")}
+        for pos in sorted(keep)
+    ]
+
+
+def consistency_score(n_pages: int, issues: List[Dict]) -> float:
+    """按问题数扣分；问题集中在少数页面时扣分相应较少"""
+    if not n_pages:
+        return 1.0
+    pages_with_issues = len({issue["page_index"] for issue in issues})
+    score = 1.0 - _ISSUE_PENALTY * len(issues) - 0.5 * pages_with_issues / n_pages
+    return round(max(0.0, score), 2)
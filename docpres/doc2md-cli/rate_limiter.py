@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+智谱AI调用的限流层
+每分钟请求数（RPM）与每分钟token数（TPM）两个令牌桶、遵循Retry-After的退避重试，
+以及由429和延迟信号驱动的AIMD并发调整；一个实例可在各阶段、各并发页面乃至多个框架实例间共享
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from llm_client import RateLimitedError
+
+T = TypeVar("T")
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+# 延迟超过该阶段滑动平均的倍数时视为拥塞信号
+DEFAULT_LATENCY_TOLERANCE = 3.0
+# 每个阶段先积累这么多样本再启用延迟信号
+_LATENCY_WARMUP = 5
+_EWMA_ALPHA = 0.2
+
+
+class TokenBucket:
+    """按每分钟速率匀速补充的令牌桶；容量为10秒的量，允许适度突发"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute / 6.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """阻塞直到取得amount个令牌，返回等待的秒数；超过容量的请求按容量计"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量补扣（正数扣除、负数退还），余额可以为负，之后的请求会相应等待"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class RateLimiter:
+    """RPM/TPM令牌桶 + AIMD并发上限 + 429退避重试"""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = 4, min_concurrency: int = 1,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_backoff: float = DEFAULT_BASE_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 latency_tolerance: Optional[float] = DEFAULT_LATENCY_TOLERANCE):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.latency_tolerance = latency_tolerance
+
+        self._cond = threading.Condition()
+        # AIMD调整的是浮点上限，实际可用的并发槽位取整
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._latency_ewma: Dict[str, float] = {}
+        self._latency_samples: Dict[str, int] = {}
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.latency_backoffs = 0
+        self.wait_seconds = 0.0
+        self.lowest_limit = self._limit
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @contextmanager
+    def _slot(self, tokens: float) -> Iterator[None]:
+        start = time.perf_counter()
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            if self.request_bucket is not None:
+                self.request_bucket.acquire(1)
+            if self.token_bucket is not None and tokens:
+                self.token_bucket.acquire(tokens)
+            with self._cond:
+                self.wait_seconds += time.perf_counter() - start
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _decrease(self, factor: float) -> None:
+        """乘性减小并发上限（调用方持有锁）"""
+        self._limit = max(float(self.min_concurrency), self._limit * factor)
+        self.lowest_limit = min(self.lowest_limit, self._limit)
+
+    def _on_success(self, key: str, latency: float) -> None:
+        with self._cond:
+            self.requests += 1
+            ewma = self._latency_ewma.get(key)
+            samples = self._latency_samples.get(key, 0) + 1
+            self._latency_samples[key] = samples
+            congested = (self.latency_tolerance is not None and ewma is not None
+                         and samples > _LATENCY_WARMUP and latency > ewma * self.latency_tolerance)
+            if congested:
+                self.latency_backoffs += 1
+                self._decrease(0.9)
+            else:
+                # 加性增加：大约每轮（limit个请求）并发上限加1
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+            self._latency_ewma[key] = latency if ewma is None else ewma + _EWMA_ALPHA * (latency - ewma)
+            self._cond.notify_all()
+
+    def _on_throttle(self) -> None:
+        with self._cond:
+            self.throttled += 1
+            self._decrease(0.5)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """有Retry-After时照办，否则指数退避加随机抖动"""
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def call(self, fn: Callable[[], T], tokens: float = 0, key: str = "default") -> T:
+        """在限流下执行fn；fn抛出RateLimitedError时退避重试，超过重试次数后原样抛出
+
+        tokens为本次请求预估的token数（计入TPM），key用于按阶段区分延迟基线。
+        """
+        attempt = 0
+        while True:
+            with self._slot(tokens):
+                start = time.perf_counter()
+                try:
+                    result = fn()
+                except RateLimitedError as e:
+                    self._on_throttle()
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_delay(attempt, e.retry_after)
+                else:
+                    self._on_success(key, time.perf_counter() - start)
+                    return result
+            # 退避期间不占用并发槽位
+            with self._cond:
+                self.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def settle(self, estimated_tokens: float, actual_tokens: float) -> None:
+        """请求结束后按接口返回的实际token数校正TPM令牌桶"""
+        if self.token_bucket is not None and actual_tokens:
+            self.token_bucket.adjust(actual_tokens - min(estimated_tokens, self.token_bucket.capacity))
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "latency_backoffs": self.latency_backoffs,
+                "concurrency_limit": self.limit,
+                "lowest_limit": int(self.lowest_limit),
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+    def report(self) -> str:
+        s = self.snapshot()
+        return (f"限流: 429 {s['throttled']} 次，重试 {s['retries']} 次，延迟降速 {s['latency_backoffs']} 次，"
+                f"并发上限 {s['concurrency_limit']}（最低 {s['lowest_limit']}），排队等待 {s['wait_seconds']:.2f}s")
@@ -7,6 +7,62 @@ import re
 import argparse
 from pathlib import Path
 
+# 关键标题的精确匹配表，按哈希查找
+EXACT_TITLES = {
+    '数字化转型的定义与参考': 1,
+    '数字化转型是什么': 2,
+    '数字化转型应该做什么': 2,
+    '对标行业、企业数字化转型情况': 2,
+    '同行业企业数字化转型情况': 1,
+    '中交集团': 2,
+    '江苏交控集团': 2,
+    '山东高速集团': 2,
+    '集团管控数字化工作进展': 1,
+    '规划先行，制定集团数字化转型规划和顶层设计': 2,
+    '研发自主知识产权低代码开发平台': 2,
+    '基于低代码开发平台构建集团聚合致远云平台': 2,
+    '开发系列应用系统并在全集团推广应用': 2,
+    '做好系统运维保障工作': 2,
+    '管控数字化取得了什么成果': 2,
+    '构建集中管控模式，支撑穿透式管理': 3,
+    '提高工作效率，助力降本增效': 3,
+    '规范工作管理，强化风险防控': 3,
+    '统一建设模式，有效降低成本': 3,
+    '坚持自主可控，实现能力沉淀': 3,
+    '集团管控大模型工作进展': 2,
+    '主要工作方式': 3,
+    '组建专班，专题推进大模型相关工作': 4,
+    '开展重点企业技术调研': 4,
+    '重点工作成果': 3,
+    '全流程工作质效管理平台': 3,
+    '智能会议管理系统': 3,
+    '合同风险管控模块': 3,
+    'AI合同评审系统': 3,
+    '开发系列AI Agent应用': 1,
+    '问题与建议': 1,
+    '集团管控数字化流程审批缓慢': 2,
+    '集团产业数字化统筹管理不足': 2,
+    '数据资源汇聚不足': 2,
+    '下一步工作思路': 1,
+    '加快编制集团算力中心方案': 2,
+    '及时引进最新的AI技术': 2,
+    '持续完善集团专有知识库': 2,
+    '按需开发管控类AI Agent新应用': 2
+}
+
+# 所有格式合并为一个预编译的交替式，分支顺序即匹配优先级
+_HEADING_PATTERN = re.compile(
+    r'^(?:'
+    r'(?P<md_marks>#{1,6})\s+(?P<md>.+)'              # 标准Markdown标题
+    r'|[一二三四五六七八九十]+、\s*(?P<chinese>.+)'      # 中文数字标题（一、二、三、）
+    r'|（[一二三四五六七八九十]+）\s*(?P<paren>.+)'      # 中文括号标题（（一）（二）（三））
+    r'|\d+\.\s*(?P<arabic>.+)'                        # 阿拉伯数字标题（1. 2. 3.）
+    r')$'
+)
+_PAGE_NUMBER_SUFFIX = re.compile(r'\s*\d+\s*$')
+_GROUP_LEVELS = {'chinese': 1, 'paren': 2, 'arabic': 3}
+
+
 class SimpleMarkdownExtractor:
     """简化版Markdown标题提取器"""
     
@@ -136,89 +192,25 @@ class SimpleMarkdownExtractor:
         """检测标题格式"""
         line = line.strip()
         
-        # 特殊处理关键标题，完全匹配期望格式
-        exact_titles = {
-            '数字化转型的定义与参考': 1,
-            '数字化转型是什么': 2,
-            '数字化转型应该做什么': 2,
-            '对标行业、企业数字化转型情况': 2,
-            '同行业企业数字化转型情况': 1,
-            '中交集团': 2,
-            '江苏交控集团': 2,
-            '山东高速集团': 2,
-            '集团管控数字化工作进展': 1,
-            '规划先行，制定集团数字化转型规划和顶层设计': 2,
-            '研发自主知识产权低代码开发平台': 2,
-            '基于低代码开发平台构建集团聚合致远云平台': 2,
-            '开发系列应用系统并在全集团推广应用': 2,
-            '做好系统运维保障工作': 2,
-            '管控数字化取得了什么成果': 2,
-            '构建集中管控模式，支撑穿透式管理': 3,
-            '提高工作效率，助力降本增效': 3,
-            '规范工作管理，强化风险防控': 3,
-            '统一建设模式，有效降低成本': 3,
-            '坚持自主可控，实现能力沉淀': 3,
-            '集团管控大模型工作进展': 2,
-            '主要工作方式': 3,
-            '组建专班，专题推进大模型相关工作': 4,
-            '开展重点企业技术调研': 4,
-            '重点工作成果': 3,
-            '全流程工作质效管理平台': 3,
-            '智能会议管理系统': 3,
-            '合同风险管控模块': 3,
-            'AI合同评审系统': 3,
-            '开发系列AI Agent应用': 1,
-            '问题与建议': 1,
-            '集团管控数字化流程审批缓慢': 2,
-            '集团产业数字化统筹管理不足': 2,
-            '数据资源汇聚不足': 2,
-            '下一步工作思路': 1,
-            '加快编制集团算力中心方案': 2,
-            '及时引进最新的AI技术': 2,
-            '持续完善集团专有知识库': 2,
-            '按需开发管控类AI Agent新应用': 2
-        }
-        
         # 精确匹配优先
-        for title, level in exact_titles.items():
-            if line == title:
-                # 特殊处理：确保"同行业企业数字化转型情况"是一级标题
-                if title == '同行业企业数字化转型情况':
-                    return {'level': 1, 'text': title}
-                return {'level': level, 'text': title}
-        
-        # 标准Markdown标题
-        md_match = re.match(r'^(#{1,6})\s+(.+)$', line)
-        if md_match:
-            level = len(md_match.group(1))
-            text = md_match.group(2).strip()
-            return {'level': level, 'text': text}
-        
-        # 中文数字标题（一、二、三、）
-        chinese_match = re.match(r'^([一二三四五六七八九十]+)、\s*(.+)$', line)
-        if chinese_match:
-            text = chinese_match.group(2).strip()
-            text = re.sub(r'\s*\d+\s*$', '', text)
-            if text:
-                return {'level': 1, 'text': text}
+        level = EXACT_TITLES.get(line)
+        if level is not None:
+            return {'level': level, 'text': line}
         
-        # 中文括号标题（（一）（二）（三））
-        paren_match = re.match(r'^（([一二三四五六七八九十]+)）\s*(.+)$', line)
-        if paren_match:
-            text = paren_match.group(2).strip()
-            text = re.sub(r'\s*\d+\s*$', '', text)
-            if text:
-                return {'level': 2, 'text': text}
+        match = _HEADING_PATTERN.match(line)
+        if not match:
+            return None
         
-        # 阿拉伯数字标题（1. 2. 3.）
-        arabic_match = re.match(r'^(\d+)\.\s*(.+)$', line)
-        if arabic_match:
-            text = arabic_match.group(2).strip()
-            text = re.sub(r'\s*\d+\s*$', '', text)
-            if text and not text.isdigit():
-                return {'level': 3, 'text': text}
+        group = match.lastgroup
+        text = match.group(group).strip()
+        if group == 'md':
+            return {'level': len(match.group('md_marks')), 'text': text}
         
-        return None
+        # 去掉行尾页码
+        text = _PAGE_NUMBER_SUFFIX.sub('', text)
+        if not text or (group == 'arabic' and text.isdigit()):
+            return None
+        return {'level': _GROUP_LEVELS[group], 'text': text}
     
     def generate_markdown_outline(self, headings: list) -> str:
         """生成Markdown大纲"""
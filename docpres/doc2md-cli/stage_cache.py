@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ppt2design各阶段结果的磁盘缓存
+键由阶段、提示词模板版本、模型、温度和输入内容的SHA256组成；按最近使用时间做LRU淘汰
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_DIR = ".ppt2design_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_cache_key(stage: str, template_version: int, model: str, temperature: float, inputs: Any) -> str:
+    """inputs为该阶段的全部输入（可JSON序列化），内容不同则键不同"""
+    input_sha = hashlib.sha256(
+        json.dumps(inputs, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    header = json.dumps([stage, template_version, model, temperature, input_sha])
+    return hashlib.sha256(header.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """每个条目一个JSON文件，命中时更新mtime，超出容量时删除最久未使用的条目"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_entries: Optional[int] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 键 -> 文件大小，按最近使用时间从旧到新排列；启动时扫描一次，之后只在内存中维护
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        files = sorted(self.directory.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Dict) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        payload = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        # 先写临时文件再原子替换，并发写同一键或中途崩溃都不会留下半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(payload) - self._entries.pop(key, 0)
+            self._entries[key] = len(payload)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and (
+            self._total_bytes > self.max_bytes
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self) -> str:
+        return (f"缓存命中 {self.hits} 次，未命中 {self.misses} 次，命中率 {self.hit_rate:.0%}，"
+                f"{len(self._entries)} 条 / {self._total_bytes / 2**20:.1f} MiB")
@@ -5,10 +5,29 @@
 测试脚本 - 测试ppt2design.py框架功能
 """
 
+import asyncio
 import os
 import sys
+import time
 import json
+import multiprocessing
+
+import pytest
+import ppt2design
 from ppt2design import PPTDesignFramework, parse_text_file
+from llm_client import try_parse_json
+from mock_zhipu_server import MockZhipuServer
+from stage_cache import StageCache
+from page_journal import PageJournal
+from ppt2design_service import JobManager, JOB_DONE, create_app
+import page_reader
+from page_reader import iter_pages
+from batch_client import BatchClient
+from dedup_index import DedupIndex
+from layout_classifier import LayoutClassifier, DEFAULT_LAYOUT_THRESHOLD, LOCAL_SOURCE
+from model_router import ModelRouter, STRONG_MODEL, DEFAULT_MODEL
+from qc_engine import strip_numbering
+from universal_extractor import UniversalExtractor, extract_corpus
 
 def test_parse_text_file():
     """测试文本文件解析功能"""
@@ -235,6 +254,628 @@ def test_complete_design_flow():
         import traceback
         traceback.print_exc()
 
+def test_process_presentation_concurrent_order():
+    """测试并发处理页面时输出顺序保持不变（使用本地模拟接口）"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(8)]
+    
+    with MockZhipuServer(latency=0.05) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=4)
+        result = framework.process_presentation(pages)
+    
+    titles = [page["stage2"]["step2_output"]["page_title"] for page in result["pages"]]
+    assert titles == [page["title"] for page in pages]
+    assert "step4_output" in result["quality_control"]
+
+def test_fused_mode_uses_one_request_per_page():
+    """测试融合模式下每页只发一次请求，且输出结构与分阶段一致"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(3)]
+    
+    with MockZhipuServer() as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, fused=True)
+        result = framework.process_presentation(pages)
+        request_count = server.request_count
+    
+    assert request_count == len(pages)  # 每页一次融合请求；三页同一布局不触发阶段4的LLM复核
+    assert framework.fused_fallbacks == 0
+    for page in result["pages"]:
+        assert set(page) == {"stage1", "stage2", "stage3"}
+        assert framework.validate_stage_output("step3_output", page["stage3"]["step3_output"])
+
+def test_stage_cache_reruns_only_edited_page(tmp_path):
+    """测试阶段缓存：重跑不发请求，只修改一页时只重新调用该页的三个阶段"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(5)]
+    
+    with MockZhipuServer() as server:
+        def run(deck):
+            framework = PPTDesignFramework("mock.key", api_url=server.api_url,
+                                           cache=StageCache(str(tmp_path)))
+            before = server.request_count
+            framework.process_presentation(deck)
+            return server.request_count - before, framework.cache
+        
+        first_calls, _ = run(pages)
+        rerun_calls, cache = run(pages)
+        edited = [dict(page) for page in pages]
+        edited[2]["title"] = "修改后的标题"
+        edited_calls, _ = run(edited)
+    
+    assert first_calls == len(pages) * 3 + 1
+    assert rerun_calls == 0
+    assert cache.hit_rate == 1.0
+    assert edited_calls == 3 + 1  # 被修改页的三个阶段 + 标题变化后的阶段4
+
+def test_prompt_prefix_is_static_across_pages():
+    """测试提示词前缀逐字节稳定：每页数据只出现在user消息中，重复前缀被服务端缓存计数"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(4)]
+    
+    with MockZhipuServer() as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url)
+        framework.process_presentation(pages)
+    
+    assert framework.prompt_prefixes == PPTDesignFramework("mock.key").prompt_prefixes
+    for prefix in framework.prompt_prefixes.values():
+        assert "第" not in prefix
+    for stage in ("stage1", "stage2", "stage3"):
+        # 第一页之后的调用都命中同一前缀
+        assert framework.usage[stage]["cached_tokens"] == framework.prefix_tokens[stage] * (len(pages) - 1)
+    assert "stage1" in framework.token_report()
+
+def test_local_layout_classifier_skips_confident_stage1():
+    """测试本地布局分类器：特征明显的页面不请求阶段1，不确定的页面仍交给LLM"""
+    pages = [
+        {"title": "2023年经营数据", "content": "营收同比增长23%，净利润12亿元，毛利率35.2%，市场份额提升至18%。"},
+        {"title": "实施步骤", "content": "首先调研需求，然后设计方案，接着开发测试，最后上线推广。"},
+        {"title": "第三页", "content": "第三页的内容"},
+    ]
+    
+    with MockZhipuServer() as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, layout_threshold=0.7)
+        result = framework.process_presentation(pages)
+        request_count = server.request_count
+    
+    assert framework.local_layouts == 2
+    assert request_count == 2 * 2 + 3  # 两页省掉阶段1 + 一页完整三阶段；布局各不相同，阶段4无需请求
+    layouts = [page["stage1"]["step1_output"]["layout_choice"] for page in result["pages"]]
+    assert layouts[:2] == ["TEMPLATE_DATA", "TEMPLATE_FLOW"]
+    local = result["pages"][0]["stage1"]["step1_output"]
+    assert local["source"] == LOCAL_SOURCE and local["confidence_score"] is None
+    assert "source" not in result["pages"][2]["stage1"]["step1_output"]
+    
+    # "路径""阶段""最终"等一般叙述用词不再被当作流程特征，示例输入的第一页仍交给LLM
+    with open("example_input.json", "r", encoding="utf-8") as f:
+        wave_path = json.load(f)["pages"][0]
+    assert LayoutClassifier().classify(wave_path["title"], wave_path["content"])["local_score"] < \
+        DEFAULT_LAYOUT_THRESHOLD
+
+def test_stage4_local_checks_and_flow_review():
+    """测试阶段4：编号、标题长度与条目数在本地检查，只有流程疑点才请求LLM"""
+    metadata = [
+        {"page_index": 0, "page_title": "1. 项目背景", "layout_choice": "TEMPLATE_BLOCKS", "item_count": 3},
+        {"page_index": 1, "page_title": "市场分析", "layout_choice": "TEMPLATE_DATA", "item_count": 3},
+        {"page_index": 2, "page_title": "实施路径与关键里程碑及其各阶段负责团队安排说明",
+         "layout_choice": "TEMPLATE_FLOW", "item_count": 9},
+        {"page_index": 3, "page_title": "团队介绍", "layout_choice": "TEMPLATE_BLOCKS", "item_count": 3},
+    ]
+    
+    with MockZhipuServer() as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url)
+        result = framework.stage4_quality_control(metadata)
+        assert server.request_count == 0
+        
+        # 连续四页同一布局很常见，不请求LLM；连续五页以上才属于流程疑点，需要LLM复核
+        monotonous = [dict(page, layout_choice="TEMPLATE_BLOCKS") for page in metadata]
+        framework.stage4_quality_control(monotonous)
+        assert server.request_count == 0
+        monotonous.append({"page_index": 4, "page_title": "合作方式", "layout_choice": "TEMPLATE_BLOCKS",
+                           "item_count": 3})
+        framework.stage4_quality_control(monotonous)
+        assert server.request_count == 1
+    
+    issues = result["step4_output"]["consistency_issues"]
+    assert [issue["page_index"] for issue in issues] == [0, 2, 2]
+    assert "项目背景" in issues[0]["suggestion"]
+    # 年份与日期不是文档编号
+    for title in ["2023 年回顾", "2023年回顾", "2023.10 月度总结", "2024 Q1 目标"]:
+        assert strip_numbering(title) == title
+    assert strip_numbering("4.2.1 实施计划") == "实施计划"
+    assert result["step4_output"]["overall_consistency_score"] < 1.0
+
+def test_mock_server_canned_outputs_and_latency_records():
+    """测试模拟接口可替换固定输出，框架按阶段记录请求耗时"""
+    canned = {"step1_output": {"layout_choice": "TEMPLATE_DATA", "confidence_score": 0.8, "reasoning": "mock"}}
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(3)]
+    
+    with MockZhipuServer(latency=0.01, latency_distribution="lognormal", canned=canned, seed=1) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url)
+        result = framework.process_presentation(pages)
+    
+    assert [page["stage1"]["step1_output"]["layout_choice"] for page in result["pages"]] == ["TEMPLATE_DATA"] * 3
+    assert {stage: len(v) for stage, v in framework.call_latencies.items()} == \
+        {"stage1": 3, "stage2": 3, "stage3": 3}
+    assert framework.parse_seconds > 0
+
+def test_tiered_routing_records_model_and_prefers_faster_endpoint():
+    """测试按阶段路由模型：输出记录实际服务的模型，多个地址时偏向延迟低的地址"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(6)]
+    
+    with MockZhipuServer(latency=0.2) as slow, MockZhipuServer() as fast:
+        framework = PPTDesignFramework("mock.key", api_url=slow.api_url, endpoints=[fast.api_url], concurrency=1,
+                                       router=ModelRouter("tiered"))
+        result = framework.process_presentation(pages)
+        slow_requests, fast_requests = slow.request_count, fast.request_count
+    
+    page = result["pages"][0]
+    assert page["stage1"]["served_by"]["model"] == DEFAULT_MODEL
+    assert page["stage2"]["served_by"]["model"] == STRONG_MODEL
+    assert framework.router.route("stage1")["max_tokens"] < framework.router.route("stage2")["max_tokens"]
+    # 每个阶段在慢地址上只需试探一次
+    assert fast_requests > slow_requests
+    assert "tiered" in framework.router.report()
+
+def test_hedged_request_fires_after_p90_within_budget():
+    """测试对冲请求：超过该阶段p90仍未返回时再发一份，额外请求数受预算限制"""
+    with MockZhipuServer(latency=0.3) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, hedge_budget=0.5)
+        for _ in range(20):
+            framework._record_latency("stage1", 0.05)
+        results = [framework.stage1_strategy_layout(f"第{i}页", "内容") for i in range(4)]
+        framework.close()
+        request_count = server.request_count
+    
+    assert all(r["step1_output"]["layout_choice"] == "TEMPLATE_BLOCKS" for r in results)
+    # 预算50%：4个请求最多对冲2次
+    assert framework.hedges_sent == 2
+    assert request_count == 4 + 2
+    assert "对冲请求: 2 次" in framework.hedge_report()
+    # 每个逻辑请求只记录胜出一方的耗时
+    assert len(framework.call_latencies["stage1"]) == 20 + 4
+
+def test_latency_and_timing_records_are_bounded():
+    """测试请求耗时与单页耗时只保留最近的样本，常驻服务中不随请求数增长"""
+    framework = PPTDesignFramework("mock.key", api_url="http://127.0.0.1:9/unused")
+    for i in range(ppt2design._HEDGE_WINDOW * 3):
+        framework._record_latency("stage1", 0.01 if i < ppt2design._HEDGE_WINDOW * 2 else 1.0)
+    assert len(framework.call_latencies["stage1"]) == ppt2design._HEDGE_WINDOW
+    # p90只由最近窗口内的样本决定
+    assert framework.hedge_delay("stage1") == 1.0
+    assert framework.page_timings.maxlen == ppt2design._TIMING_WINDOW
+    framework.close()
+
+def test_dedup_index_reuses_near_duplicate_pages_across_runs(tmp_path):
+    """测试近似重复页面：索引跨运行保存，内容相同的页面不发请求，近似重复的页面只重做阶段2"""
+    intro = ("公司成立于2008年，总部位于上海，是一家专注于企业数字化服务的科技公司。"
+             "公司拥有员工3200人，服务客户超过1500家，业务覆盖金融、制造、零售与医疗四大行业，"
+             "在北京、深圳、成都设有研发中心。")
+    index_path = str(tmp_path / "dedup.ndjson")
+    
+    with MockZhipuServer() as server:
+        with DedupIndex(index_path) as index:
+            framework = PPTDesignFramework("mock.key", api_url=server.api_url, dedup_index=index)
+            framework.process_presentation([{"title": "公司简介", "content": intro}])
+        first_calls = server.request_count
+        
+        pages = [
+            {"title": "关于我们", "content": intro.replace("，", ", ")},
+            {"title": "企业概况", "content": intro.replace("3200", "3600")},
+        ]
+        with DedupIndex(index_path) as index:
+            assert len(index) == 1
+            framework = PPTDesignFramework("mock.key", api_url=server.api_url, dedup_index=index)
+            result = framework.process_presentation(pages)
+        second_calls = server.request_count - first_calls
+    
+    assert first_calls == 3
+    assert second_calls == 1  # 只有近似重复页面的阶段2
+    assert framework.dedup_reused == 1 and framework.dedup_partial == 1
+    exact, near = result["pages"]
+    assert exact["stage2"]["step2_output"]["page_title"] == "关于我们"
+    assert exact["reused_from"]["similarity"] == 1.0
+    assert near["reused_from"]["page_title"] == "公司简介"
+
+def test_streaming_input_feeds_pages_lazily(tmp_path, monkeypatch):
+    """测试流式输入：JSON/NDJSON/多记录文本逐页读取，页面边读边处理，结果逐页写出"""
+    monkeypatch.setattr(page_reader, "CHUNK_SIZE", 7)  # 让页面跨越多个读取块
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容，数值{i * 1.5}"} for i in range(6)]
+    json_path = tmp_path / "deck.json"
+    json_path.write_text(json.dumps({"document": "演示", "pages": pages}, ensure_ascii=False), encoding="utf-8")
+    ndjson_path = tmp_path / "deck.ndjson"
+    ndjson_path.write_text("".join(json.dumps(page, ensure_ascii=False) + "\n\n" for page in pages), encoding="utf-8")
+    text_path = tmp_path / "deck.txt"
+    text_path.write_text("document_title: 概况\npage_data:第一段\n第二段\n"
+                         "document_title: 缺内容\n"
+                         "document_title: 总结\npage_data:结论\n", encoding="utf-8")
+    
+    assert list(iter_pages(str(json_path))) == pages
+    assert list(iter_pages(str(ndjson_path))) == pages
+    assert list(iter_pages(str(text_path))) == [{"title": "概况", "content": "第一段\n第二段"},
+                                                {"title": "总结", "content": "结论"}]
+    
+    consumed = []
+    def reader():
+        for page in iter_pages(str(ndjson_path)):
+            consumed.append(page)
+            yield page
+    
+    with MockZhipuServer() as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=2)
+        results = framework.iter_page_results(reader())
+        first_index, _ = next(results)
+        assert first_index == 0 and len(consumed) <= 4
+        assert [i for i, _ in results] == list(range(1, 6))
+        
+        output_path = tmp_path / "deck_result.json"
+        with open(output_path, "w", encoding="utf-8") as f:
+            assert framework.write_presentation(iter_pages(str(json_path)), f) == len(pages)
+        expected = framework.process_presentation(pages)
+    
+    written = json.loads(output_path.read_text(encoding="utf-8"))
+    assert written == expected
+    assert output_path.read_text(encoding="utf-8") == json.dumps(expected, ensure_ascii=False, indent=2)
+
+def test_job_service_streams_pages_of_concurrent_jobs():
+    """测试任务服务：多个任务共用一个框架实例与页面线程池，逐页结果按完成顺序、在任务结束前即可读取"""
+    decks = [[{"title": f"任务{j}第{i}页", "content": f"任务{j}第{i}页的内容"} for i in range(4)] for j in range(2)]
+    
+    async def collect(manager, job):
+        return [json.loads(line) async for line in manager.stream(job)]
+    
+    with MockZhipuServer(latency=0.05) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=2)
+        process_single_page = framework.process_single_page
+        
+        def slow_first_page(page_title, reference_content):
+            if page_title == "任务0第0页":
+                time.sleep(0.5)
+            return process_single_page(page_title, reference_content)
+        
+        framework.process_single_page = slow_first_page
+        manager = JobManager(framework, max_jobs=2)
+        jobs = [manager.submit(deck) for deck in decks]
+        assert jobs[0].wait(0, 10) and not jobs[0].finished  # 第一页完成时任务仍在运行
+        streamed = [asyncio.run(collect(manager, job)) for job in jobs]
+        manager.close()
+    
+    for deck, job, lines in zip(decks, jobs, streamed):
+        *pages, final = lines
+        assert sorted(page["page_index"] for page in pages) == list(range(len(deck)))
+        assert all(page["title"] == deck[page["page_index"]]["title"] for page in pages)
+        assert all(page["result"]["stage2"]["step2_output"]["page_title"] == page["title"] for page in pages)
+        assert final["status"] == JOB_DONE and final["pages_done"] == len(deck)
+        assert "step4_output" in final["quality_control"]
+        assert job.pages_since(2) == pages[2:]
+    assert streamed[0][0]["page_index"] != 0  # 慢页面不阻塞其后已完成的页面
+    assert server.request_count == 2 * 4 * 3  # 四页的任务不触发阶段4的LLM复核
+
+def test_job_service_http_routes():
+    """测试任务服务的HTTP接口：提交、状态、增量取页、NDJSON流式结果与错误码（需要fastapi）"""
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+    deck = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(3)]
+    
+    with MockZhipuServer(latency=0.02) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=2)
+        manager = JobManager(framework)
+        with TestClient(create_app(manager)) as client:
+            assert client.get("/health").json()["ok"]
+            assert client.post("/jobs", json={"pages": []}).status_code == 422
+            assert client.post("/jobs", json={"pages": [{"title": "缺内容"}]}).status_code == 422
+            assert client.get("/jobs/missing").status_code == 404
+            
+            response = client.post("/jobs", json={"pages": deck})
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            with client.stream("GET", f"/jobs/{job_id}/results") as stream:
+                assert stream.headers["content-type"].startswith("application/x-ndjson")
+                lines = [json.loads(line) for line in stream.iter_lines() if line]
+            
+            status = client.get(f"/jobs/{job_id}").json()
+            polled = client.get(f"/jobs/{job_id}/pages", params={"offset": 1}).json()
+            listed = client.get("/jobs").json()["jobs"]
+        manager.close()
+    
+    *pages, final = lines
+    assert sorted(page["page_index"] for page in pages) == [0, 1, 2]
+    assert final["status"] == status["status"] == JOB_DONE and status["pages_done"] == 3
+    assert "step4_output" in status["quality_control"]
+    assert polled["offset"] == 3 and polled["pages"] == pages[1:]
+    assert [job["job_id"] for job in listed] == [job_id]
+
+def test_packed_short_pages_retry_only_invalid_elements():
+    """测试合并请求：短页面的阶段1/3每3页合并为一次请求，合并回答中缺失的页面单独重试"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的简短内容"} for i in range(6)]
+    
+    with MockZhipuServer(latency=0.05, packed_drop=1) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=6,
+                                       pack_size=3, pack_wait=1.0)
+        result = framework.process_presentation(pages)
+        request_count = server.request_count
+        packed_request_count = server.packed_request_count
+    
+    assert len(result["pages"]) == len(pages)
+    assert packed_request_count == framework.packed_requests == 4  # 阶段1、3各两组
+    assert framework.pack_retries == 4 and framework.packed_pages == 8
+    assert request_count == 4 + framework.pack_retries + len(pages) + 1  # 合并请求 + 单独重试 + 阶段2 + 阶段4
+    packed = [page for page in result["pages"] if page["stage1"]["served_by"].get("packed_pages") == 3]
+    assert len(packed) == 4
+    for page in result["pages"]:
+        assert framework.validate_stage_output("step3_output", page["stage3"]["step3_output"])
+
+def test_pack_flushes_once_all_in_flight_pages_are_waiting():
+    """测试合并请求：在途页面都已进入合并组时立即发送，不等满pack_wait"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的简短内容"} for i in range(2)]
+    
+    with MockZhipuServer(latency=0.05) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=4,
+                                       pack_size=4, pack_wait=5.0)
+        start = time.perf_counter()
+        result = framework.process_presentation(pages)
+        elapsed = time.perf_counter() - start
+        packed_request_count = server.packed_request_count
+    
+    assert len(result["pages"]) == len(pages)
+    assert packed_request_count == framework.packed_requests == 2  # 阶段1、3各一组，每组两页
+    assert framework.packer.early_flushes == 2
+    assert elapsed < framework.packer.max_wait
+
+def test_try_parse_json_tolerates_llm_formatting():
+    """测试容错JSON解析：代码围栏、前后说明文字、尾随逗号、中文弯引号"""
+    assert try_parse_json('```json\n{"a": 1,}\n```') == {"a": 1}
+    assert try_parse_json('结果如下：\n{"a": [1, 2,]}\n以上。') == {"a": [1, 2]}
+    assert try_parse_json('{\u201ca\u201d: \u201cb\u201d}') == {"a": "b"}
+    assert try_parse_json('{"a": "说\u201c波状\u201d路径"}') == {"a": "说\u201c波状\u201d路径"}
+    assert try_parse_json('{"a": 1') is None
+
+def test_malformed_json_is_repaired_instead_of_dropping_page():
+    """测试回答被截断时只发一次修复请求，页面不丢失"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(4)]
+    
+    with MockZhipuServer(malformed_every=4) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=1)
+        result = framework.process_presentation(pages)
+        request_count = server.request_count
+    
+    stage_calls = len(pages) * 3
+    assert framework.parse_repairs == stage_calls // 4
+    assert request_count == stage_calls + framework.parse_repairs
+    assert framework.pages_lost_to_parse == 0
+    titles = [page["stage2"]["step2_output"]["page_title"] for page in result["pages"]]
+    assert titles == [page["title"] for page in pages]
+
+def test_failed_repair_request_counts_page_as_lost_to_parse():
+    """测试修复请求本身抛出异常时页面被计入pages_lost_to_parse"""
+    with MockZhipuServer(malformed_every=1) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=1)
+        chat = framework._chat
+        
+        def failing_repair(content, system_message, stage, *args):
+            if stage == "repair":
+                raise RuntimeError("repair unavailable")
+            return chat(content, system_message, stage, *args)
+        
+        framework._chat = failing_repair
+        result = framework.process_single_page("第0页", "第0页的内容")
+    
+    assert result == {}
+    assert framework.parse_failures == 1
+    assert framework.pages_lost_to_parse == 1
+
+@pytest.mark.parametrize("canned", [
+    {"step1_output": {"reasoning": "缺少layout_choice"}},
+    {"step2_output": "不是对象"},
+])
+def test_wrong_shape_reply_counts_page_as_lost_instead_of_aborting(canned):
+    """测试回答是合法JSON但结构不对时，页面计入pages_lost_to_parse，其余流程照常完成"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(3)]
+    
+    with MockZhipuServer(canned=canned) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=1)
+        result = framework.process_presentation(pages)
+    
+    assert result["pages"] == []
+    assert framework.pages_lost_to_parse == len(pages)
+    assert "step4_output" in result["quality_control"]
+
+def test_stream_starts_stage2_before_stage1_finishes():
+    """测试流式模式：解析到layout_choice即开始阶段2，阶段1的完整输出仍然保留"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(2)]
+    
+    with MockZhipuServer(chunk_latency=0.03) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, stream=True)
+        result = framework.process_presentation(pages)
+        framework.close()
+    
+    # 阶段1回答约20个块，layout_choice在前5个块内出现
+    stage1_seconds = 20 * 0.03
+    for timing in framework.page_timings:
+        assert timing["first_stage2_seconds"] < stage1_seconds * 0.75
+    for page, source in zip(result["pages"], pages):
+        assert page["stage1"]["step1_output"]["reasoning"].startswith("mock:")
+        assert page["stage2"]["step2_output"]["page_title"] == source["title"]
+
+def test_batch_mode_submits_one_file_per_stage(tmp_path):
+    """测试批处理模式：阶段1-3全部经批任务完成（超出上限时拆分），同步请求只有阶段4"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(5)]
+    
+    with MockZhipuServer(batch_delay=0.05) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url)
+        batch_client = BatchClient("mock.key", server.batch_base_url, poll_interval=0.01, max_requests=3)
+        result = framework.process_presentation_batch(pages, batch_client, str(tmp_path))
+        batch_client.close()
+        request_count = server.request_count
+        batch_line_count = server.batch_line_count
+    
+    assert request_count == 1
+    assert batch_line_count == len(pages) * 3
+    assert sorted(p.name for p in tmp_path.glob("stage1-*.jsonl")) == [
+        "stage1-0-output.jsonl", "stage1-0.jsonl", "stage1-1-output.jsonl", "stage1-1.jsonl"]
+    titles = [page["stage2"]["step2_output"]["page_title"] for page in result["pages"]]
+    assert titles == [page["title"] for page in pages]
+    assert framework.usage["stage3"]["calls"] == len(pages)
+
+def test_rate_limiter_retries_429_and_lowers_concurrency():
+    """测试限流：接口返回429时按Retry-After重试、降低并发上限，页面不丢失"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(8)]
+    
+    with MockZhipuServer(latency=0.05, max_inflight=2, retry_after=0.02) as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url, concurrency=8)
+        result = framework.process_presentation(pages)
+        throttled_count = server.throttled_count
+    
+    stats = framework.rate_limiter.snapshot()
+    assert throttled_count > 0
+    assert stats["throttled"] == throttled_count
+    assert stats["lowest_limit"] < 8
+    assert len(result["pages"]) == len(pages)
+
+HEADINGS_DOC = "\n".join(
+    f"{marks} {title}\n{title}部分的正文内容，这一行足够长以便被识别为正文。"
+    for marks, title in [("#", "总览"), ("##", "背景"), ("##", "方案"), ("##", "风险"), ("##", "计划")]
+)
+
+def _write_headings_doc(tmp_path):
+    path = tmp_path / "doc.md"
+    path.write_text(HEADINGS_DOC, encoding="utf-8")
+    return str(path)
+
+def _renamed(headings, renames):
+    return [dict(h, text=renames.get(h["text"], h["text"])) for h in headings]
+
+def test_extractor_returns_rules_within_budget_and_caches_late_llm_result(tmp_path):
+    """测试标题提取：LLM超出预算时按时返回规则结果，迟到的LLM结果在后台协调并写入缓存，再次提取直接命中"""
+    path = _write_headings_doc(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    extractor = UniversalExtractor(llm_budget=0.2, cache_dir=cache_dir)
+    rule_result = extractor.extract_with_rules(HEADINGS_DOC)
+    
+    def slow_llm(content):
+        time.sleep(0.6)
+        return _renamed(extractor.extract_with_rules(content), {"总览": "项目总览"})
+    
+    extractor.extract_with_langextract = slow_llm
+    start = time.perf_counter()
+    headings = extractor.extract_headings(path)
+    assert time.perf_counter() - start < 0.4
+    assert headings == rule_result
+    
+    assert extractor.has_pending_results
+    assert extractor.wait_for_late_results(5) == 0
+    late = [h["text"] for h in extractor.extract_headings(path)]
+    assert late[0] == "项目总览"
+    
+    def unexpected_llm(content):
+        raise AssertionError("缓存命中时不应调用LLM")
+    
+    fresh = UniversalExtractor(llm_budget=0.2, cache_dir=cache_dir)
+    fresh.extract_with_langextract = unexpected_llm
+    assert [h["text"] for h in fresh.extract_headings(path)] == late
+
+def test_extractor_does_not_cache_empty_llm_result(tmp_path):
+    """测试LLM失败（返回空）时不写缓存，下次仍重新询问"""
+    path = _write_headings_doc(tmp_path)
+    calls = []
+    extractor = UniversalExtractor(llm_budget=1.0, cache_dir=str(tmp_path / "cache"))
+    extractor.extract_with_langextract = lambda content: calls.append(content) or []
+    
+    extractor.extract_headings(path)
+    extractor.extract_headings(path)
+    assert len(calls) == 2
+    assert not list((tmp_path / "cache").glob("*/*.json"))
+
+def test_extractor_requeries_only_disagreeing_spans(tmp_path):
+    """测试两种方法不一致时只对不一致的片段重新询问，一致的部分沿用LLM结果"""
+    path = _write_headings_doc(tmp_path)
+    extractor = UniversalExtractor(llm_budget=2.0)
+    windows = []
+    
+    def llm(content):
+        if content == HEADINGS_DOC:
+            return _renamed(extractor.extract_with_rules(content), {"方案": "技术方案", "计划": "实施计划"})
+        windows.append(content)
+        return _renamed(extractor.extract_with_rules(content), {"方案": "方案（复核）", "计划": "计划（复核）"})
+    
+    extractor.extract_with_langextract = llm
+    headings = extractor.extract_headings(path)
+    
+    assert [h["text"] for h in headings] == ["总览", "背景", "方案（复核）", "风险", "计划（复核）"]
+    assert len(windows) == 2
+    assert all("总览" not in window for window in windows)
+
+def test_extractor_keeps_budget_when_span_requeries_are_slow(tmp_path):
+    """测试片段重新询问并发执行且受剩余预算约束，超时的片段先沿用LLM结果，完整结果在后台写入缓存"""
+    path = _write_headings_doc(tmp_path)
+    extractor = UniversalExtractor(llm_budget=0.5, cache_dir=str(tmp_path / "cache"))
+    llm_result = _renamed(extractor.extract_with_rules(HEADINGS_DOC), {"方案": "技术方案", "计划": "实施计划"})
+    
+    def llm(content):
+        if content == HEADINGS_DOC:
+            return [dict(h) for h in llm_result]
+        time.sleep(1.0)
+        return _renamed(extractor.extract_with_rules(content), {"方案": "方案（复核）", "计划": "计划（复核）"})
+    
+    extractor.extract_with_langextract = llm
+    start = time.perf_counter()
+    headings = extractor.extract_headings(path)
+    assert time.perf_counter() - start < 0.8  # 两个片段各需1秒，串行执行会超过2秒
+    assert headings == llm_result
+    
+    assert extractor.wait_for_late_results(5) == 0
+    assert [h["text"] for h in extractor.extract_headings(path)] == \
+        ["总览", "背景", "方案（复核）", "风险", "计划（复核）"]
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="替换的提取方法需要由fork继承到工作进程")
+def test_extract_corpus_writes_one_record_per_file(tmp_path, monkeypatch):
+    """测试语料模式：2个工作进程逐文件写JSONL，出错的文件记为错误记录而不中断进程池"""
+    corpus = tmp_path / "corpus"
+    (corpus / "sub").mkdir(parents=True)
+    for i in range(5):
+        (corpus / f"doc{i}.md").write_text(f"# 标题{i}\n正文\n", encoding="utf-8")
+    (corpus / "sub" / "broken.md").write_text("# 损坏\n正文\n", encoding="utf-8")
+    (corpus / "sub" / "binary.md").write_bytes(b"\xff\xfe\x00bad")
+    
+    def stub_rules(self, content):
+        if "损坏" in content:
+            raise ValueError("无法解析")
+        return [{"text": content.split("\n")[0].lstrip("# "), "level": 1}]
+    
+    monkeypatch.setattr(UniversalExtractor, "extract_with_rules", stub_rules)
+    output = tmp_path / "headings.jsonl"
+    stats = extract_corpus(str(corpus), str(output), jobs=2, chunksize=1)
+    
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert sorted(os.path.basename(r["file"]) for r in records) == \
+        ["binary.md", "broken.md"] + [f"doc{i}.md" for i in range(5)]
+    errors = {os.path.basename(r["file"]) for r in records if "error" in r}
+    assert errors == {"binary.md", "broken.md"}
+    assert stats["files"] == 7 and stats["errors"] == 2 and stats["headings"] == 5
+    assert stats["jobs"] == 2
+    assert stats["lines_per_sec_per_core"] == pytest.approx(stats["lines_per_sec"] / 2)
+
+def test_journal_resume_skips_completed_pages(tmp_path):
+    """测试逐页日志：中途崩溃（含写了一半的行）后续跑只处理未完成的页面"""
+    pages = [{"title": f"第{i}页", "content": f"第{i}页的内容"} for i in range(5)]
+    journal_path = tmp_path / "deck.journal.ndjson"
+    
+    with MockZhipuServer() as server:
+        framework = PPTDesignFramework("mock.key", api_url=server.api_url)
+        with PageJournal(str(journal_path)) as journal:
+            framework.process_presentation(pages, journal=journal)
+            assert len(journal) == 0  # 本次写入的结果不在内存中保留
+        
+        # 模拟处理到第3页时崩溃：只保留前3条记录和半行
+        lines = journal_path.read_text(encoding="utf-8").splitlines(keepends=True)
+        journal_path.write_text("".join(lines[:3]) + lines[3][:20], encoding="utf-8")
+        
+        before = server.request_count
+        with PageJournal(str(journal_path), resume=True) as journal:
+            assert len(journal) == 3
+            result = framework.process_presentation(pages, journal=journal)
+        resumed_calls = server.request_count - before
+    
+    assert resumed_calls == 2 * 3 + 1  # 剩余两页的三个阶段 + 阶段4
+    titles = [page["stage2"]["step2_output"]["page_title"] for page in result["pages"]]
+    assert titles == [page["title"] for page in pages]
+    assert len(journal_path.read_text(encoding="utf-8").splitlines()) == 5
+
 if __name__ == "__main__":
     print("开始测试ppt2design框架...")
     print("=" * 50)
@@ -2,12 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import difflib
+import hashlib
 import re
 import json
+import multiprocessing
 import os
-from typing import List, Dict, Optional
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, List, Dict, Optional, Tuple
 from pathlib import Path
 
+from outline import Outline
+from stage_cache import StageCache
+
 try:
     from langextract import extract
     from dotenv import load_dotenv
@@ -15,9 +25,127 @@ try:
 except ImportError:
     LANGEXTRACT_AVAILABLE = False
 
+# 所有规则合并为一个预编译的交替式，分支顺序即原先逐条匹配的优先级
+_HEADING_PATTERN = re.compile(
+    r'^(?:'
+    r'(?P<md_marks>#+)\s+(?P<md>.+)'                     # Markdown标题
+    r'|[一二三四五六七八九十]+、\s*(?P<chinese>.+)'         # 中文数字标题（一、二、三）
+    r'|（[一二三四五六七八九十]+）\s*(?P<bracket>.+)'       # 中文括号标题（（一）（二））
+    r'|(?P<digit_no>[0-9]+)\.\s*(?P<digit>.+)'            # 阿拉伯数字标题（1. 2.）
+    r'|\([0-9]+\)\s*(?P<paren_digit>.+)'                  # 带括号的数字标题（(1) (2)）
+    r'|[0-9]+\.[0-9]+\s*(?P<multi_digit>.+)'              # 多级数字标题（1.1 1.2）
+    r')$'
+)
+
+# 句末标点，出现在行尾说明是正文
+_SENTENCE_ENDINGS = frozenset('。，；：！？')
+
+
+class HeadingClassifier:
+    """单次匹配的标题分类器
+    
+    一行文本只做一次正则匹配，由命中的命名分组决定标题级别；
+    精确标题表通过哈希查找，优先于规则匹配。
+    """
+    
+    def __init__(self, exact_titles: Optional[Dict[str, int]] = None):
+        self.exact_titles = dict(exact_titles or {})
+        self._level_by_group = {
+            'md': lambda m: len(m.group('md_marks')),
+            'chinese': lambda m: 1,
+            'bracket': lambda m: 2,
+            'digit': lambda m: 3 if int(m.group('digit_no')) > 5 else 2,
+            'paren_digit': lambda m: 3,
+            'multi_digit': lambda m: 3,
+        }
+    
+    def classify(self, line: str, next_line: str = '') -> Optional[Dict]:
+        """判断一行（已strip）是否为标题，next_line为下一行（已strip）"""
+        # 跳过过长的行（可能是正文）
+        if len(line) > 100:
+            return None
+        
+        level = self.exact_titles.get(line)
+        if level is not None:
+            return {'text': line, 'level': level}
+        
+        match = _HEADING_PATTERN.match(line)
+        if match:
+            group = match.lastgroup
+            return {'text': match.group(group).strip(), 'level': self._level_by_group[group](match)}
+        
+        # 跳过明显的正文内容
+        if line[-1] in _SENTENCE_ENDINGS:
+            return None
+        
+        # 对于短文本，检查下一行是否是正文
+        if len(line) < 50 and not line.isdigit():
+            if len(next_line) > 20:
+                return {'text': line, 'level': guess_level(line)}
+        
+        return None
+
+
+def guess_level(text: str) -> int:
+    """根据文本内容猜测标题级别"""
+    length = len(text)
+    if length <= 10:
+        return 1
+    elif length <= 20:
+        return 2
+    elif length <= 30:
+        return 3
+    else:
+        return 4
+
+
+# langextract调用的默认时间预算（秒）
+DEFAULT_LLM_BUDGET = 30.0
+
+# 不一致片段超过该数量时不再逐段重新询问，直接采用整份LLM结果
+DEFAULT_MAX_REQUERY_SPANS = 10
+
+# 片段后方的锚点找不到时，重新询问窗口最多向后延伸的行数，避免把文档余下部分整体发给LLM
+_MAX_REQUERY_LINES = 200
+
+# 协调结果的磁盘缓存目录，命令行进程退出后后台到达的LLM结果仍可供下次运行命中
+DEFAULT_RESOLVED_CACHE_DIR = ".universal_extractor_cache"
+
+# 命令行输出结果后，继续等待超时LLM结果写入缓存的默认秒数
+DEFAULT_LATE_WAIT = 60.0
+
+
+def _run_in_background(fn: Callable, *args) -> Future:
+    """在守护线程中执行fn并返回Future，超时放弃等待时不会阻塞进程退出"""
+    future = Future()
+    
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=runner, daemon=True).start()
+    return future
+
+
 class UniversalExtractor:
-    def __init__(self):
+    def __init__(self, llm_budget: Optional[float] = DEFAULT_LLM_BUDGET,
+                 max_requery_spans: int = DEFAULT_MAX_REQUERY_SPANS,
+                 cache_dir: Optional[str] = None):
+        """llm_budget为等待langextract的秒数，None表示一直等待；cache_dir为None时只在进程内缓存"""
         self.rules = self._load_extraction_rules()
+        self.classifier = HeadingClassifier()
+        self.llm_budget = llm_budget
+        self.max_requery_spans = max_requery_spans
+        # 内容SHA256 -> 协调后的标题列表；超时的LLM结果在后台写入，供下次直接命中
+        self._resolved_cache: Dict[str, List[Dict]] = {}
+        self._disk_cache = StageCache(cache_dir) if cache_dir else None
+        # 尚未结束的后台协调任务，短命进程退出前可通过wait_for_late_results等待它们写入缓存
+        self._pending: List[Future] = []
+        self._pending_lock = threading.Lock()
         if LANGEXTRACT_AVAILABLE:
             load_dotenv()
     
@@ -72,75 +200,41 @@ class UniversalExtractor:
         lines = content.split('\n')
         
         # 先跳过目录部分
-        content_start = 0
-        for i, line in enumerate(lines):
-            if "目录" in line and len(line.strip()) < 10:
-                content_start = i + 1
-                break
+        content_start = self._content_start(lines)
+        
+        # 每行只strip一次，判断正文时直接复用下一行的结果
+        stripped = [line.strip() for line in lines]
+        stripped.append('')
+        classify = self.classifier.classify
         
         for i in range(content_start, len(lines)):
-            line = lines[i].strip()
+            line = stripped[i]
             if not line:
                 continue
             
             # 检测各种格式的标题
-            heading_info = self._detect_heading(line, lines, i)
+            heading_info = classify(line, stripped[i + 1])
             if heading_info:
                 headings.append(heading_info)
         
         return self._refine_headings(headings)
     
+    def extract_outline(self, content: str) -> Outline:
+        """用规则提取标题并构建带原文行号的大纲"""
+        headings = self.extract_with_rules(content)
+        return Outline.from_headings(headings, self._locate_headings(headings, content.split('\n')))
+    
+    def _content_start(self, lines: List[str]) -> int:
+        """返回目录之后正文开始的行号"""
+        for i, line in enumerate(lines):
+            if "目录" in line and len(line.strip()) < 10:
+                return i + 1
+        return 0
+    
     def _detect_heading(self, line: str, lines: List[str], index: int) -> Optional[Dict]:
         """检测单行是否为标题"""
-        # 跳过过长的行（可能是正文）
-        if len(line) > 100:
-            return None
-        
-        # Markdown标题
-        md_match = re.match(r'^(#+)\s+(.+)$', line)
-        if md_match:
-            level = len(md_match.group(1))
-            return {'text': md_match.group(2).strip(), 'level': level}
-        
-        # 中文数字标题（一、二、三）
-        chinese_match = re.match(r'^([一二三四五六七八九十]+)、\s*(.+)$', line)
-        if chinese_match:
-            return {'text': chinese_match.group(2).strip(), 'level': 1}
-        
-        # 中文括号标题（（一）（二））
-        bracket_match = re.match(r'^（([一二三四五六七八九十]+)）\s*(.+)$', line)
-        if bracket_match:
-            return {'text': bracket_match.group(2).strip(), 'level': 2}
-        
-        # 阿拉伯数字标题（1. 2.）
-        digit_match = re.match(r'^([0-9]+)\.\s*(.+)$', line)
-        if digit_match:
-            level = 3 if int(digit_match.group(1)) > 5 else 2
-            return {'text': digit_match.group(2).strip(), 'level': level}
-        
-        # 带括号的数字标题（(1) (2)）
-        paren_digit_match = re.match(r'^\(([0-9]+)\)\s*(.+)$', line)
-        if paren_digit_match:
-            return {'text': paren_digit_match.group(2).strip(), 'level': 3}
-        
-        # 多级数字标题（1.1 1.2）
-        multi_digit_match = re.match(r'^([0-9]+)\.([0-9]+)\s*(.+)$', line)
-        if multi_digit_match:
-            return {'text': multi_digit_match.group(3).strip(), 'level': 3}
-        
-        # 跳过明显的正文内容
-        if re.search(r'[。，；：！？]$', line):
-            return None
-        
-        # 对于短文本，检查是否是标题
-        if len(line) < 50 and not line.isdigit():
-            # 检查下一行是否是正文
-            if index + 1 < len(lines):
-                next_line = lines[index + 1].strip()
-                if next_line and len(next_line) > 20:
-                    return {'text': line, 'level': self._guess_level(line)}
-        
-        return None
+        next_line = lines[index + 1].strip() if index + 1 < len(lines) else ''
+        return self.classifier.classify(line, next_line)
     
     def _looks_like_heading(self, text: str) -> bool:
         """判断文本是否看起来像标题"""
@@ -154,15 +248,7 @@ class UniversalExtractor:
     
     def _guess_level(self, text: str) -> int:
         """根据文本内容猜测标题级别"""
-        length = len(text)
-        if length <= 10:
-            return 1
-        elif length <= 20:
-            return 2
-        elif length <= 30:
-            return 3
-        else:
-            return 4
+        return guess_level(text)
     
     def _refine_headings(self, headings: List[Dict]) -> List[Dict]:
         """精炼标题列表，去除重复和调整层级"""
@@ -278,24 +364,247 @@ class UniversalExtractor:
             print(f"读取文件失败: {e}")
             return []
         
-        # 使用两种方法提取
-        langextract_result = self.extract_with_langextract(content)
+        key = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        cached = self._cached_result(key)
+        if cached is not None:
+            print("✓ 命中已协调的缓存结果")
+            return cached
+        
+        # 两种方法并发执行：LLM在后台线程，规则在当前线程
+        deadline = None if self.llm_budget is None else time.monotonic() + self.llm_budget
+        llm_future = _run_in_background(self.extract_with_langextract, content)
         rule_result = self.extract_with_rules(content)
         
-        # 验证结果
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            langextract_result = llm_future.result(timeout=timeout)
+        except FutureTimeoutError:
+            print(f"⚠ langextract未在{self.llm_budget}秒内返回，先使用规则结果")
+            self._track_pending(
+                _run_in_background(self._reconcile_late_result, key, llm_future, rule_result, content)
+            )
+            return rule_result
+        
+        # 片段重新询问与主请求共用同一时间预算，未按时返回的片段先沿用LLM结果，完整结果在后台写入缓存
+        resolved, late = self._reconcile(
+            langextract_result, rule_result, content, deadline,
+            on_late=lambda merged: self._store_result(key, langextract_result, merged)
+        )
+        if late is None:
+            self._store_result(key, langextract_result, resolved)
+        else:
+            self._track_pending(late)
+        return resolved
+    
+    def _cached_result(self, key: str) -> Optional[List[Dict]]:
+        cached = self._resolved_cache.get(key)
+        if cached is None and self._disk_cache is not None:
+            entry = self._disk_cache.get(key)
+            if entry is not None:
+                cached = self._resolved_cache[key] = entry["headings"]
+        return cached
+    
+    def _store_result(self, key: str, langextract_result: List[Dict], resolved: List[Dict]) -> None:
+        """只缓存LLM给出结果且协调成功的标题；LLM失败或返回空时下次仍重新询问"""
+        if not langextract_result or not resolved:
+            return
+        self._resolved_cache[key] = resolved
+        if self._disk_cache is not None:
+            self._disk_cache.put(key, {"headings": resolved})
+    
+    def _track_pending(self, future: Future) -> None:
+        with self._pending_lock:
+            self._pending.append(future)
+        future.add_done_callback(self._forget_pending)
+    
+    def _forget_pending(self, future: Future) -> None:
+        with self._pending_lock:
+            if future in self._pending:
+                self._pending.remove(future)
+    
+    @property
+    def has_pending_results(self) -> bool:
+        with self._pending_lock:
+            return bool(self._pending)
+    
+    def wait_for_late_results(self, timeout: Optional[float] = None) -> int:
+        """等待超时后仍在进行的LLM调用协调并写入缓存，返回到期时仍未结束的任务数"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except FutureTimeoutError:
+                pass
+            except Exception as e:
+                print(f"后台协调失败: {e}")
+        with self._pending_lock:
+            return len(self._pending)
+    
+    def reconcile(self, langextract_result: List[Dict], rule_result: List[Dict],
+                  content: Optional[str] = None) -> List[Dict]:
+        """校验并协调两种方法的结果，提供原文时只对不一致的片段重新询问"""
+        return self._reconcile(langextract_result, rule_result, content)[0]
+    
+    def _reconcile(self, langextract_result: List[Dict], rule_result: List[Dict],
+                   content: Optional[str] = None, deadline: Optional[float] = None,
+                   on_late: Optional[Callable[[List[Dict]], None]] = None) -> Tuple[List[Dict], Optional[Future]]:
+        """同reconcile；deadline到期时仍未返回的片段沿用LLM结果，同时返回在后台完成完整合并的Future"""
         is_consistent = self.validate_results(langextract_result, rule_result)
         
         if is_consistent:
             print("✓ 两种方法结果一致，使用langextract结果")
-            return langextract_result
+            return langextract_result, None
+        
+        if content is not None and langextract_result and rule_result:
+            merged = self._merge_by_spans(langextract_result, rule_result, content, deadline, on_late)
+            if merged is not None:
+                return merged
+        
+        print("⚠ 两种方法结果不一致，进行冲突解决")
+        resolved = self.resolve_conflict(langextract_result, rule_result)
+        if resolved:
+            print("✓ 冲突解决成功")
         else:
-            print("⚠ 两种方法结果不一致，进行冲突解决")
-            resolved = self.resolve_conflict(langextract_result, rule_result)
-            if resolved:
-                print("✓ 冲突解决成功")
-            else:
-                print("✗ 冲突解决失败，返回空结果")
-            return resolved
+            print("✗ 冲突解决失败，返回空结果")
+        return resolved, None
+    
+    def _reconcile_late_result(self, key: str, future: Future, rule_result: List[Dict],
+                               content: str) -> None:
+        """在后台等待超时的LLM结果，协调后写入缓存"""
+        try:
+            langextract_result = future.result()
+        except Exception:
+            return
+        self._store_result(key, langextract_result,
+                           self.reconcile(langextract_result, rule_result, content))
+    
+    def find_disagreements(self, langextract_result: List[Dict],
+                           rule_result: List[Dict]) -> List[Tuple[int, int, int, int]]:
+        """按标题文本对齐两种结果，返回不一致片段(i1, i2, j1, j2)
+        
+        i为规则结果下标，j为langextract结果下标；文本相同但级别相差超过1的标题也算作不一致。
+        """
+        matcher = difflib.SequenceMatcher(
+            None,
+            [h['text'] for h in rule_result],
+            [h['text'] for h in langextract_result],
+            autojunk=False
+        )
+        spans = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != 'equal':
+                spans.append((i1, i2, j1, j2))
+                continue
+            for offset in range(i2 - i1):
+                if abs(rule_result[i1 + offset]['level'] - langextract_result[j1 + offset]['level']) > 1:
+                    spans.append((i1 + offset, i1 + offset + 1, j1 + offset, j1 + offset + 1))
+        return spans
+    
+    def merge_by_spans(self, langextract_result: List[Dict], rule_result: List[Dict],
+                       content: str) -> Optional[List[Dict]]:
+        """一致的部分直接合并，只就不一致的片段用小窗口重新询问模型
+        
+        不一致片段过多时返回None，由调用方退回整体冲突解决。
+        """
+        merged = self._merge_by_spans(langextract_result, rule_result, content)
+        return None if merged is None else merged[0]
+    
+    def _merge_by_spans(self, langextract_result: List[Dict], rule_result: List[Dict], content: str,
+                        deadline: Optional[float] = None,
+                        on_late: Optional[Callable[[List[Dict]], None]] = None
+                        ) -> Optional[Tuple[List[Dict], Optional[Future]]]:
+        """各片段并发重新询问，deadline到期时未返回的片段沿用LLM结果
+        
+        有片段超时时另返回一个后台Future：等这些片段返回后组装完整结果并交给on_late。
+        """
+        spans = self.find_disagreements(langextract_result, rule_result)
+        if len(spans) > self.max_requery_spans:
+            print(f"⚠ 两种方法有{len(spans)}处不一致，超过{self.max_requery_spans}处，不逐段重新询问")
+            return None
+        
+        print(f"⚠ 两种方法有{len(spans)}处不一致，仅对这些片段重新询问")
+        lines = content.split('\n')
+        positions = self._locate_headings(rule_result, lines)
+        requeries = [
+            _run_in_background(self._requery_span, lines, positions, rule_result, i1, i2,
+                               langextract_result[j1:j2])
+            for i1, i2, j1, j2 in spans
+        ]
+        
+        def assemble(timeout: Optional[float]) -> Tuple[List[Dict], int]:
+            merged = []
+            cursor = 0
+            missed = 0
+            for (i1, i2, j1, j2), future in zip(spans, requeries):
+                merged.extend(langextract_result[cursor:j1])
+                remaining = None if timeout is None else max(0.0, timeout - time.monotonic())
+                try:
+                    merged.extend(future.result(timeout=remaining))
+                except FutureTimeoutError:
+                    missed += 1
+                    merged.extend(langextract_result[j1:j2])
+                except Exception as e:
+                    print(f"片段重新询问失败: {e}")
+                    merged.extend(langextract_result[j1:j2])
+                cursor = j2
+            merged.extend(langextract_result[cursor:])
+            return merged, missed
+        
+        merged, missed = assemble(deadline)
+        if not missed:
+            print("✓ 片段协调完成")
+            return merged, None
+        
+        print(f"⚠ {missed}个片段未在时间预算内返回，先沿用LLM结果")
+        
+        def finish() -> List[Dict]:
+            complete = assemble(None)[0]
+            if on_late is not None:
+                on_late(complete)
+            return complete
+        
+        return merged, _run_in_background(finish)
+    
+    def _locate_headings(self, headings: List[Dict], lines: List[str]) -> List[Optional[int]]:
+        """按顺序找到每个标题在原文中的行号，找不到时为None"""
+        positions = []
+        cursor = self._content_start(lines)
+        for heading in headings:
+            position = None
+            for i in range(cursor, len(lines)):
+                if heading['text'] in lines[i]:
+                    position = i
+                    cursor = i + 1
+                    break
+            positions.append(position)
+        return positions
+    
+    def _requery_span(self, lines: List[str], positions: List[Optional[int]],
+                      rule_result: List[Dict], i1: int, i2: int,
+                      llm_span: List[Dict]) -> List[Dict]:
+        """以片段前后一致的标题为锚点截取原文窗口，只对该窗口重新提取"""
+        start = positions[i1 - 1] if i1 > 0 else self._content_start(lines)
+        if start is None:
+            return llm_span
+        if i2 < len(positions) and positions[i2] is not None:
+            end = positions[i2] + 1
+        else:
+            end = min(len(lines), start + _MAX_REQUERY_LINES)
+        
+        anchors = set()
+        if i1 > 0:
+            anchors.add(rule_result[i1 - 1]['text'])
+        if i2 < len(rule_result):
+            anchors.add(rule_result[i2]['text'])
+        
+        span_result = self.extract_with_langextract('\n'.join(lines[start:end]))
+        if not span_result:
+            # 重新询问失败时沿用原先偏向LLM的策略
+            return llm_span
+        return [h for h in span_result if h['text'] not in anchors]
     
     def generate_markdown(self, headings: List[Dict]) -> str:
         """生成Markdown格式的输出"""
@@ -310,22 +619,64 @@ class UniversalExtractor:
         
         return "\n".join(output)
 
-def main():
-    parser = argparse.ArgumentParser(description='通用文档标题提取器')
-    parser.add_argument('file_path', help='要处理的Markdown文件路径')
-    parser.add_argument('-o', '--output', help='输出文件路径（可选）')
-    parser.add_argument('-f', '--format', choices=['json', 'md'], default='md', 
-                       help='输出格式：json或md（默认md）')
+# 语料模式下每个工作进程持有的规则提取器，由_init_corpus_worker创建一次
+_corpus_extractor: Optional[UniversalExtractor] = None
+
+
+def _init_corpus_worker() -> None:
+    """工作进程初始化：只构建一次规则提取器（正则在模块导入时已预编译）"""
+    global _corpus_extractor
+    _corpus_extractor = UniversalExtractor(llm_budget=0)
+
+
+def _extract_corpus_file(file_path: str) -> Dict:
+    """工作进程内只跑规则引擎，返回一条JSONL记录"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        return {'file': file_path, 'error': str(e), 'lines': 0, 'headings': []}
     
-    args = parser.parse_args()
+    lines = content.count('\n') + 1
+    try:
+        headings = _corpus_extractor.extract_with_rules(content)
+    except Exception as e:
+        # 单个文件出错只记一条错误记录，不中断整个进程池
+        return {'file': file_path, 'error': str(e), 'lines': lines, 'headings': []}
     
-    if not os.path.exists(args.file_path):
-        print(f"文件不存在: {args.file_path}")
-        return
+    return {
+        'file': file_path,
+        'lines': lines,
+        'headings': headings
+    }
+
+
+def extract_corpus(corpus_dir: str, output_path: str, jobs: Optional[int] = None,
+                   chunksize: int = 16) -> Dict:
+    """用进程池对目录下所有Markdown文件做规则提取，结果逐条写入JSONL"""
+    files = sorted(str(p) for p in Path(corpus_dir).rglob('*.md'))
+    jobs = jobs or os.cpu_count() or 1
+    stats = {'files': 0, 'errors': 0, 'lines': 0, 'headings': 0}
     
-    extractor = UniversalExtractor()
-    headings = extractor.extract_headings(args.file_path)
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=_init_corpus_worker) as pool, \
+            open(output_path, 'w', encoding='utf-8') as out:
+        for record in pool.imap_unordered(_extract_corpus_file, files, chunksize=chunksize):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            stats['files'] += 1
+            stats['errors'] += 'error' in record
+            stats['lines'] += record['lines']
+            stats['headings'] += len(record['headings'])
+    elapsed = time.perf_counter() - start
     
+    stats['jobs'] = jobs
+    stats['seconds'] = elapsed
+    stats['lines_per_sec'] = stats['lines'] / elapsed if elapsed else 0.0
+    stats['lines_per_sec_per_core'] = stats['lines_per_sec'] / jobs
+    return stats
+
+
+def write_headings(extractor: UniversalExtractor, headings: List[Dict], args: argparse.Namespace) -> None:
     if not headings:
         print("未提取到任何标题")
         return
@@ -342,5 +693,60 @@ def main():
     else:
         print(output_content)
 
+
+def main():
+    parser = argparse.ArgumentParser(description='通用文档标题提取器')
+    parser.add_argument('file_path', help='要处理的Markdown文件路径；配合--corpus时为语料目录')
+    parser.add_argument('-o', '--output', help='输出文件路径（可选；语料模式默认headings.jsonl）')
+    parser.add_argument('-f', '--format', choices=['json', 'md'], default='md', 
+                       help='输出格式：json或md（默认md）')
+    parser.add_argument('--max-requery-spans', type=int, default=DEFAULT_MAX_REQUERY_SPANS,
+                       help=f'逐段重新询问的最大不一致片段数（默认{DEFAULT_MAX_REQUERY_SPANS}）')
+    parser.add_argument('--llm-budget', type=float, default=DEFAULT_LLM_BUDGET,
+                       help=f'等待langextract的最长秒数，超时先返回规则结果（默认{DEFAULT_LLM_BUDGET:g}）')
+    parser.add_argument('--cache-dir', default=DEFAULT_RESOLVED_CACHE_DIR,
+                       help=f'协调结果的缓存目录（默认{DEFAULT_RESOLVED_CACHE_DIR}）')
+    parser.add_argument('--no-cache', action='store_true', help='禁用协调结果的磁盘缓存')
+    parser.add_argument('--late-wait', type=float, default=DEFAULT_LATE_WAIT,
+                       help=f'输出结果后继续等待超时LLM结果写入缓存的秒数，0表示不等待（默认{DEFAULT_LATE_WAIT:g}）')
+    parser.add_argument('--corpus', action='store_true',
+                       help='语料模式：用多进程对目录下所有.md文件做纯规则提取，输出JSONL')
+    parser.add_argument('-j', '--jobs', type=int, help='语料模式的进程数（默认CPU核数）')
+    parser.add_argument('--chunksize', type=int, default=16, help='语料模式每次分给进程的文件数（默认16）')
+    
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.file_path):
+        print(f"文件不存在: {args.file_path}")
+        return
+    
+    if args.corpus:
+        if not os.path.isdir(args.file_path):
+            print(f"语料模式需要目录: {args.file_path}")
+            sys.exit(1)
+        output_path = args.output or 'headings.jsonl'
+        stats = extract_corpus(args.file_path, output_path, args.jobs, args.chunksize)
+        print(f"处理文件 {stats['files']} 个（失败 {stats['errors']}），"
+              f"共 {stats['lines']:,} 行，提取标题 {stats['headings']:,} 个")
+        print(f"耗时 {stats['seconds']:.2f}s，{stats['lines_per_sec']:,.0f} 行/秒，"
+              f"每核 {stats['lines_per_sec_per_core']:,.0f} 行/秒（{stats['jobs']} 进程）")
+        print(f"结果已保存到: {output_path}")
+        return
+    
+    extractor = UniversalExtractor(llm_budget=args.llm_budget,
+                                   max_requery_spans=args.max_requery_spans,
+                                   cache_dir=None if args.no_cache else args.cache_dir)
+    headings = extractor.extract_headings(args.file_path)
+    
+    try:
+        write_headings(extractor, headings, args)
+    finally:
+        # 后台线程是守护线程，进程退出即被终止；有磁盘缓存时等它协调完，下次运行即可直接命中
+        if not args.no_cache and args.late_wait > 0 and extractor.has_pending_results:
+            print(f"等待后台LLM结果写入缓存（最多{args.late_wait:g}秒）...")
+            if extractor.wait_for_late_results(args.late_wait):
+                print("⚠ 后台LLM结果未在等待时间内返回，未写入缓存")
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file